@@ -0,0 +1,112 @@
+"""Latency and throughput of allocating on a hot SKU with and without its actor.
+
+Adds one Product with a large batch and registered order items to a temporary SQLite
+file, then allocates all order items from several threads, once with a UnitOfWork per
+command and once through the actor of the SKU. Reports the allocations per second,
+the median and 99th percentile latency of a command, the failed commands, and the
+allocated quantity the batch ends up with.
+
+Usage: python benchmarks/bench_actors.py [--threads 8] [--commands 500]
+       [--batch-size 64] [--interval-ms 5]
+"""
+import argparse
+import os
+import tempfile
+import threading
+import time
+
+import sqlalchemy
+
+from allocation import messagebus, services
+from allocation.actors import ActorSystem
+from allocation.core import commands, domain
+from allocation.interfaces.database import orm
+from allocation.interfaces.database.db import SessionFactory
+from allocation.unit_of_work import ActorUnitOfWork, UnitOfWork
+
+
+def add_product(factory, order_items: int):
+    sku = domain.create_sku("SKU")
+    items = [domain.create_order_item(sku, 1) for _ in range(order_items)]
+    product = domain.create_product(
+        sku, {domain.create_batch(sku, order_items * 2)}, set(items)
+    )
+    sku_id, order_item_ids = sku.uuid, [o.uuid for o in items]
+    with UnitOfWork(factory) as uow:
+        uow.products.add(product)
+    return sku_id, order_item_ids
+
+
+def allocated_quantity(factory, sku_id) -> int:
+    with UnitOfWork(factory) as uow:
+        (batch,) = uow.products.get(sku_id).batches
+        return batch.allocated_quantity
+
+
+def run(allocate, cmds, threads: int):
+    latencies, failures, lock = [], [], threading.Lock()
+    chunks = [cmds[i::threads] for i in range(threads)]
+
+    def worker(chunk):
+        for cmd in chunk:
+            start = time.perf_counter()
+            try:
+                allocate(cmd)
+            except Exception as e:
+                with lock:
+                    failures.append(e)
+            with lock:
+                latencies.append(time.perf_counter() - start)
+
+    workers = [threading.Thread(target=worker, args=(c,)) for c in chunks]
+    start = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return time.perf_counter() - start, sorted(latencies), len(failures)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--commands", type=int, default=500)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--interval-ms", type=float, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        engine = sqlalchemy.create_engine(
+            f"sqlite:///{os.path.join(directory, 'bench.db')}"
+        )
+        orm.mapper_registry.metadata.create_all(engine)
+        factory = SessionFactory(engine)
+        actors = ActorSystem(
+            messagebus.ACTOR_HANDLERS,
+            lambda event: None,
+            hot_rate=0,
+            uow_factory=lambda: ActorUnitOfWork(factory),
+            max_batch=args.batch_size,
+            max_delay=args.interval_ms / 1000,
+        )
+        modes = {
+            "unit of work": lambda cmd: services.allocate(cmd, UnitOfWork(factory)),
+            "actor": lambda cmd: actors.submit(cmd).result(),
+        }
+        for name, allocate in modes.items():
+            sku_id, order_item_ids = add_product(factory, args.commands)
+            cmds = [commands.Allocate(sku_id, o) for o in order_item_ids]
+            seconds, latencies, failures = run(allocate, cmds, args.threads)
+            p50 = latencies[len(latencies) // 2] * 1e3
+            p99 = latencies[int(len(latencies) * 0.99)] * 1e3
+            print(
+                f"{name:<14} {len(cmds) / seconds:>8.0f} allocations/s "
+                f"p50 {p50:>7.2f} ms p99 {p99:>8.2f} ms {failures:>4} failed "
+                f"allocated {allocated_quantity(factory, sku_id):>5}/{len(cmds)}"
+            )
+        actors.stop()
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""Throughput of concurrent allocations through the aggregate and the fast path.
+
+Every thread allocates its share of registered order items with services.allocate or
+services.allocate_fast against a temporary SQLite file. After each run the batches are
+checked for overselling and for allocated quantities not matching their allocations.
+
+Usage: python benchmarks/bench_allocate.py [--threads 1 4 8] [--order-items 400]
+"""
+import argparse
+import os
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+
+import sqlalchemy
+from sqlalchemy import func, select
+
+from allocation import services
+from allocation.core import commands, domain
+from allocation.interfaces.database import orm
+from allocation.interfaces.database.db import SessionFactory
+from allocation.unit_of_work import UnitOfWork
+
+
+def populate(factory, products: int, order_items: int):
+    allocations = []
+    with UnitOfWork(factory, cache=None) as uow:
+        for i in range(products):
+            sku = domain.create_sku(f"SKU-{i}")
+            batches = {
+                domain.create_batch(sku, 1000, date.today() + timedelta(days=d))
+                for d in range(5)
+            }
+            items = {
+                domain.create_order_item(sku, quantity=1 + n % 5)
+                for n in range(order_items // products)
+            }
+            uow.products.add(domain.create_product(sku, batches, items))
+            allocations.extend(commands.Allocate(sku.uuid, oi.uuid) for oi in items)
+    return allocations
+
+
+def run(handler, factory, allocations, threads: int):
+    errors = []
+
+    def work(cmds):
+        for cmd in cmds:
+            try:
+                handler(cmd, UnitOfWork(factory, cache=None))
+            except Exception as e:  # pylint:disable=broad-except
+                errors.append(e)
+
+    workers = [
+        threading.Thread(target=work, args=(allocations[i::threads],))
+        for i in range(threads)
+    ]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return time.perf_counter() - start, errors
+
+
+def check(engine) -> int:
+    """Returns the number of batches whose allocated quantity is wrong."""
+    batches, association = orm.batches, orm.order_items_batches_association
+    allocated = (
+        select(
+            association.c.batches_id, func.sum(orm.order_items.c.quantity).label("q")
+        )
+        .join_from(
+            association,
+            orm.order_items,
+            association.c.order_item_id == orm.order_items.c.uuid,
+        )
+        .group_by(association.c.batches_id)
+        .subquery()
+    )
+    stmt = (
+        select(func.count())
+        .select_from(
+            batches.outerjoin(allocated, allocated.c.batches_id == batches.c.uuid)
+        )
+        .where(
+            (batches.c.allocated_quantity > batches.c.quantity)
+            | (batches.c.allocated_quantity != func.coalesce(allocated.c.q, 0))
+        )
+    )
+    with engine.connect() as connection:
+        return connection.execute(stmt).scalar()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--products", type=int, default=20)
+    parser.add_argument("--order-items", type=int, default=400)
+    args = parser.parse_args()
+
+    handlers = (("aggregate", services.allocate), ("fast path", services.allocate_fast))
+    for threads in args.threads:
+        for name, handler in handlers:
+            with tempfile.TemporaryDirectory() as directory:
+                engine = sqlalchemy.create_engine(
+                    f"sqlite:///{os.path.join(directory, 'bench.db')}",
+                    connect_args={"timeout": 30, "check_same_thread": False},
+                )
+                orm.mapper_registry.metadata.create_all(engine)
+                factory = SessionFactory(engine)
+                allocations = populate(factory, args.products, args.order_items)
+                seconds, errors = run(handler, factory, allocations, threads)
+                print(
+                    f"{name:<10} {threads:>3} threads "
+                    f"{len(allocations) / seconds:>10.0f} allocations/s "
+                    f"{len(errors):>5} errors {check(engine):>5} inconsistent batches"
+                )
+                engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""Throughput of POST /batches against one POST /batch per row.
+
+The single row client follows the redirect to the created batch, like a client of the
+previous API had to. Both run in process against the in-memory testing database.
+
+Usage: python benchmarks/bench_bulk.py [--rows 1000] [--skus 50]
+"""
+import argparse
+import os
+import time
+from datetime import date
+
+os.environ.setdefault("ENV", "testing")
+
+from allocation.core import domain  # noqa: E402
+from allocation.entrypoints.app import create_app  # noqa: E402
+from allocation.interfaces.database import db, orm  # noqa: E402
+from allocation.unit_of_work import UnitOfWork  # noqa: E402
+
+
+def create_products(count: int):
+    with UnitOfWork() as uow:
+        products = [
+            domain.create_product(domain.create_sku(f"SKU-{i}")) for i in range(count)
+        ]
+        uow.products.add_all(products)
+        return [str(p.sku.uuid) for p in products]
+
+
+def report(name: str, rows: int, func) -> float:
+    start = time.perf_counter()
+    func()
+    seconds = time.perf_counter() - start
+    print(f"{name:<40} {seconds:>8.2f} s {rows / seconds:>12.0f} rows/s")
+    return seconds
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--skus", type=int, default=50)
+    args = parser.parse_args()
+
+    orm.mapper_registry.metadata.create_all(db.engine)
+    client = create_app().test_client()
+    eta = str(date.today())
+
+    def rows():
+        sku_ids = create_products(args.skus)
+        return [
+            {"sku_id": sku_ids[i % args.skus], "eta": eta, "quantity": 20}
+            for i in range(args.rows)
+        ]
+
+    single_rows, bulk_rows = rows(), rows()
+
+    def single():
+        for row in single_rows:
+            client.post("/batch", json=row, follow_redirects=True)
+
+    def bulk():
+        client.post("/batches", json=bulk_rows)
+
+    old = report(f"POST /batch x{args.rows}", args.rows, single)
+    new = report(f"POST /batches ({args.rows} rows)", args.rows, bulk)
+    print(f"{'speedup':<40} {old / new:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
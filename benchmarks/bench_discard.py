@@ -0,0 +1,215 @@
+"""Duration and statement count of discarding a Product with many allocations.
+
+Compares Product.discard on the loaded aggregate, which deallocates one order item at a
+time, with the set-based ProductsRepo.discard_product used by services.discard_product.
+Every run discards a fresh Product in a temporary SQLite file, with all of its order
+items allocated over its batches. Statements sent with executemany count once per
+parameter set.
+
+Then times DELETE /product end to end, through the message bus and the handlers of the
+deallocation events, against the in-memory testing database. The handlers run once for
+the single OrderItemsDeallocated event, or once per allocation when it is split into
+OrderItemDeallocated events like before. Events are only published if a Redis server
+is available.
+
+Usage: python benchmarks/bench_discard.py [--order-items 100000] [--batches 100]
+       [--http-order-items 500]
+"""
+import argparse
+import contextlib
+import os
+import tempfile
+import time
+from uuid import uuid4
+
+os.environ.setdefault("ENV", "testing")
+
+import redis  # noqa: E402
+import sqlalchemy  # noqa: E402
+from sqlalchemy import event  # noqa: E402
+
+from allocation import messagebus, services  # noqa: E402
+from allocation.core import commands, events  # noqa: E402
+from allocation.entrypoints.app import create_app  # noqa: E402
+from allocation.interfaces import external_bus  # noqa: E402
+from allocation.interfaces.database import db, orm  # noqa: E402
+from allocation.interfaces.database.db import SessionFactory  # noqa: E402
+from allocation.unit_of_work import UnitOfWork  # noqa: E402
+
+
+def populate(engine, order_items: int, batches: int):
+    sku_id = uuid4()
+    batch_ids = [uuid4() for _ in range(batches)]
+    order_item_ids = [uuid4() for _ in range(order_items)]
+    with engine.begin() as connection:
+        connection.execute(orm.skus.insert(), {"uuid": sku_id, "name": "SKU"})
+        connection.execute(
+            orm.products.insert(), {"_sku_id": sku_id, "version_number": 0}
+        )
+        connection.execute(
+            orm.batches.insert(),
+            [
+                {
+                    "uuid": batch_id,
+                    "_sku_id": sku_id,
+                    "_product_id": sku_id,
+                    "quantity": order_items,
+                    "allocated_quantity": len(order_item_ids[i::batches]),
+                    "discarded": False,
+                }
+                for i, batch_id in enumerate(batch_ids)
+            ],
+        )
+        connection.execute(
+            orm.order_items.insert(),
+            [
+                {
+                    "uuid": order_item_id,
+                    "_sku_id": sku_id,
+                    "_product_id": sku_id,
+                    "quantity": 1,
+                    "discarded": False,
+                }
+                for order_item_id in order_item_ids
+            ],
+        )
+        connection.execute(
+            orm.order_items_batches_association.insert(),
+            [
+                {"order_item_id": order_item_id, "batches_id": batch_ids[i % batches]}
+                for i, order_item_id in enumerate(order_item_ids)
+            ],
+        )
+    return sku_id
+
+
+def discard_aggregate(sku_id, uow) -> int:
+    with uow:
+        product = uow.products.get(sku_id)
+        product.discard()
+        return len(product.events)
+
+
+def discard_set_based(sku_id, uow) -> int:
+    services.discard_product(commands.DiscardProduct(sku_id), uow)
+    return len(uow.products.events)
+
+
+def handle_per_allocation(event: events.OrderItemsDeallocated) -> None:
+    for order_item_id, quantity, batch_id in event.allocations:
+        messagebus.handle_event(
+            events.OrderItemDeallocated(event.sku_id, order_item_id, quantity, batch_id)
+        )
+
+
+def count_statements(engine, statements: list):
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.extend([statement] * (len(parameters) if executemany else 1))
+
+    event.listen(engine, "before_cursor_execute", count)
+    return lambda: event.remove(engine, "before_cursor_execute", count)
+
+
+def redis_available() -> bool:
+    try:
+        return external_bus.redis_client.ping()
+    except redis.RedisError:
+        return False
+
+
+def without_publishing(handlers: list) -> list:
+    return [h for h in handlers if h is not services.publish_message_to_external_bus]
+
+
+def bench_http(order_items: int, batches: int) -> None:
+    orm.mapper_registry.metadata.create_all(db.engine)
+    client = create_app().test_client()
+    single_handlers = messagebus.EVENT_HANDLERS[events.OrderItemDeallocated]
+    bulk_handlers = messagebus.EVENT_HANDLERS[events.OrderItemsDeallocated]
+    if not redis_available():
+        # Without a server, every publish waits for the retries of the connection.
+        print("Redis is unavailable, events are not published.")
+        single_handlers = without_publishing(single_handlers)
+        bulk_handlers = without_publishing(bulk_handlers)
+    bulk_read_model_handlers = messagebus.READ_MODEL_HANDLERS[
+        events.OrderItemsDeallocated
+    ]
+    handle_event = messagebus.handle_event
+    for name, handlers, read_model_handlers in (
+        ("per allocation", [handle_per_allocation], []),
+        ("bulk", bulk_handlers, bulk_read_model_handlers),
+    ):
+        sku_id = populate(db.engine, order_items, batches)
+        handled, statements = [], []
+
+        def counting_handle_event(event, *args):
+            handled.append(event)
+            handle_event(event, *args)
+
+        messagebus.EVENT_HANDLERS[events.OrderItemDeallocated] = single_handlers
+        messagebus.EVENT_HANDLERS[events.OrderItemsDeallocated] = handlers
+        messagebus.READ_MODEL_HANDLERS[
+            events.OrderItemsDeallocated
+        ] = read_model_handlers
+        messagebus.handle_event = counting_handle_event
+        remove = count_statements(db.engine, statements)
+        start = time.perf_counter()
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            response = client.delete("/product", json={"sku_id": str(sku_id)})
+        seconds = time.perf_counter() - start
+        remove()
+        messagebus.handle_event = handle_event
+        deallocations = [
+            e
+            for e in handled
+            if isinstance(
+                e, (events.OrderItemDeallocated, events.OrderItemsDeallocated)
+            )
+        ]
+        print(
+            f"DELETE /product {name:<15} {seconds:>8.3f} s status "
+            f"{response.status_code} {len(statements):>6} statements "
+            f"{len(deallocations):>6} events handled"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--order-items", type=int, default=100_000)
+    parser.add_argument("--batches", type=int, default=100)
+    parser.add_argument("--http-order-items", type=int, default=500)
+    args = parser.parse_args()
+
+    for name, discard in (
+        ("aggregate", discard_aggregate),
+        ("set-based", discard_set_based),
+    ):
+        with tempfile.TemporaryDirectory() as directory:
+            engine = sqlalchemy.create_engine(
+                f"sqlite:///{os.path.join(directory, 'bench.db')}"
+            )
+            orm.mapper_registry.metadata.create_all(engine)
+            sku_id = populate(engine, args.order_items, args.batches)
+            statements = []
+            count_statements(engine, statements)
+
+            start = time.perf_counter()
+            events = discard(sku_id, UnitOfWork(SessionFactory(engine), cache=None))
+            seconds = time.perf_counter() - start
+            with engine.connect() as connection:
+                remaining = connection.execute(
+                    sqlalchemy.select(sqlalchemy.func.count()).select_from(
+                        orm.order_items_batches_association
+                    )
+                ).scalar()
+            print(
+                f"{name:<10} {seconds:>8.2f} s {len(statements):>6} statements "
+                f"{events:>8} events {remaining:>6} allocations left"
+            )
+            engine.dispose()
+
+    bench_http(args.http_order_items, min(args.batches, args.http_order_items))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""Latency and writes of allocating with the relational and the event-sourced store.
+
+Populates a temporary SQLite file with one Product with its batches and order items,
+once through ProductsRepo and once through EventSourcedRepo. Reports the milliseconds
+per unit of work that loads the Product, allocates a new order item and commits, and
+the statements and rows it writes. The event-sourced store is measured with its
+default snapshot interval, so most loads replay a tail of events.
+
+Usage: python benchmarks/bench_event_store.py [--batches 50] [--order-items 200]
+       [--calls 100]
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import sqlalchemy
+from sqlalchemy import event
+
+from allocation.core import domain
+from allocation.interfaces.database import orm
+from allocation.interfaces.database.db import SessionFactory
+from allocation.repositories import EventSourcedRepo, ProductsRepo
+
+
+def make_product(batches: int, order_items: int) -> domain.Product:
+    sku = domain.create_sku("SKU")
+    product = domain.create_product(
+        sku,
+        {domain.create_batch(sku, order_items + 1_000_000) for _ in range(batches)},
+        {domain.create_order_item(sku, 1) for _ in range(order_items)},
+    )
+    for order_item in list(product.order_items):
+        product.allocate(order_item)
+    return product
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--batches", type=int, default=50)
+    parser.add_argument("--order-items", type=int, default=200)
+    parser.add_argument("--calls", type=int, default=100)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        engine = sqlalchemy.create_engine(
+            f"sqlite:///{os.path.join(directory, 'bench.db')}"
+        )
+        orm.mapper_registry.metadata.create_all(engine)
+        factory = SessionFactory(engine)
+        writes = []
+
+        def count(conn, cursor, statement, parameters, context, executemany):
+            if not statement.startswith(("SELECT", "BEGIN")):
+                writes.append(len(parameters) if executemany else 1)
+
+        event.listen(engine, "before_cursor_execute", count)
+        for name, repo_class in (
+            ("relational", ProductsRepo),
+            ("events", EventSourcedRepo),
+        ):
+            product = make_product(args.batches, args.order_items)
+            sku_id = product.sku_id
+            with factory() as session:
+                repo_class(session).add(product)
+                session.commit()
+
+            def allocate():
+                with factory() as session:
+                    product = repo_class(session).get(sku_id)
+                    product.allocate(domain.create_order_item(product.sku, 1))
+                    session.commit()
+
+            start = time.perf_counter()
+            for _ in range(args.calls):
+                allocate()
+            seconds = (time.perf_counter() - start) / args.calls
+            writes.clear()
+            allocate()
+            print(
+                f"{name:<12} {seconds * 1e3:>8.2f} ms/allocation "
+                f"{len(writes):>3} write statements {sum(writes):>4} rows"
+            )
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""Throughput and memory of exporting the allocation state and restoring it.
+
+Populates a temporary SQLite file with Products, each with its batches and order
+items allocated to them, then exports it to NDJSON with allocation.entrypoints.exporter
+and restores the export into an empty database with allocation.entrypoints.importer.
+The export runs once more under tracemalloc for its peak memory, for two catalog
+sizes, to show that it does not grow with the catalog. The restore runs in a
+subprocess, so its time includes the start of the interpreter.
+
+Usage: python benchmarks/bench_export.py [--products 20000] [--batches 2]
+       [--order-items 4]
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from uuid import uuid4
+
+import sqlalchemy
+
+from allocation.entrypoints.exporter import export
+from allocation.interfaces.database import orm
+
+
+def populate(engine, products: int, batches: int, order_items: int) -> None:
+    with engine.begin() as connection:
+        for _ in range(products):
+            sku_id = uuid4()
+            batch_ids = [uuid4() for _ in range(batches)]
+            order_item_ids = [uuid4() for _ in range(order_items)]
+            connection.execute(orm.skus.insert(), {"uuid": sku_id, "name": "SKU"})
+            connection.execute(
+                orm.products.insert(), {"_sku_id": sku_id, "version_number": 0}
+            )
+            connection.execute(
+                orm.batches.insert(),
+                [
+                    {
+                        "uuid": batch_id,
+                        "_sku_id": sku_id,
+                        "_product_id": sku_id,
+                        "quantity": order_items,
+                        "allocated_quantity": len(order_item_ids[i::batches]),
+                    }
+                    for i, batch_id in enumerate(batch_ids)
+                ],
+            )
+            connection.execute(
+                orm.order_items.insert(),
+                [
+                    {
+                        "uuid": order_item_id,
+                        "_sku_id": sku_id,
+                        "_product_id": sku_id,
+                        "quantity": 1,
+                    }
+                    for order_item_id in order_item_ids
+                ],
+            )
+            connection.execute(
+                orm.order_items_batches_association.insert(),
+                [
+                    {
+                        "order_item_id": order_item_id,
+                        "batches_id": batch_ids[i % batches],
+                    }
+                    for i, order_item_id in enumerate(order_item_ids)
+                ],
+            )
+
+
+def create_database(path: str):
+    engine = sqlalchemy.create_engine(f"sqlite:///{path}")
+    orm.mapper_registry.metadata.create_all(engine)
+    return engine
+
+
+def run(products: int, batches: int, order_items: int) -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_database(os.path.join(directory, "source.db"))
+        populate(engine, products, batches, order_items)
+        output = os.path.join(directory, "export.ndjson")
+
+        start = time.perf_counter()
+        with open(output, "wb") as file:
+            rows = sum(export(engine, file).values())
+        seconds = time.perf_counter() - start
+        size = os.path.getsize(output) / 2**20
+        report(products, "export", rows, seconds, f"{size:.1f} MiB")
+
+        tracemalloc.start()
+        with open(os.devnull, "wb") as file:
+            export(engine, file)
+        peak = tracemalloc.get_traced_memory()[1] / 2**20
+        tracemalloc.stop()
+        report(products, "export peak memory", rows, None, f"{peak:.1f} MiB")
+
+        target = os.path.join(directory, "target.db")
+        create_database(target).dispose()
+        start = time.perf_counter()
+        subprocess.run(
+            [sys.executable, "-m", "allocation.entrypoints.importer", output],
+            env={
+                **os.environ,
+                "ENV": "production",
+                "SQLALCHEMY_DATABASE_URI": f"sqlite:///{target}",
+            },
+            check=True,
+            capture_output=True,
+        )
+        report(products, "restore", rows, time.perf_counter() - start, "")
+        engine.dispose()
+
+
+def report(products: int, name: str, rows: int, seconds, extra: str) -> None:
+    rate = f"{seconds:>8.2f} s {rows / seconds:>10.0f} rows/s" if seconds else ""
+    print(f"{products:>8} products {name:<20} {rate:<30} {extra}", flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--products", type=int, default=20_000)
+    parser.add_argument("--batches", type=int, default=2)
+    parser.add_argument("--order-items", type=int, default=4)
+    args = parser.parse_args()
+
+    for products in (args.products // 4, args.products):
+        run(products, args.batches, args.order_items)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""Duration of loading a catalog through ProductsRepo.add_all, with and without bulk.
+
+Every run writes fresh Products, each with its batches and order items allocated to
+them, to a temporary SQLite file in a single unit of work.
+
+Usage: python benchmarks/bench_ingest.py [--products 20000] [--batches 2]
+       [--order-items 2] [--chunk-size 5000]
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import sqlalchemy
+
+from allocation.core import domain
+from allocation.interfaces.database import orm
+from allocation.interfaces.database.db import SessionFactory
+from allocation.unit_of_work import UnitOfWork
+
+
+def make_products(products: int, batches: int, order_items: int):
+    catalog = []
+    for i in range(products):
+        sku = domain.create_sku(f"SKU-{i}")
+        product = domain.create_product(
+            sku,
+            {domain.create_batch(sku, 100) for _ in range(batches)},
+            {domain.create_order_item(sku, 1) for _ in range(order_items)},
+        )
+        for order_item in product.order_items:
+            product.allocate(order_item)
+        catalog.append(product)
+    return catalog
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--products", type=int, default=20_000)
+    parser.add_argument("--batches", type=int, default=2)
+    parser.add_argument("--order-items", type=int, default=2)
+    parser.add_argument("--chunk-size", type=int, default=5000)
+    args = parser.parse_args()
+
+    rows = args.products * (2 + args.batches + 2 * args.order_items)
+    timings = {}
+    for bulk in (False, True):
+        products = make_products(args.products, args.batches, args.order_items)
+        with tempfile.TemporaryDirectory() as directory:
+            engine = sqlalchemy.create_engine(
+                f"sqlite:///{os.path.join(directory, 'bench.db')}"
+            )
+            orm.mapper_registry.metadata.create_all(engine)
+            start = time.perf_counter()
+            with UnitOfWork(SessionFactory(engine), cache=None) as uow:
+                uow.products.add_all(products, bulk=bulk, chunk_size=args.chunk_size)
+                events = len(list(uow.collect_new_messages()))
+            seconds = timings[bulk] = time.perf_counter() - start
+            engine.dispose()
+        name = "bulk" if bulk else "session"
+        print(
+            f"{name:<8} {seconds:>8.2f} s {rows / seconds:>10.0f} rows/s "
+            f"{events:>8} events"
+        )
+    print(f"{'speedup':<8} {timings[False] / timings[True]:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""Peak memory of listing the catalog with ProductsRepo.list against iter_products.
+
+The baseline mirrors the previous /products handler: load every Product and dump them
+as one JSON document. The streaming variant encodes one Product at a time.
+
+Usage: python benchmarks/bench_listing.py [--products 1000 4000]
+"""
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+from datetime import date
+
+import orjson
+import sqlalchemy
+from sqlalchemy.orm import sessionmaker
+
+from allocation.core import domain
+from allocation.entrypoints import serializers
+from allocation.interfaces.database import orm
+from allocation.repositories import ProductsRepo
+
+
+def populate(session, count: int) -> None:
+    for i in range(count):
+        sku = domain.create_sku(f"SKU-{i}")
+        batch = domain.create_batch(sku, 20, eta=date.today())
+        order_item = domain.create_order_item(sku, quantity=2)
+        product = domain.create_product(sku, {batch}, {order_item})
+        product.allocate(order_item)
+        session.add(product)
+    session.commit()
+
+
+def baseline(session) -> int:
+    products = ProductsRepo(session).list()
+    return len(orjson.dumps(serializers.dump_products(products)))
+
+
+def streaming(session) -> int:
+    products = ProductsRepo(session).iter_products()
+    return sum(len(orjson.dumps(serializers.dump_product(p))) for p in products)
+
+
+def report(name: str, func, session_factory) -> None:
+    session = session_factory()
+    tracemalloc.start()
+    start = time.perf_counter()
+    size = func(session)
+    seconds = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    session.close()
+    print(f"{name:<40} {peak / 2**20:>10.1f} MiB {seconds:>8.2f} s {size:>12} bytes")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--products", type=int, nargs="+", default=[1000, 4000])
+    args = parser.parse_args()
+
+    for count in args.products:
+        with tempfile.TemporaryDirectory() as directory:
+            engine = sqlalchemy.create_engine(
+                f"sqlite:///{os.path.join(directory, 'bench.db')}"
+            )
+            orm.mapper_registry.metadata.create_all(engine)
+            session_factory = sessionmaker(bind=engine)
+            populate(session_factory(), count)
+            report(f"list {count}", baseline, session_factory)
+            report(f"iter_products {count}", streaming, session_factory)
+            engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
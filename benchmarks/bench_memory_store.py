@@ -0,0 +1,110 @@
+"""Latency of allocating with the in-memory store against the relational store.
+
+Adds Products with a few batches and order items through InMemoryUnitOfWork, and
+through ProductsRepo on a temporary SQLite file, then reports the microseconds per
+unit of work that loads a Product, allocates a new order item and commits. The
+in-memory store runs without a log, with a log that is not synced, and with a
+synced log.
+
+Usage: python benchmarks/bench_memory_store.py [--products 1000] [--calls 2000]
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+import sqlalchemy
+
+from allocation.core import domain
+from allocation.interfaces.database import orm
+from allocation.interfaces.database.db import SessionFactory
+from allocation.interfaces.memory import InMemoryStore
+from allocation.repositories import ProductsRepo
+from allocation.unit_of_work import InMemoryUnitOfWork
+
+
+def make_products(count: int):
+    products = []
+    for _ in range(count):
+        sku = domain.create_sku("SKU")
+        products.append(
+            domain.create_product(
+                sku,
+                {domain.create_batch(sku, 1_000_000) for _ in range(2)},
+                {domain.create_order_item(sku, 1) for _ in range(4)},
+            )
+        )
+    return products
+
+
+def timed(allocate, sku_ids, calls: int) -> float:
+    start = time.perf_counter()
+    for _ in range(calls):
+        allocate(random.choice(sku_ids))
+    return (time.perf_counter() - start) / calls
+
+
+def bench_memory(products, calls: int, directory=None, fsync=False) -> float:
+    store = InMemoryStore(directory, fsync=fsync)
+    with InMemoryUnitOfWork(store) as uow:
+        uow.products.add_all(products)
+
+    def allocate(sku_id):
+        with InMemoryUnitOfWork(store) as uow:
+            product = uow.products.get(sku_id)
+            product.allocate(domain.create_order_item(product.sku, 1))
+
+    seconds = timed(allocate, [p.sku_id for p in products], calls)
+    store.close()
+    return seconds
+
+
+def bench_sqlite(products, calls: int, directory: str) -> float:
+    engine = sqlalchemy.create_engine(f"sqlite:///{os.path.join(directory, 'b.db')}")
+    orm.mapper_registry.metadata.create_all(engine)
+    factory = SessionFactory(engine)
+    sku_ids = [p.sku_id for p in products]
+    with factory() as session:
+        ProductsRepo(session).add_all(products)
+        session.commit()
+
+    def allocate(sku_id):
+        with factory() as session:
+            product = ProductsRepo(session).get(sku_id)
+            product.allocate(domain.create_order_item(product.sku, 1))
+            session.commit()
+
+    seconds = timed(allocate, sku_ids, calls)
+    engine.dispose()
+    return seconds
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--products", type=int, default=1000)
+    parser.add_argument("--calls", type=int, default=2000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        results = {
+            "memory": bench_memory(make_products(args.products), args.calls),
+            "memory + log": bench_memory(
+                make_products(args.products), args.calls, os.path.join(directory, "a")
+            ),
+            "memory + synced log": bench_memory(
+                make_products(args.products),
+                args.calls // 4,
+                os.path.join(directory, "b"),
+                fsync=True,
+            ),
+            "sqlite": bench_sqlite(
+                make_products(args.products), args.calls // 4, directory
+            ),
+        }
+    for name, seconds in results.items():
+        print(f"{name:<22} {seconds * 1e6:>10.0f} us/allocation")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""Cost of entering, changing and rolling back a MockUnitOfWork.
+
+Fills a MockRepo with Products and reports the microseconds per unit of work that
+changes one Product and rolls back, and per unit of work that commits, against the
+copy.copy of a dict of the same size that MockUnitOfWork used to take on entry. The
+cost of a snapshot does not depend on the Products, so all but one key share the
+same Product, which keeps the setup of the larger catalogs short.
+
+Usage: python benchmarks/bench_mock_uow.py [--sizes 10000 1000000] [--calls 1000]
+"""
+import argparse
+import copy
+import time
+from uuid import uuid4
+
+from allocation.core import domain
+from allocation.repositories import MockRepo
+from allocation.unit_of_work import MockUnitOfWork
+
+
+def make_product() -> domain.Product:
+    sku = domain.create_sku("SKU")
+    return domain.create_product(
+        sku,
+        {domain.create_batch(sku, 100) for _ in range(2)},
+        {domain.create_order_item(sku, 1) for _ in range(4)},
+    )
+
+
+def timed(func, calls: int) -> float:
+    start = time.perf_counter()
+    for _ in range(calls):
+        func()
+    return (time.perf_counter() - start) / calls
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 1_000_000])
+    parser.add_argument("--calls", type=int, default=1000)
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        shared, product = make_product(), make_product()
+        products = {uuid4(): shared for _ in range(size - 1)}
+        products[product.sku_id] = product
+        uow = MockUnitOfWork(MockRepo(products))
+
+        def change(fail: bool):
+            try:
+                with uow:
+                    changed = uow.products.get(product.sku_id)
+                    batch = next(iter(changed.batches))
+                    changed.change_batch_quantity(batch.uuid, batch.quantity + 1)
+                    if fail:
+                        raise ValueError()
+            except ValueError:
+                pass
+
+        results = {
+            "copy.copy of a dict": timed(lambda: copy.copy(products), 10),
+            "rollback": timed(lambda: change(True), args.calls),
+            "commit": timed(lambda: change(False), args.calls),
+        }
+        for name, seconds in results.items():
+            print(f"{size:>9} products {name:<20} {seconds * 1e6:>12.1f} us/call")
+
+
+if __name__ == "__main__":
+    main()
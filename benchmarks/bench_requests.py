@@ -0,0 +1,77 @@
+"""Request decoding throughput of marshmallow schemas against the compiled loaders.
+
+The baseline mirrors the previous request handling: parse the body with json, load it
+with a freshly built schema and build the command from the loaded data.
+
+Usage: python benchmarks/bench_requests.py [--batch-size 1000]
+"""
+import argparse
+import json
+import timeit
+from datetime import date
+from uuid import uuid4
+
+import orjson
+
+from allocation.core import commands
+from allocation.entrypoints import serializers
+
+
+def report(name: str, func) -> float:
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    seconds = min(timer.repeat(repeat=3, number=number)) / number
+    print(f"{name:<40} {seconds * 1e6:>12.1f} us/op {1 / seconds:>12.0f} ops/s")
+    return seconds
+
+
+def baseline(schema_class, command, body: bytes, many=False):
+    data = schema_class().load(json.loads(body), many=many)
+    if many:
+        return [command(**item) for item in data]
+    return command(**data)
+
+
+def compiled(schema_class, command, body: bytes, many=False):
+    return serializers.decode(schema_class, orjson.loads(body), command, many)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    allocate = {"sku_id": str(uuid4()), "order_item_id": str(uuid4())}
+    create_batch = {"sku_id": str(uuid4()), "quantity": 20, "eta": str(date.today())}
+    cases = (
+        ("Allocate", serializers.Allocate, commands.Allocate, allocate, False),
+        (
+            "CreateBatch",
+            serializers.CreateBatch,
+            commands.CreateBatch,
+            create_batch,
+            False,
+        ),
+        (
+            f"CreateBatch x{args.batch_size}",
+            serializers.CreateBatch,
+            commands.CreateBatch,
+            [create_batch] * args.batch_size,
+            True,
+        ),
+    )
+    for name, schema_class, command, data, many in cases:
+        body = json.dumps(data).encode()
+        old = report(
+            f"marshmallow {name}",
+            lambda: baseline(schema_class, command, body, many),
+        )
+        new = report(
+            f"compiled {name}",
+            lambda: compiled(schema_class, command, body, many),
+        )
+        print(f"{'speedup':<40} {old / new:>12.1f}x")
+
+
+if __name__ == "__main__":
+    main()
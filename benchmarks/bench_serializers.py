@@ -0,0 +1,72 @@
+"""Serialization throughput of the marshmallow schemas against the compiled dumpers.
+
+Usage: python benchmarks/bench_serializers.py [--batches 100] [--order-items 500]
+"""
+import argparse
+import json
+import timeit
+from datetime import date, timedelta
+
+import orjson
+
+from allocation.core import domain
+from allocation.entrypoints import serializers
+from allocation.entrypoints.app import ORJSON_OPTIONS
+from allocation.interfaces.database import orm  # noqa: F401 instruments the models
+
+
+def make_product(n_batches: int, n_order_items: int) -> domain.Product:
+    sku = domain.create_sku("SKU-BENCHMARK")
+    product = domain.create_product(sku)
+    for i in range(n_batches):
+        eta = date.today() + timedelta(days=i)
+        product.register_batch(domain.create_batch(sku, n_order_items * 10, eta))
+    for _ in range(n_order_items):
+        product.allocate(domain.create_order_item(sku, 1))
+    return product
+
+
+def report(name: str, func) -> float:
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    seconds = min(timer.repeat(repeat=3, number=number)) / number
+    print(f"{name:<40} {seconds * 1e6:>12.1f} us/op {1 / seconds:>12.0f} ops/s")
+    return seconds
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--batches", type=int, default=100)
+    parser.add_argument("--order-items", type=int, default=500)
+    args = parser.parse_args()
+
+    product = make_product(args.batches, args.order_items)
+    batch = next(b for b in product.batches if b.allocated_order_items)
+    order_item = next(iter(product.order_items))
+    assert serializers.dump_product(product) == serializers.Product().dump(product)
+
+    print(f"Product with {args.batches} batches, {args.order_items} order items")
+    for name, schema, fast, obj in (
+        ("SKU", serializers.SKU, serializers.dump_sku, product.sku),
+        ("OrderItem", serializers.OrderItem, serializers.dump_order_item, order_item),
+        ("Batch", serializers.Batch, serializers.dump_batch, batch),
+        ("Product", serializers.Product, serializers.dump_product, product),
+    ):
+        baseline = report(f"marshmallow {name}", lambda: schema().dump(obj))
+        result = report(f"compiled {name}", lambda: fast(obj))
+        print(f"{'speedup':<40} {baseline / result:>12.1f}x")
+
+    data = serializers.dump_product(product)
+    baseline = report(
+        "json.dumps Product",
+        lambda: json.dumps(data, sort_keys=True, separators=(",", ":")),
+    )
+    result = report(
+        "orjson.dumps Product",
+        lambda: orjson.dumps(data, option=ORJSON_OPTIONS),
+    )
+    print(f"{'speedup':<40} {baseline / result:>12.1f}x")
+
+
+if __name__ == "__main__":
+    main()
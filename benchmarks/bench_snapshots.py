@@ -0,0 +1,118 @@
+"""Latency of hydrating a Product from its snapshot column and the cost of writing it.
+
+Populates a temporary SQLite file with one Product with its batches and order items,
+allocated to them. Reports the microseconds per ProductsRepo.get in a fresh session,
+with the relational load and with the snapshot column, and the milliseconds per
+commit of a changed Product, with and without writing the snapshot. The write
+amplification is the size of the snapshot written on every commit against the bytes
+of the rows the change itself updates.
+
+Usage: python benchmarks/bench_snapshots.py [--batches 50] [--order-items 200]
+       [--calls 200]
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import sqlalchemy
+from sqlalchemy import event, func, select
+
+from allocation.core import domain
+from allocation.interfaces.database import orm
+from allocation.interfaces.database.db import SessionFactory
+from allocation.repositories import ProductsRepo
+
+
+def populate(factory, batches: int, order_items: int):
+    sku = domain.create_sku("SKU")
+    product = domain.create_product(
+        sku,
+        {domain.create_batch(sku, order_items) for _ in range(batches)},
+        {domain.create_order_item(sku, 1) for _ in range(order_items)},
+    )
+    for order_item in list(product.order_items):
+        product.allocate(order_item)
+    sku_id = sku.uuid
+    with factory() as session:
+        ProductsRepo(session, snapshots=True).add(product)
+        session.commit()
+    return sku_id
+
+
+def timed(func, calls: int) -> float:
+    """Returns the best of five timings per call, as this runs on noisy machines."""
+    timings = []
+    for _ in range(5):
+        start = time.perf_counter()
+        for _ in range(calls):
+            func()
+        timings.append((time.perf_counter() - start) / calls)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--batches", type=int, default=50)
+    parser.add_argument("--order-items", type=int, default=200)
+    parser.add_argument("--calls", type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        engine = sqlalchemy.create_engine(
+            f"sqlite:///{os.path.join(directory, 'bench.db')}"
+        )
+        orm.mapper_registry.metadata.create_all(engine)
+        factory = SessionFactory(engine)
+        sku_id = populate(factory, args.batches, args.order_items)
+
+        def get(snapshots: bool):
+            with factory() as session:
+                ProductsRepo(session, snapshots=snapshots).get(sku_id)
+
+        def change(snapshots: bool):
+            with factory() as session:
+                product = ProductsRepo(session, snapshots=snapshots).get(sku_id)
+                batch = next(iter(product.batches))
+                product.change_batch_quantity(batch.uuid, batch.quantity)
+                session.commit()
+
+        for snapshots in (False, True):
+            name = "snapshot" if snapshots else "relational"
+            seconds = timed(lambda: get(snapshots), args.calls)
+            print(f"get {name:<24} {seconds * 1e6:>10.0f} us/call")
+        for snapshots in (False, True):
+            name = "with snapshot" if snapshots else "without snapshot"
+            seconds = timed(lambda: change(snapshots), args.calls // 4)
+            print(f"commit {name:<21} {seconds * 1e3:>10.2f} ms/call")
+
+        written = []
+
+        def count(conn, cursor, statement, parameters, context, executemany):
+            if statement.startswith("UPDATE"):
+                rows = parameters if executemany else [parameters]
+                written.append(
+                    sum(
+                        len(v)
+                        for row in rows
+                        for v in row
+                        if isinstance(v, (bytes, memoryview))
+                    )
+                )
+
+        event.listen(engine, "before_cursor_execute", count)
+        change(True)
+        with engine.connect() as connection:
+            size = connection.execute(
+                select(func.length(orm.products.c.snapshot)).where(
+                    orm.products.c._sku_id == sku_id
+                )
+            ).scalar()
+        print(f"snapshot size {size:>27} bytes")
+        print(f"bytes bound per commit {sum(written):>18} bytes")
+        print(f"UPDATE statements per commit {len(written):>12}")
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""Python overhead per call of the hot ProductsRepo queries.
+
+Runs every call in a fresh session against a small in-memory SQLite database, so the
+time is dominated by building, caching and executing the statements rather than by the
+database. Prints the microseconds per call and the statement cache counters.
+
+Usage: python benchmarks/bench_statements.py [--calls 2000]
+"""
+import argparse
+import time
+
+import sqlalchemy
+from sqlalchemy.pool import StaticPool
+
+from allocation.core import domain
+from allocation.interfaces.database import orm
+from allocation.interfaces.database.db import SessionFactory, StatementCacheStats
+from allocation.unit_of_work import UnitOfWork
+
+
+def populate(factory):
+    with UnitOfWork(factory, cache=None) as uow:
+        sku = domain.create_sku("SKU")
+        batches = {domain.create_batch(sku, 100) for _ in range(2)}
+        order_items = {domain.create_order_item(sku, 1) for _ in range(2)}
+        product = domain.create_product(sku, batches, order_items)
+        for order_item in order_items:
+            product.allocate(order_item)
+        uow.products.add(product)
+        return sku.uuid, next(iter(batches)).uuid, next(iter(order_items)).uuid
+
+
+def report(name: str, factory, func, calls: int) -> None:
+    timings = []
+    for _ in range(5):
+        start = time.perf_counter()
+        for _ in range(calls):
+            with UnitOfWork(factory, cache=None) as uow:
+                func(uow.products)
+        timings.append((time.perf_counter() - start) / calls)
+    print(f"{name:<32} {min(timings) * 1e6:>10.1f} us/call (best of 5)")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=2000)
+    args = parser.parse_args()
+
+    engine = sqlalchemy.create_engine("sqlite://", poolclass=StaticPool)
+    orm.mapper_registry.metadata.create_all(engine)
+    stats = StatementCacheStats(engine)
+    factory = SessionFactory(engine)
+    sku_id, batch_id, order_item_id = populate(factory)
+
+    report("get", factory, lambda repo: repo.get(sku_id), args.calls)
+    report("get_version", factory, lambda repo: repo.get_version(sku_id), args.calls)
+    report(
+        "get_batch_owner",
+        factory,
+        lambda repo: repo.get_batch_owner(batch_id),
+        args.calls,
+    )
+    report(
+        "try_allocate (already allocated)",
+        factory,
+        lambda repo: repo.try_allocate(sku_id, order_item_id),
+        args.calls,
+    )
+    report("list", factory, lambda repo: repo.list(), args.calls)
+    print(stats.stats())
+
+
+if __name__ == "__main__":
+    main()
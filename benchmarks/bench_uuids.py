@@ -0,0 +1,153 @@
+"""Storage size and hydration time of GUID columns stored as hex and as binary.
+
+Populates a temporary SQLite file once per storage mode, in a subprocess with
+BINARY_UUIDS set accordingly since the column types are bound when orm is imported.
+Reports the size of every table and index from the dbstat virtual table, the time to
+load all batch ids, the time to join batches to their allocations and the time to
+hydrate every Product through ProductsRepo.iter_products, each the best of three runs.
+
+Usage: python benchmarks/bench_uuids.py [--products 2000] [--batches 50000]
+"""
+import argparse
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+from uuid import uuid4
+
+
+def populate(engine, products: int, batches: int, chunk_size: int = 50_000):
+    from allocation.interfaces.database import orm
+
+    sku_ids = [uuid4() for _ in range(products)]
+    today = date.today()
+    with engine.begin() as connection:
+        connection.execute(
+            orm.skus.insert(),
+            [{"uuid": s, "name": f"SKU-{i}"} for i, s in enumerate(sku_ids)],
+        )
+        connection.execute(
+            orm.products.insert(),
+            [{"_sku_id": s, "version_number": 0} for s in sku_ids],
+        )
+        for start in range(0, batches, chunk_size):
+            batch_rows, order_item_rows, association_rows = [], [], []
+            for i in range(start, min(start + chunk_size, batches)):
+                sku_id = sku_ids[i % products]
+                batch_id, order_item_id = uuid4(), uuid4()
+                batch_rows.append(
+                    {
+                        "uuid": batch_id,
+                        "_sku_id": sku_id,
+                        "_product_id": sku_id,
+                        "quantity": 100,
+                        "allocated_quantity": 1,
+                        "eta": today + timedelta(days=random.randint(0, 365)),
+                        "discarded": False,
+                    }
+                )
+                order_item_rows.append(
+                    {
+                        "uuid": order_item_id,
+                        "_sku_id": sku_id,
+                        "_product_id": sku_id,
+                        "quantity": 1,
+                        "discarded": False,
+                    }
+                )
+                association_rows.append(
+                    {"order_item_id": order_item_id, "batches_id": batch_id}
+                )
+            connection.execute(orm.batches.insert(), batch_rows)
+            connection.execute(orm.order_items.insert(), order_item_rows)
+            connection.execute(
+                orm.order_items_batches_association.insert(), association_rows
+            )
+
+
+def timed(func, repeat: int = 3) -> float:
+    """Returns the best of repeated timings, as this runs on noisy machines."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def measure(products: int, batches: int) -> None:
+    """Populates a database in the storage mode of this process and prints results."""
+    import sqlalchemy
+    from sqlalchemy import select
+    from sqlalchemy.orm import sessionmaker
+
+    from allocation.interfaces.database import orm
+    from allocation.unit_of_work import UnitOfWork
+
+    with tempfile.TemporaryDirectory() as directory:
+        engine = sqlalchemy.create_engine(
+            f"sqlite:///{os.path.join(directory, 'bench.db')}"
+        )
+        orm.mapper_registry.metadata.create_all(engine)
+        populate(engine, products, batches)
+
+        with engine.connect() as connection:
+            sizes = connection.exec_driver_sql(
+                "SELECT name, SUM(pgsize) FROM dbstat GROUP BY name ORDER BY name"
+            ).all()
+        for name, size in sizes:
+            report(name, f"{size / 2**20:>10.2f} MiB")
+        report("total", f"{sum(size for _, size in sizes) / 2**20:>10.2f} MiB")
+
+        association = orm.order_items_batches_association
+
+        def load_ids():
+            with engine.connect() as connection:
+                list(connection.execute(select(orm.batches.c.uuid)).scalars())
+
+        def join():
+            stmt = select(association.c.order_item_id, orm.batches.c._sku_id).join(
+                orm.batches, association.c.batches_id == orm.batches.c.uuid
+            )
+            with engine.connect() as connection:
+                list(connection.execute(stmt))
+
+        def hydrate():
+            with UnitOfWork(sessionmaker(bind=engine), cache=None) as uow:
+                for _ in uow.products.iter_products():
+                    pass
+
+        report("load batch ids", f"{timed(load_ids) * 1000:>10.0f} ms")
+        report("join batches to allocations", f"{timed(join) * 1000:>10.0f} ms")
+        report("hydrate all Products", f"{timed(hydrate) * 1000:>10.0f} ms")
+        engine.dispose()
+
+
+def report(name: str, value: str) -> None:
+    mode = "binary" if os.environ["BINARY_UUIDS"] == "1" else "hex"
+    print(f"{mode:<8} {name:<40} {value}", flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--products", type=int, default=2000)
+    parser.add_argument("--batches", type=int, default=50_000)
+    parser.add_argument("--measure", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        measure(args.products, args.batches)
+        return
+    for binary in ("0", "1"):
+        subprocess.run(
+            [sys.executable, __file__, "--measure", *sys.argv[1:]],
+            env={**os.environ, "BINARY_UUIDS": binary},
+            check=True,
+        )
+
+
+if __name__ == "__main__":
+    main()
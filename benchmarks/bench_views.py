@@ -0,0 +1,134 @@
+"""Latency of the stock views over a large batches table.
+
+Compares views.availability with loading the Product aggregate and summing its batches,
+like clients of the previous API had to, and times views.stock over the catalog. Runs
+against a temporary SQLite file, with and without ix_batches_product_id_eta.
+
+Usage: python benchmarks/bench_views.py [--batches 1000000] [--products 10000]
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+from datetime import date, timedelta
+from uuid import uuid4
+
+import sqlalchemy
+from sqlalchemy.orm import sessionmaker
+
+from allocation import views
+from allocation.interfaces.database import orm
+from allocation.unit_of_work import UnitOfWork
+
+
+def populate(engine, batches: int, products: int, chunk_size: int = 50_000):
+    sku_ids = [uuid4() for _ in range(products)]
+    today = date.today()
+    with engine.begin() as connection:
+        connection.execute(
+            orm.skus.insert(),
+            [{"uuid": s, "name": f"SKU-{i}"} for i, s in enumerate(sku_ids)],
+        )
+        connection.execute(
+            orm.products.insert(),
+            [{"_sku_id": s, "version_number": 0} for s in sku_ids],
+        )
+        for start in range(0, batches, chunk_size):
+            rows = []
+            for i in range(start, min(start + chunk_size, batches)):
+                sku_id = sku_ids[i % products]
+                rows.append(
+                    {
+                        "uuid": uuid4(),
+                        "_sku_id": sku_id,
+                        "_product_id": sku_id,
+                        "quantity": 100,
+                        "allocated_quantity": random.randint(0, 100),
+                        "eta": today + timedelta(days=random.randint(0, 365)),
+                        "discarded": False,
+                    }
+                )
+            connection.execute(orm.batches.insert(), rows)
+    return sku_ids
+
+
+def hydrated_availability(sku_id, uow):
+    with uow:
+        product = uow.products.get(sku_id)
+        return sum(b.available_quantity for b in product.batches)
+
+
+def report(name: str, func, samples) -> None:
+    timings = []
+    for sample in samples:
+        start = time.perf_counter()
+        func(sample)
+        timings.append(time.perf_counter() - start)
+    median = statistics.median(timings) * 1000
+    worst = max(timings) * 1000
+    print(f"{name:<48} {median:>10.2f} ms p50 {worst:>10.2f} ms max")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--batches", type=int, default=1_000_000)
+    parser.add_argument("--products", type=int, default=10_000)
+    parser.add_argument("--samples", type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        engine = sqlalchemy.create_engine(
+            f"sqlite:///{os.path.join(directory, 'bench.db')}"
+        )
+        orm.mapper_registry.metadata.create_all(engine)
+        start = time.perf_counter()
+        sku_ids = populate(engine, args.batches, args.products)
+        print(
+            f"populated {args.batches} batches in {time.perf_counter() - start:.1f} s"
+        )
+
+        factory = sessionmaker(bind=engine)
+
+        def new_uow():
+            return UnitOfWork(factory, cache=None)
+
+        samples = random.sample(sku_ids, args.samples)
+        eta_to = date.today() + timedelta(days=30)
+
+        report(
+            "hydrated Product",
+            lambda sku_id: hydrated_availability(sku_id, new_uow()),
+            samples[:5],
+        )
+        for indexed in (True, False):
+            label = "indexed" if indexed else "no index"
+            if not indexed:
+                with engine.begin() as connection:
+                    connection.exec_driver_sql("DROP INDEX ix_batches_product_id_eta")
+            report(
+                f"availability ({label})",
+                lambda sku_id: views.availability(sku_id, new_uow()),
+                samples,
+            )
+            report(
+                f"availability eta_to=+30d ({label})",
+                lambda sku_id: views.availability(sku_id, new_uow(), eta_to=eta_to),
+                samples,
+            )
+            report(
+                f"stock limit=100 ({label})",
+                lambda sku_id: list(views.stock(new_uow(), after=sku_id, limit=100)),
+                samples[:10],
+            )
+            report(
+                f"stock full catalog ({label})",
+                lambda _: sum(1 for _ in views.stock(new_uow())),
+                [None],
+            )
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
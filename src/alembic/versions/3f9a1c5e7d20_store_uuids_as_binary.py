@@ -0,0 +1,62 @@
+"""Store UUIDs as binary
+
+Revision ID: 3f9a1c5e7d20
+Revises: 8b2e6c4d1a7f
+Create Date: 2026-10-19 14:02:51.630184
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from allocation.config import get_config
+
+
+# revision identifiers, used by Alembic.
+revision = "3f9a1c5e7d20"
+down_revision = "8b2e6c4d1a7f"
+branch_labels = None
+depends_on = None
+
+# PostgreSQL stores GUID columns with its native UUID type and is left untouched.
+GUID_COLUMNS = {
+    "skus": ["uuid"],
+    "customers": ["uuid"],
+    "orders": ["uuid"],
+    "products": ["_sku_id"],
+    "order_items": ["uuid", "_sku_id", "_product_id"],
+    "batches": ["uuid", "_sku_id", "_product_id"],
+    "association": ["order_item_id", "batches_id"],
+    "allocations_view": ["order_item_id", "batch_id", "sku_id"],
+}
+
+
+def hex_to_bytes(value):
+    return bytes.fromhex(value) if isinstance(value, str) else value
+
+
+def bytes_to_hex(value):
+    return value.hex() if isinstance(value, bytes) else value
+
+
+def convert(function, type_, existing_type):
+    bind = op.get_bind()
+    if bind.dialect.name != "sqlite":
+        return
+    bind.connection.create_function("convert_uuid", 1, function, deterministic=True)
+    for table, columns in GUID_COLUMNS.items():
+        assignments = ", ".join(f"{c} = convert_uuid({c})" for c in columns)
+        op.execute(f"UPDATE {table} SET {assignments}")
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            for column in columns:
+                batch_op.alter_column(column, type_=type_, existing_type=existing_type)
+
+
+def upgrade():
+    # UUIDs stay CHAR(32) unless BINARY_UUIDS is set, matching the columns of GUID.
+    if not get_config().BINARY_UUIDS:
+        return
+    convert(hex_to_bytes, sa.LargeBinary(16), sa.CHAR(32))
+
+
+def downgrade():
+    convert(bytes_to_hex, sa.CHAR(32), sa.LargeBinary(16))
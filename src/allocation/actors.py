@@ -0,0 +1,368 @@
+import logging
+import math
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Callable, Deque, Dict, List, Optional, Tuple, Type
+from uuid import UUID
+
+from allocation.core.commands import Command
+from allocation.core.events import Event
+from allocation.unit_of_work import ActorUnitOfWork
+
+logger = logging.getLogger(__name__)
+
+CommandHandlers = Dict[Type[Command], List[Callable]]
+
+
+class StaleProduct(Exception):
+    pass
+
+
+class HotnessTracker:
+    """Estimates the command rate of every SKU with a counter decaying by half every
+    half_life seconds. A SKU is hot while its rate is at least hot_rate per second.
+
+    Once more than max_tracked SKUs are counted, those below one command are dropped."""
+
+    def __init__(
+        self, hot_rate: float, half_life: float = 1.0, max_tracked: int = 10_000
+    ):
+        self.hot_rate = hot_rate
+        self.half_life = half_life
+        self.max_tracked = max_tracked
+        # Decayed count and time of the last command of every SKU.
+        self._counts: Dict[UUID, Tuple[float, float]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, sku_id: UUID) -> bool:
+        """Counts a command of the SKU and returns whether the SKU is hot."""
+        now = time.monotonic()
+        with self._lock:
+            count = self._decayed(sku_id, now) + 1
+            self._counts[sku_id] = (count, now)
+            if len(self._counts) > self.max_tracked:
+                self._prune(now)
+        return count * math.log(2) / self.half_life >= self.hot_rate
+
+    def rate(self, sku_id: UUID) -> float:
+        """Returns the estimated commands per second of the SKU."""
+        with self._lock:
+            count = self._decayed(sku_id, time.monotonic())
+        return count * math.log(2) / self.half_life
+
+    def _decayed(self, sku_id: UUID, now: float) -> float:
+        count, updated_at = self._counts.get(sku_id, (0.0, now))
+        return count * 0.5 ** ((now - updated_at) / self.half_life)
+
+    def _prune(self, now: float) -> None:
+        for sku_id in [s for s in self._counts if self._decayed(s, now) < 1]:
+            del self._counts[sku_id]
+
+
+@dataclass
+class _Envelope:
+    command: Command
+    future: Future = field(default_factory=Future)
+    submitted_at: float = field(default_factory=time.perf_counter)
+    result: object = None
+    events: List[Event] = field(default_factory=list)
+
+
+_STOP = object()
+
+
+class ProductActor:
+    """Owns the Product of a SKU and handles its commands one at a time, in a thread
+    of its own, from a mailbox.
+
+    The Product stays loaded in the session of the actor between commands. Commands are
+    committed together once max_batch of them were handled, or max_delay seconds after
+    the first of them, and their results are returned and their events handled only
+    then. If a command fails, the batch is rolled back and its other commands handled
+    again on the reloaded Product. The same happens before committing if the Product
+    was committed by someone else meanwhile, which the actor checks by fencing its row
+    like units of work holding a SKU lease, so neither can commit over the other. The
+    actor stops once it received no command for idle_timeout seconds."""
+
+    def __init__(
+        self,
+        sku_id: UUID,
+        handlers: CommandHandlers,
+        handle_event: Callable[[Event], None],
+        uow_factory: Callable[[], ActorUnitOfWork] = ActorUnitOfWork,
+        max_batch: int = 64,
+        max_delay: float = 0.005,
+        idle_timeout: float = 5.0,
+        attempts: int = 3,
+    ):
+        self.sku_id = sku_id
+        self.handlers = handlers
+        self.handle_event = handle_event
+        self.uow_factory = uow_factory
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.idle_timeout = idle_timeout
+        self.attempts = attempts
+        self.commands = 0
+        self.failures = 0
+        self.batches = 0
+        self.reloads = 0
+        self.started_at = time.monotonic()
+        # Seconds from submitting to completing the most recent commands.
+        self.latencies: Deque[float] = deque(maxlen=1000)
+        self._mailbox: "queue.Queue" = queue.Queue()
+        self._lock = threading.Lock()
+        self._stopped = False
+        self._thread = threading.Thread(
+            target=self._run, name=f"product-actor-{sku_id}", daemon=True
+        )
+        self._thread.start()
+
+    @property
+    def stopped(self) -> bool:
+        return self._stopped
+
+    def submit(self, command: Command) -> Optional[Future]:
+        """Queues the command, or returns None if the actor stopped."""
+        with self._lock:
+            if self._stopped:
+                return None
+            envelope = _Envelope(command)
+            self._mailbox.put(envelope)
+            return envelope.future
+
+    def stop(self, wait: bool = True) -> None:
+        """Stops the actor once it committed the commands already submitted."""
+        with self._lock:
+            if not self._stopped:
+                self._stopped = True
+                self._mailbox.put(_STOP)
+        if wait:
+            self._thread.join()
+
+    def stats(self) -> Dict:
+        """Returns the counters and the throughput and latency of the actor."""
+        latencies = sorted(self.latencies)
+        elapsed = time.monotonic() - self.started_at
+        return {
+            "commands": self.commands,
+            "failures": self.failures,
+            "batches": self.batches,
+            "reloads": self.reloads,
+            "mean_batch_size": round(self.commands / self.batches, 2)
+            if self.batches
+            else None,
+            "commands_per_second": round(self.commands / elapsed, 2),
+            "p50_latency_ms": _percentile_ms(latencies, 0.5),
+            "p99_latency_ms": _percentile_ms(latencies, 0.99),
+        }
+
+    def _run(self) -> None:
+        uow: Optional[ActorUnitOfWork] = None
+        pending: List[_Envelope] = []
+        deadline = None
+        try:
+            uow = self.uow_factory()
+            while True:
+                timeout = (
+                    self.idle_timeout
+                    if deadline is None
+                    else max(0.0, deadline - time.monotonic())
+                )
+                try:
+                    envelope = self._mailbox.get(timeout=timeout)
+                except queue.Empty:
+                    envelope = None
+                if envelope is _STOP:
+                    break
+                if envelope is not None:
+                    deadline = deadline or time.monotonic() + self.max_delay
+                    pending = self._handle(uow, pending, envelope)
+                    deadline = deadline if pending else None
+                elif not pending:
+                    self._retire()
+                    continue
+                if pending and (
+                    len(pending) >= self.max_batch or time.monotonic() >= deadline
+                ):
+                    self._commit(uow, pending)
+                    pending, deadline = [], None
+            if pending:
+                self._commit(uow, pending)
+        except Exception as e:
+            logger.exception("Product actor of SKU %s failed", self.sku_id)
+            with self._lock:
+                self._stopped = True
+            while not self._mailbox.empty():
+                pending.append(self._mailbox.get())
+            for envelope in pending:
+                if envelope is not _STOP and not envelope.future.done():
+                    envelope.future.set_exception(e)
+        finally:
+            if uow is not None:
+                uow.close()
+
+    def _retire(self) -> None:
+        """Stops the idle actor, which still handles any command submitted meanwhile."""
+        with self._lock:
+            self._stopped = True
+            self._mailbox.put(_STOP)
+
+    def _handle(
+        self, uow: ActorUnitOfWork, pending: List[_Envelope], envelope: _Envelope
+    ) -> List[_Envelope]:
+        """Handles a command after the pending ones and returns the commands pending
+        commit. Fails its future, and handles the others again, if it raises."""
+        try:
+            self._execute(uow, envelope)
+            return [*pending, envelope]
+        except Exception as e:
+            self.failures += 1
+            self._complete(envelope, exception=e)
+            uow.rollback()
+            return self._replay(uow, pending)
+
+    def _replay(
+        self, uow: ActorUnitOfWork, envelopes: List[_Envelope]
+    ) -> List[_Envelope]:
+        """Handles the commands again on a reloaded Product, failing and leaving out
+        those that raise now."""
+        self.reloads += 1
+        while True:
+            handled = []
+            for envelope in envelopes:
+                try:
+                    self._execute(uow, envelope)
+                except Exception as e:
+                    self.failures += 1
+                    self._complete(envelope, exception=e)
+                    uow.rollback()
+                    envelopes = [other for other in envelopes if other is not envelope]
+                    break
+                handled.append(envelope)
+            else:
+                return handled
+
+    def _execute(self, uow: ActorUnitOfWork, envelope: _Envelope) -> None:
+        (handler,) = self.handlers[type(envelope.command)]
+        envelope.result = handler(envelope.command, uow)
+        envelope.events = list(uow.collect_new_messages())
+
+    def _commit(self, uow: ActorUnitOfWork, pending: List[_Envelope]) -> None:
+        for attempt in range(1, self.attempts + 1):
+            stale = uow.products.fence_products()
+            if not stale:
+                try:
+                    uow.commit()
+                except Exception as e:
+                    logger.exception(
+                        "Commit of the actor of SKU %s failed", self.sku_id
+                    )
+                    uow.rollback()
+                    for envelope in pending:
+                        self._complete(envelope, exception=e)
+                    return
+                break
+            uow.rollback()
+            if attempt == self.attempts:
+                error = StaleProduct(f"The Product {self.sku_id} keeps changing.")
+                for envelope in pending:
+                    self._complete(envelope, exception=error)
+                return
+            pending = self._replay(uow, pending)
+
+        self.batches += 1
+        for envelope in pending:
+            self._complete(envelope)
+            for event in envelope.events:
+                self.handle_event(event)
+
+    def _complete(self, envelope: _Envelope, exception: Exception = None) -> None:
+        self.commands += 1
+        self.latencies.append(time.perf_counter() - envelope.submitted_at)
+        if exception is None:
+            envelope.future.set_result(envelope.result)
+        else:
+            envelope.future.set_exception(exception)
+
+
+class ActorSystem:
+    """Routes the commands of hot SKUs to a ProductActor of their own, started on
+    demand. Commands of other SKUs, and those without sku_id, are left to the caller."""
+
+    def __init__(
+        self,
+        handlers: CommandHandlers,
+        handle_event: Callable[[Event], None],
+        hot_rate: float = 50.0,
+        uow_factory: Callable[[], ActorUnitOfWork] = ActorUnitOfWork,
+        max_batch: int = 64,
+        max_delay: float = 0.005,
+        idle_timeout: float = 5.0,
+    ):
+        self.handlers = handlers
+        self.handle_event = handle_event
+        self.tracker = HotnessTracker(hot_rate)
+        self.uow_factory = uow_factory
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.idle_timeout = idle_timeout
+        self.actors: Dict[UUID, ProductActor] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, command: Command) -> Optional[Future]:
+        """Submits the command to the actor of its SKU if the SKU is hot, or returns
+        None if the caller should handle it."""
+        sku_id = getattr(command, "sku_id", None)
+        if sku_id is None or type(command) not in self.handlers:
+            return None
+        actor = self.actors.get(sku_id)
+        if (actor is None or actor.stopped) and not self.tracker.record(sku_id):
+            return None
+        while True:
+            future = self._actor(sku_id).submit(command)
+            if future is not None:
+                return future
+
+    def _actor(self, sku_id: UUID) -> ProductActor:
+        with self._lock:
+            actor = self.actors.get(sku_id)
+            if actor is None or actor.stopped:
+                for stopped in [s for s, a in self.actors.items() if a.stopped]:
+                    del self.actors[stopped]
+                logger.info("Starting the actor of hot SKU %s", sku_id)
+                actor = self.actors[sku_id] = ProductActor(
+                    sku_id,
+                    self.handlers,
+                    self.handle_event,
+                    self.uow_factory,
+                    self.max_batch,
+                    self.max_delay,
+                    self.idle_timeout,
+                )
+            return actor
+
+    def stop(self) -> None:
+        with self._lock:
+            actors = list(self.actors.values())
+            self.actors.clear()
+        for actor in actors:
+            actor.stop()
+
+    def stats(self) -> Dict:
+        """Returns the statistics of the actor of every hot SKU."""
+        return {
+            str(sku_id): actor.stats()
+            for sku_id, actor in list(self.actors.items())
+            if not actor.stopped
+        }
+
+
+def _percentile_ms(values: List[float], fraction: float) -> Optional[float]:
+    if not values:
+        return None
+    return round(values[min(len(values) - 1, int(len(values) * fraction))] * 1e3, 3)
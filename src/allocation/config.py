@@ -9,6 +9,40 @@ class Config:
     REDIS_HOST = os.getenv("REDIS_HOST") or "localhost"
     REDIS_PORT = os.getenv("REDIS_PORT") or 6379
     REDIS_DB = os.getenv("REDIS_DB") or 0
+    PRODUCT_CACHE_SIZE = int(os.getenv("PRODUCT_CACHE_SIZE") or 1024)
+    READ_MODEL_CACHE_ENABLED = os.getenv("READ_MODEL_CACHE_ENABLED") == "1"
+    READ_MODEL_CACHE_TTL = int(os.getenv("READ_MODEL_CACHE_TTL") or 300)
+    READ_MODEL_CACHE_LOCK_TIMEOUT = float(
+        os.getenv("READ_MODEL_CACHE_LOCK_TIMEOUT") or 5.0
+    )
+    # GUID columns are 16 byte BLOBs instead of CHAR(32) outside PostgreSQL. Set it
+    # before running the 3f9a1c5e7d20 migration, which converts existing UUIDs.
+    BINARY_UUIDS = os.getenv("BINARY_UUIDS") == "1"
+    ORJSON_RESPONSES = os.getenv("ORJSON_RESPONSES") != "0"
+    ALLOCATION_FAST_PATH = os.getenv("ALLOCATION_FAST_PATH") == "1"
+    PRODUCT_SNAPSHOTS = os.getenv("PRODUCT_SNAPSHOTS") == "1"
+    EVENT_SNAPSHOT_INTERVAL = int(os.getenv("EVENT_SNAPSHOT_INTERVAL") or 100)
+    MEMORY_SNAPSHOT_INTERVAL = int(os.getenv("MEMORY_SNAPSHOT_INTERVAL") or 1000)
+    # Comma separated name=url pairs of the databases Products are sharded across.
+    SHARDS = os.getenv("SHARDS") or ""
+    SHARD_VNODES = int(os.getenv("SHARD_VNODES") or 64)
+    # Per-SKU leases taken around commands, "local", "redis" or disabled if empty.
+    SKU_LEASES = os.getenv("SKU_LEASES") or ""
+    SKU_LEASE_TTL = float(os.getenv("SKU_LEASE_TTL") or 5.0)
+    SKU_LEASE_TIMEOUT = float(os.getenv("SKU_LEASE_TIMEOUT") or 10.0)
+    # Commands of SKUs receiving at least ACTOR_HOT_RATE commands per second are handled
+    # by an actor keeping their Product loaded, which commits every batch of up to
+    # ACTOR_BATCH_SIZE commands after at most ACTOR_BATCH_INTERVAL_MS.
+    PRODUCT_ACTORS = os.getenv("PRODUCT_ACTORS") == "1"
+    ACTOR_HOT_RATE = float(os.getenv("ACTOR_HOT_RATE") or 50.0)
+    ACTOR_BATCH_SIZE = int(os.getenv("ACTOR_BATCH_SIZE") or 64)
+    ACTOR_BATCH_INTERVAL_MS = float(os.getenv("ACTOR_BATCH_INTERVAL_MS") or 5.0)
+    ACTOR_IDLE_TIMEOUT = float(os.getenv("ACTOR_IDLE_TIMEOUT") or 5.0)
+    BULK_CHUNK_SIZE = int(os.getenv("BULK_CHUNK_SIZE") or 100)
+    LIST_CHUNK_SIZE = int(os.getenv("LIST_CHUNK_SIZE") or 500)
+    INGEST_CHUNK_SIZE = int(os.getenv("INGEST_CHUNK_SIZE") or 5000)
+    RETURN_REPRESENTATION = os.getenv("RETURN_REPRESENTATION") == "1"
+    HTTP_CACHE_MAX_AGE = int(os.getenv("HTTP_CACHE_MAX_AGE") or 1)
     SWAGGER = {"title": os.getenv("SWAGGER_TITLE") or "Allocation Service"}
 
 
@@ -82,3 +82,15 @@ class UpdateProduct(Command):
 @dataclass
 class DiscardProduct(Command):
     sku_id: UUID
+
+
+@dataclass
+class RebuildAllocationsView(Command):
+    """Rebuilds allocations_view from the allocations of all batches."""
+
+
+@dataclass
+class ArchiveDiscarded(Command):
+    """Moves discarded rows to the archive tables, chunk_size rows at a time."""
+
+    chunk_size: int = 1000
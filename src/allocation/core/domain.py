@@ -8,6 +8,7 @@ from allocation.core.events import (
     OrderItemCreated,
     OrderItemDeallocated,
     OrderItemDiscarded,
+    OrderItemsDeallocated,
     OutOfStock,
     ProductCreated,
 )
@@ -113,7 +114,7 @@ class Product:
         self.version_number = 0
         self.discarded = discarded
 
-        self.events.append(ProductCreated(sku.uuid))
+        self.events.append(ProductCreated(sku.uuid, sku.name))
 
     def __eq__(self, other):
         if self.sku == other.sku:
@@ -143,7 +144,9 @@ class Product:
     def register_order_item(self, order_item: OrderItem) -> None:
         if self.sku == order_item.sku:
             self.order_items.add(order_item)
-            self.events.append(OrderItemCreated(self.sku.uuid, order_item.quantity))
+            self.events.append(
+                OrderItemCreated(self.sku.uuid, order_item.quantity, order_item.uuid)
+            )
             self._increment_version()
         else:
             raise NonMatchingSKU(
@@ -162,11 +165,9 @@ class Product:
                 f"The Order Item {order_item} does not match the Product SKU."
             )
 
-    # noinspection PyMethodMayBeStatic
     def deregister_batch(self, batch: Batch) -> None:
-        for o in iter(batch.allocated_order_items):
-            batch.deallocate_available_quantity(o)
-        batch.discarded = True
+        self._deregister_batches([batch])
+        self._increment_version()
 
     def allocate(self, order_item: OrderItem) -> Batch:
         if order_item not in self.order_items:
@@ -178,7 +179,9 @@ class Product:
                 if batch.can_allocate(order_item)
             )
             batch.allocate_available_quantity(order_item)
-            self.events.append(OrderItemAllocated(self.sku.uuid, order_item.uuid))
+            self.events.append(
+                OrderItemAllocated(self.sku.uuid, order_item.uuid, batch.uuid)
+            )
             self._increment_version()
             return batch
         except StopIteration:
@@ -192,17 +195,45 @@ class Product:
             batch.deallocate_available_quantity(order_item)
             self.events.append(
                 OrderItemDeallocated(
-                    self.sku.uuid, order_item.uuid, order_item.quantity
+                    self.sku.uuid, order_item.uuid, order_item.quantity, batch.uuid
                 )
             )
+        self._increment_version()
         return batch
 
+    def change_order_item_quantity(self, order_item_id, new_quantity) -> OrderItem:
+        order_item = next(oi for oi in self.order_items if oi.uuid == order_item_id)
+        order_item.quantity = new_quantity
+        self._increment_version()
+        return order_item
+
+    def rename(self, name: str) -> None:
+        self.sku.name = name
+        self._increment_version()
+
     def discard(self) -> None:
+        self._deregister_batches([b for b in self.batches if not b.discarded])
+        for order_item in self.order_items:
+            order_item.discarded = True
+        self.sku.discarded = True
         self.discarded = True
+        self._increment_version()
 
     def _increment_version(self) -> None:
         self.version_number += 1
 
+    def _deregister_batches(self, batches: List[Batch]) -> None:
+        """Discards the batches, recording a single OrderItemsDeallocated of all of
+        their allocations."""
+        allocations = []
+        for batch in batches:
+            for o in list(batch.allocated_order_items):
+                batch.deallocate_available_quantity(o)
+                allocations.append((o.uuid, o.quantity, batch.uuid))
+            batch.discarded = True
+        if allocations:
+            self.events.append(OrderItemsDeallocated(self.sku.uuid, allocations))
+
 
 def create_sku(name) -> SKU:
     return SKU(uuid4(), False, name)
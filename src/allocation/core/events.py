@@ -1,5 +1,6 @@
-from dataclasses import asdict, dataclass, field
-from typing import Dict
+from dataclasses import asdict, dataclass, field, fields
+from datetime import date
+from typing import Dict, List, Optional, Tuple, get_type_hints
 from uuid import UUID, uuid4
 
 
@@ -14,6 +15,23 @@ class Event:
     def to_dict(self) -> Dict:
         return {**{"event": self.cname}, **asdict(self)}
 
+    @staticmethod
+    def from_dict(data: Dict) -> "Event":
+        """Rebuilds an Event from to_dict, with its UUIDs and dates given as strings."""
+        cls = next(c for c in Event.__subclasses__() if c.__name__ == data["event"])
+        hints = get_type_hints(cls)
+        values = {}
+        for f in fields(cls):
+            value = data.get(f.name)
+            if isinstance(value, str) and hints[f.name] in (UUID, Optional[UUID]):
+                value = UUID(value)
+            elif isinstance(value, str) and hints[f.name] in (date, Optional[date]):
+                value = date.fromisoformat(value)
+            values[f.name] = value
+        event = cls(**{f.name: values[f.name] for f in fields(cls) if f.init})
+        event.uuid = values["uuid"]
+        return event
+
 
 @dataclass
 class OutOfStock(Event):
@@ -23,6 +41,18 @@ class OutOfStock(Event):
 @dataclass
 class ProductCreated(Event):
     sku_id: UUID
+    name: Optional[str] = None
+
+
+@dataclass
+class ProductRenamed(Event):
+    sku_id: UUID
+    name: str
+
+
+@dataclass
+class ProductDiscarded(Event):
+    sku_id: UUID
 
 
 # noinspection DuplicatedCode
@@ -30,6 +60,14 @@ class ProductCreated(Event):
 class OrderItemCreated(Event):
     sku_id: UUID
     quantity: int
+    order_item_id: Optional[UUID] = None
+
+
+@dataclass
+class OrderItemQuantityChanged(Event):
+    sku_id: UUID
+    order_item_id: UUID
+    quantity: int
 
 
 @dataclass
@@ -48,6 +86,16 @@ class BatchDiscarded(Event):
 class OrderItemAllocated(Event):
     sku_id: UUID
     order_item_id: UUID
+    batch_id: Optional[UUID] = None
+
+
+@dataclass
+class OrderItemsDeallocated(Event):
+    """Order items deallocated together from discarded batches of a Product, as
+    (order_item_id, quantity, batch_id) triples."""
+
+    sku_id: UUID
+    allocations: List[Tuple[UUID, int, UUID]]
 
 
 @dataclass
@@ -55,6 +103,7 @@ class BatchCreated(Event):
     sku_id: UUID
     batch_id: UUID
     quantity: int
+    eta: Optional[date] = None
 
 
 @dataclass
@@ -68,3 +117,4 @@ class OrderItemDeallocated(Event):
     sku_id: UUID
     order_item_id: UUID
     quantity: int
+    batch_id: Optional[UUID] = None
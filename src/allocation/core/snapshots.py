@@ -0,0 +1,84 @@
+import datetime
+from typing import Dict, Optional
+from uuid import UUID
+
+from allocation.core import domain
+
+
+def dump(product: domain.Product) -> Dict:
+    """Returns a compact, JSON compatible snapshot of the Product aggregate.
+
+    Discarded batches and order items are left out, like when loading the Product."""
+    sku = product.sku
+    batches = [b for b in product.batches if not b.discarded]
+    order_items = {
+        oi.uuid: (oi, True) for oi in product.order_items if not oi.discarded
+    }
+    for batch in batches:
+        for oi in batch.allocated_order_items:
+            order_items.setdefault(oi.uuid, (oi, False))
+    return {
+        "sku": [sku.uuid.hex, sku.name, bool(sku.discarded)],
+        "version_number": product.version_number,
+        "discarded": bool(product.discarded),
+        "order_items": [
+            [oi.uuid.hex, oi.quantity, bool(oi.discarded), registered]
+            for oi, registered in order_items.values()
+        ],
+        "batches": [
+            [
+                b.uuid.hex,
+                b.quantity,
+                b.allocated_quantity,
+                _dump_date(b.eta),
+                bool(b.discarded),
+                [oi.uuid.hex for oi in b.allocated_order_items],
+            ]
+            for b in batches
+        ],
+    }
+
+
+def load(data: Dict) -> domain.Product:
+    """Rebuilds a Product aggregate from a snapshot created by dump."""
+    sku_id, name, sku_discarded = data["sku"]
+    sku = domain.SKU(uuid=UUID(sku_id), discarded=sku_discarded, name=name)
+
+    order_items, registered = {}, set()
+    for uuid, quantity, discarded, is_registered in data["order_items"]:
+        order_item = domain.OrderItem(
+            uuid=UUID(uuid), discarded=discarded, sku=sku, quantity=quantity
+        )
+        order_items[uuid] = order_item
+        if is_registered:
+            registered.add(order_item)
+
+    batches = set()
+    for uuid, quantity, allocated, eta, discarded, allocations in data["batches"]:
+        batch = domain.Batch(
+            uuid=UUID(uuid),
+            discarded=discarded,
+            sku=sku,
+            quantity=quantity,
+            allocated_order_items={order_items[oi] for oi in allocations},
+            allocated_quantity=allocated,
+            eta=_load_date(eta),
+        )
+        batches.add(batch)
+
+    product = domain.Product(
+        sku, order_items=registered, batches=batches, discarded=data["discarded"]
+    )
+    product.version_number = data["version_number"]
+    product.events.clear()
+    return product
+
+
+def _dump_date(value: Optional[datetime.date]) -> Optional[str]:
+    if isinstance(value, datetime.datetime):
+        value = value.date()
+    return value.isoformat() if value else None
+
+
+def _load_date(value: Optional[str]) -> Optional[datetime.date]:
+    return datetime.date.fromisoformat(value) if value else None
@@ -0,0 +1,181 @@
+"""Event streams of Product aggregates, replayed on top of their snapshots.
+
+The domain does not emit an event for every change of a Product, so the events of a
+stream are derived from the snapshots of the Product before and after a change, as
+created by allocation.core.snapshots.dump."""
+from datetime import date
+from typing import Dict, Iterable, List, Optional
+from uuid import UUID
+
+from allocation.core.events import (
+    BatchCreated,
+    BatchDiscarded,
+    BatchQuantityChanged,
+    Event,
+    OrderItemAllocated,
+    OrderItemCreated,
+    OrderItemDeallocated,
+    OrderItemDiscarded,
+    OrderItemQuantityChanged,
+    ProductCreated,
+    ProductDiscarded,
+    ProductRenamed,
+)
+
+
+def changes(before: Optional[Dict], after: Dict) -> List[Event]:
+    """Returns the events that turn the snapshot before into the snapshot after, or
+    that create it if before is None."""
+    sku_id = UUID(after["sku"][0])
+    new = _index(after)
+    events: List[Event] = []
+    if before is None:
+        events.append(ProductCreated(sku_id, after["sku"][1]))
+        old = _index(replay(None, events))
+    else:
+        old = _index(before)
+        if old["sku"][1] != new["sku"][1]:
+            events.append(ProductRenamed(sku_id, new["sku"][1]))
+
+    for uuid, (quantity, _, _) in new["order_items"].items():
+        previous = old["order_items"].get(uuid)
+        if previous is None:
+            events.append(OrderItemCreated(sku_id, quantity, UUID(uuid)))
+        elif previous[0] != quantity:
+            events.append(OrderItemQuantityChanged(sku_id, UUID(uuid), quantity))
+    for uuid, (quantity, _, eta, _, _) in new["batches"].items():
+        previous = old["batches"].get(uuid)
+        if previous is None:
+            eta = date.fromisoformat(eta) if eta else None
+            events.append(BatchCreated(sku_id, UUID(uuid), quantity, eta))
+        elif previous[0] != quantity:
+            events.append(BatchQuantityChanged(UUID(uuid), quantity))
+
+    for uuid, batch in old["batches"].items():
+        allocations = new["batches"][uuid][4] if uuid in new["batches"] else set()
+        for order_item in sorted(batch[4] - allocations):
+            current = new["order_items"].get(order_item)
+            quantity = (current or old["order_items"][order_item])[0]
+            events.append(
+                OrderItemDeallocated(sku_id, UUID(order_item), quantity, UUID(uuid))
+            )
+    for uuid, batch in new["batches"].items():
+        allocations = old["batches"][uuid][4] if uuid in old["batches"] else set()
+        for order_item in sorted(batch[4] - allocations):
+            events.append(OrderItemAllocated(sku_id, UUID(order_item), UUID(uuid)))
+
+    for uuid, (_, discarded, registered) in old["order_items"].items():
+        current = new["order_items"].get(uuid)
+        if registered and not discarded and (current is None or not current[2]):
+            events.append(OrderItemDiscarded(sku_id, UUID(uuid)))
+    for uuid in old["batches"].keys() - new["batches"].keys():
+        events.append(BatchDiscarded(sku_id, UUID(uuid)))
+    if after["discarded"] and not old["discarded"]:
+        events.append(ProductDiscarded(sku_id))
+    return events
+
+
+def replay(
+    snapshot: Optional[Dict], events: Iterable[Event], version_number: int = None
+) -> Dict:
+    """Applies events to a snapshot, or to an empty stream if snapshot is None, and
+    returns the resulting snapshot.
+
+    Events do not carry the version_number of the Product, which is kept from the
+    snapshot unless provided."""
+    state = _index(snapshot) if snapshot is not None else None
+    for event in events:
+        state = _apply(state, event)
+    if version_number is not None:
+        state["version_number"] = version_number
+    return _dump(state)
+
+
+def same(a: Dict, b: Dict) -> bool:
+    """Returns whether two snapshots describe the same Product state, regardless of
+    the order of their batches, order items and allocations."""
+    return _index(a) == _index(b)
+
+
+def _apply(state: Optional[Dict], event: Event) -> Dict:
+    if isinstance(event, ProductCreated):
+        return {
+            "sku": [event.sku_id.hex, event.name, False],
+            "version_number": 0,
+            "discarded": False,
+            "order_items": {},
+            "batches": {},
+        }
+    order_items, batches = state["order_items"], state["batches"]
+    if isinstance(event, ProductRenamed):
+        state["sku"][1] = event.name
+    elif isinstance(event, ProductDiscarded):
+        state["discarded"] = True
+    elif isinstance(event, OrderItemCreated):
+        order_items[event.order_item_id.hex] = [event.quantity, False, True]
+    elif isinstance(event, OrderItemQuantityChanged):
+        order_items[event.order_item_id.hex][0] = event.quantity
+    elif isinstance(event, OrderItemDiscarded):
+        order_items[event.order_item_id.hex][1:] = [True, False]
+    elif isinstance(event, BatchCreated):
+        eta = event.eta.isoformat() if event.eta else None
+        batches[event.batch_id.hex] = [event.quantity, 0, eta, False, set()]
+    elif isinstance(event, BatchQuantityChanged):
+        batches[event.batch_id.hex][0] = event.quantity
+    elif isinstance(event, BatchDiscarded):
+        batches[event.batch_id.hex][3] = True
+    elif isinstance(event, OrderItemAllocated):
+        batch = batches[event.batch_id.hex]
+        batch[1] += order_items[event.order_item_id.hex][0]
+        batch[4].add(event.order_item_id.hex)
+    elif isinstance(event, OrderItemDeallocated):
+        batch = batches[event.batch_id.hex]
+        batch[1] -= event.quantity
+        batch[4].discard(event.order_item_id.hex)
+    return state
+
+
+def _index(snapshot: Dict) -> Dict:
+    """Returns the state of a snapshot with its order items and batches by id."""
+    return {
+        "sku": list(snapshot["sku"]),
+        "version_number": snapshot["version_number"],
+        "discarded": snapshot["discarded"],
+        "order_items": {
+            uuid: [quantity, discarded, registered]
+            for uuid, quantity, discarded, registered in snapshot["order_items"]
+        },
+        "batches": {
+            uuid: [quantity, allocated, eta, discarded, set(allocations)]
+            for uuid, quantity, allocated, eta, discarded, allocations in snapshot[
+                "batches"
+            ]
+        },
+    }
+
+
+def _dump(state: Dict) -> Dict:
+    """Returns the snapshot of a state, leaving out what snapshots.dump leaves out:
+    discarded batches and order items neither registered nor allocated."""
+    batches = {uuid: b for uuid, b in state["batches"].items() if not b[3]}
+    allocated = set().union(*(b[4] for b in batches.values()))
+    return {
+        "sku": list(state["sku"]),
+        "version_number": state["version_number"],
+        "discarded": state["discarded"],
+        "order_items": [
+            [uuid, quantity, discarded, registered and not discarded]
+            for uuid, (quantity, discarded, registered) in state["order_items"].items()
+            if (registered and not discarded) or uuid in allocated
+        ],
+        "batches": [
+            [uuid, quantity, allocated_quantity, eta, discarded, sorted(allocations)]
+            for uuid, (
+                quantity,
+                allocated_quantity,
+                eta,
+                discarded,
+                allocations,
+            ) in batches.items()
+        ],
+    }
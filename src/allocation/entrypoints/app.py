@@ -1,14 +1,44 @@
+import functools
+import json
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
+from uuid import UUID
+
 import flasgger
 import marshmallow as ma
+import orjson
 from apispec.ext.marshmallow import MarshmallowPlugin
 from apispec_webframeworks.flask import FlaskPlugin
-from flask import Blueprint, Flask, jsonify, redirect, request, url_for
+from flask import (
+    Blueprint,
+    Flask,
+    Response,
+    abort,
+    current_app,
+    jsonify,
+    redirect,
+    request,
+    url_for,
+)
 
 import allocation.repositories
-from allocation import config, messagebus, services
+from allocation import config, messagebus, services, views
 from allocation.core import commands, domain
 from allocation.entrypoints import serializers
-from allocation.unit_of_work import UnitOfWork
+from allocation.interfaces.cache import product_cache, read_model_cache
+from allocation.interfaces.database.db import statement_cache
+from allocation.interfaces.leases import LeaseTimeout, StaleLease, sku_leases
+from allocation.unit_of_work import create_unit_of_work
 
 
 def create_app() -> Flask:
@@ -32,6 +62,157 @@ spec = flasgger.APISpec(
 bp = Blueprint("api", __name__)
 
 
+ORJSON_OPTIONS = orjson.OPT_SORT_KEYS | orjson.OPT_APPEND_NEWLINE
+NDJSON_MIMETYPE = "application/x-ndjson"
+STREAM_BUFFER_SIZE = 64 * 1024
+
+
+def json_response(data, status: int = 200) -> Response:
+    """Returns data as JSON response.
+
+    Uses orjson when ORJSON_RESPONSES is enabled, which produces the same bytes as
+    jsonify for ASCII payloads."""
+    if not current_app.config["ORJSON_RESPONSES"]:
+        response = jsonify(data)
+        response.status_code = status
+        return response
+    return current_app.response_class(
+        orjson.dumps(data, option=ORJSON_OPTIONS),
+        status=status,
+        mimetype=current_app.config["JSONIFY_MIMETYPE"],
+    )
+
+
+def stream_response(items: Iterable[Dict]) -> Response:
+    """Streams items as JSON array, or as newline delimited JSON if the client asks for it.
+
+    Items are encoded one at a time and written in chunks of about STREAM_BUFFER_SIZE
+    bytes, so the response is never held in memory as a whole."""
+    json_mimetype = current_app.config["JSONIFY_MIMETYPE"]
+    mimetype = request.accept_mimetypes.best_match([json_mimetype, NDJSON_MIMETYPE])
+    ndjson = mimetype == NDJSON_MIMETYPE
+    if current_app.config["ORJSON_RESPONSES"]:
+        encode = functools.partial(orjson.dumps, option=orjson.OPT_SORT_KEYS)
+    else:
+        encode = _encode_json
+    chunks = _encode_chunks(items, encode, ndjson)
+    return current_app.response_class(
+        chunks, mimetype=NDJSON_MIMETYPE if ndjson else json_mimetype
+    )
+
+
+def _encode_json(item: Dict) -> bytes:
+    return json.dumps(item, sort_keys=True).encode()
+
+
+def _encode_chunks(
+    items: Iterable[Dict], encode: Callable[[Dict], bytes], ndjson: bool
+) -> Iterator[bytes]:
+    start, separator, end = (b"", b"\n", b"\n") if ndjson else (b"[", b",", b"]\n")
+    buffer, empty = bytearray(start), True
+    for item in items:
+        if not empty:
+            buffer += separator
+        buffer += encode(item)
+        empty = False
+        if len(buffer) >= STREAM_BUFFER_SIZE:
+            yield bytes(buffer)
+            buffer.clear()
+    if not (ndjson and empty):
+        buffer += end
+    yield bytes(buffer)
+
+
+def prefers_representation() -> bool:
+    """Returns whether to answer write requests with the affected entity.
+
+    Clients choose with the Prefer header, return=representation or return=minimal,
+    otherwise RETURN_REPRESENTATION applies. Minimal responses redirect to the entity."""
+    preferences = {
+        preference.split(";", 1)[0].strip().lower()
+        for preference in request.headers.get("Prefer", "").split(",")
+    }
+    if "return=representation" in preferences:
+        return True
+    if "return=minimal" in preferences:
+        return False
+    return current_app.config["RETURN_REPRESENTATION"]
+
+
+def representation_response(
+    data, location: str, status: int = 200, etag: Optional[str] = None
+) -> Response:
+    """Returns the entity affected by a write request, instead of a redirect to it."""
+    response = json_response(data, status)
+    response.headers["Content-Location"] = location
+    response.headers["Preference-Applied"] = "return=representation"
+    if status == 201:
+        response.headers["Location"] = location
+    if etag is not None:
+        response.set_etag(etag)
+    return response
+
+
+def dump_product_part(sku_id: UUID, dump: Callable[[domain.Product], Any]) -> Any:
+    """Returns the representation dump returns for the Product of a SKU a command
+    changed, or aborts with 404 if dump returns None as the entity does not exist.
+
+    The unit of work of the command is closed by then, and the command may have been
+    handled by the actor of the SKU, so the Product is loaded again and serialized
+    before its unit of work closes. A Product discarded meanwhile raises InvalidSKU."""
+    with create_unit_of_work() as uow:
+        representation = dump(uow.products.get(sku_id))
+        if representation is None:
+            abort(404)
+        return representation
+
+
+def dump_order_item_of(order_item_id: UUID) -> Callable[[domain.Product], Any]:
+    def dump(product: domain.Product) -> Optional[Dict]:
+        order_items = (oi for oi in product.order_items if oi.uuid == order_item_id)
+        order_item = next(order_items, None)
+        return None if order_item is None else serializers.dump_order_item(order_item)
+
+    return dump
+
+
+def bulk_response(
+    cmds: Sequence[commands.Command], results: List[Union[UUID, Exception]], key: str
+) -> Response:
+    """Returns the result of every row of a bulk request in the order of the request.
+
+    Rows are reported with the HTTP status they would have received from the single
+    row endpoint. Rows whose chunk failed to commit are reported with status 500 and
+    were not created, the other rows were."""
+
+    def result(cmd: commands.Command, uuid: Union[UUID, Exception]) -> Dict:
+        if isinstance(uuid, allocation.repositories.InvalidSKU):
+            return {
+                "status": 404,
+                "error": f"The SKU with uuid {cmd.sku_id} does not exist.",
+            }
+        if isinstance(uuid, Exception):
+            return {"status": 500, "error": str(uuid)}
+        return {"status": 201, key: str(uuid)}
+
+    return json_response([result(cmd, uuid) for cmd, uuid in zip(cmds, results)])
+
+
+def conditional_response(etag: str, loader: Callable[[], Dict]) -> Response:
+    """Returns the loaded representation tagged with the provided ETag.
+
+    Answers with 304 Not Modified without calling the loader, if the client already
+    holds the current representation."""
+    if request.if_none_match.contains(etag):
+        response = current_app.response_class(status=304)
+    else:
+        response = json_response(loader())
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = current_app.config["HTTP_CACHE_MAX_AGE"]
+    return response
+
+
 @bp.errorhandler(ma.ValidationError)
 def handle_validation_error(e: ma.ValidationError):
     """Handles marshmallow ValidationError.
@@ -48,11 +229,41 @@ def handle_validator_error(e: allocation.repositories.InvalidSKU):
     return jsonify(e.args), 404
 
 
+@bp.errorhandler(LeaseTimeout)
+@bp.errorhandler(StaleLease)
+def handle_lease_error(e: Exception):
+    """Handles LeaseTimeout and StaleLease.
+
+    Returns 503 HTTP Response, since the command can be retried once the SKU is free."""
+    return jsonify(e.args), 503
+
+
 @bp.route("/", methods=["GET", "POST"])
 def index():
     return redirect("/apidocs/")
 
 
+@bp.route("/metrics", methods=["GET"])
+def metrics():
+    """Returns the counters of the worker serving the request.
+    ---
+    responses:
+      200:
+        description: OK
+    tags:
+      - monitoring
+    """
+    return jsonify(
+        {
+            "product_cache": product_cache.stats(),
+            "read_model_cache": read_model_cache.stats(),
+            "statement_cache": statement_cache.stats(),
+            "sku_leases": sku_leases.stats() if sku_leases else None,
+            "product_actors": messagebus.ACTORS.stats() if messagebus.ACTORS else None,
+        }
+    )
+
+
 @bp.route("/allocate", methods=["POST"])
 def allocate():
     """Allocates an order item to an available batch.
@@ -63,22 +274,53 @@ def allocate():
         required: true
         schema:
           $ref: '#/definitions/Allocate'
+      - in: header
+        name: Prefer
+        type: string
+        enum: ['return=minimal', 'return=representation']
     responses:
-      302:
+      200:
+        description: with Prefer return=representation
         schema:
           $ref: '#/definitions/OrderItem'
+      302:
+        description: redirect to the order item
     tags:
       - order items
     """
-    with serializers.Validate(serializers.Allocate(), request) as data:
-        cmd = commands.Allocate(**data)
-        messagebus.handle([cmd], UnitOfWork())
-        return redirect(url_for(".get_order_item", order_item_id=data["order_item_id"]))
+    representation = prefers_representation()
+    with serializers.Validate(serializers.Allocate, request, commands.Allocate) as cmd:
+        messagebus.handle([cmd], create_unit_of_work())
+        location = url_for(".get_order_item", order_item_id=cmd.order_item_id)
+        if not representation:
+            return redirect(location)
+        order_item = dump_product_part(
+            cmd.sku_id, dump_order_item_of(cmd.order_item_id)
+        )
+        return representation_response(order_item, location)
 
 
 @bp.route("/order_item/allocations/<uuid:order_item_id>", methods=["GET"])
-def get_allocations():
-    ...
+def get_allocations(order_item_id):
+    """Lists the batches an order item is allocated to.
+    ---
+    parameters:
+      - in: path
+        name: order_item_id
+        required: true
+        schema:
+          type: string
+    responses:
+      200:
+        schema:
+          type: 'array'
+          items:
+            $ref: '#/definitions/Allocation'
+    tags:
+      - order items
+    """
+    allocations = views.allocations(order_item_id, create_unit_of_work())
+    return json_response(serializers.dump_allocations(allocations))
 
 
 @bp.route("/order_item", methods=["POST"])
@@ -97,12 +339,43 @@ def create_order_item():
     tags:
      - order items
     """
-    with serializers.Validate(serializers.CreateOrderItem(), request) as data:
-        cmd = commands.CreateOrderItem(**data)
-        order_item_id = services.create_order_item(cmd, UnitOfWork())
+    with serializers.Validate(
+        serializers.CreateOrderItem, request, commands.CreateOrderItem
+    ) as cmd:
+        order_item_id = services.create_order_item(cmd, create_unit_of_work())
         return redirect(url_for("create_order_item", order_item_id=order_item_id))
 
 
+@bp.route("/order_items", methods=["POST"])
+def create_order_items():
+    """Creates order items in bulk.
+    ---
+    parameters:
+      - in: body
+        name: body
+        required: true
+        schema:
+          type: 'array'
+          items:
+            $ref: '#/definitions/CreateOrderItem'
+    responses:
+      200:
+        description: status and order_item_id or error of every row
+      400:
+        description: Bad Request
+    tags:
+     - order items
+    """
+    with serializers.Validate(
+        serializers.CreateOrderItem, request, commands.CreateOrderItem, many=True
+    ) as cmds:
+        chunk_size = current_app.config["BULK_CHUNK_SIZE"]
+        order_item_ids = services.create_order_items(
+            cmds, create_unit_of_work(), chunk_size
+        )
+        return bulk_response(cmds, order_item_ids, "order_item_id")
+
+
 @bp.route("/order_item/<uuid:order_item_id>", methods=["GET"])
 def get_order_item(order_item_id):
     """Gets an order item.
@@ -120,10 +393,10 @@ def get_order_item(order_item_id):
     tags:
       - order items
     """
-    with UnitOfWork() as uow:
+    with create_unit_of_work() as uow:
         order_items = uow.products.get_all_order_items()
         order_item = next(oi for oi in order_items if oi.uuid == order_item_id)
-        return jsonify(serializers.OrderItem().dump(order_item))
+        return json_response(serializers.dump_order_item(order_item))
 
 
 @bp.route("/order_item", methods=["PUT"])
@@ -136,17 +409,32 @@ def update_order_item():
         required: true
         schema:
           $ref: '#/definitions/UpdateOrderItem'
+      - in: header
+        name: Prefer
+        type: string
+        enum: ['return=minimal', 'return=representation']
     responses:
       200:
+        description: with Prefer return=representation
         schema:
           $ref: '#/definitions/OrderItem'
+      302:
+        description: redirect to the order item
     tags:
      - order items
     """
-    with serializers.Validate(serializers.UpdateOrderItem(), request) as data:
-        cmd = commands.UpdateOrderItem(**data)
-        services.update_order_item(cmd, UnitOfWork())
-        return redirect(url_for("get_order_item", order_item_id=data["order_item_id"]))
+    representation = prefers_representation()
+    with serializers.Validate(
+        serializers.UpdateOrderItem, request, commands.UpdateOrderItem
+    ) as cmd:
+        services.update_order_item(cmd, create_unit_of_work())
+        location = url_for(".get_order_item", order_item_id=cmd.order_item_id)
+        if not representation:
+            return redirect(location)
+        order_item = dump_product_part(
+            cmd.sku_id, dump_order_item_of(cmd.order_item_id)
+        )
+        return representation_response(order_item, location)
 
 
 @bp.route("/order_item", methods=["DELETE"])
@@ -165,9 +453,10 @@ def delete_order_item():
     tags:
      - order items
     """
-    with serializers.Validate(serializers.DiscardOrderItem(), request) as data:
-        cmd = commands.DiscardOrderItem(**data)
-        services.discard_order_item(cmd, UnitOfWork())
+    with serializers.Validate(
+        serializers.DiscardOrderItem, request, commands.DiscardOrderItem
+    ) as cmd:
+        services.discard_order_item(cmd, create_unit_of_work())
         return "OK", 200
 
 
@@ -181,18 +470,66 @@ def create_batch():
         required: true
         schema:
           $ref: '#/definitions/CreateBatch'
+      - in: header
+        name: Prefer
+        type: string
+        enum: ['return=minimal', 'return=representation']
     responses:
-      302:
+      201:
+        description: with Prefer return=representation
         schema:
           $ref: '#/definitions/Batch'
+      302:
+        description: redirect to the batch
     tags:
       - batches
     """
-    with serializers.Validate(serializers.CreateBatch(), request) as data:
-        cmd = commands.CreateBatch(**data)
-        batch_id = services.create_batch(cmd, UnitOfWork())
-        response = redirect(url_for(".get_batch", batch_id=batch_id))
-        return response
+    representation = prefers_representation()
+    with serializers.Validate(
+        serializers.CreateBatch, request, commands.CreateBatch
+    ) as cmd:
+        batch_id = services.create_batch(cmd, create_unit_of_work())
+        location = url_for(".get_batch", batch_id=batch_id)
+        if not representation:
+            return redirect(location)
+
+        def dump_batch(product: domain.Product) -> Optional[Tuple[Dict, str]]:
+            batch = next((b for b in product.batches if b.uuid == batch_id), None)
+            if batch is None:
+                return None
+            etag = f"{batch_id.hex}.{product.version_number}"
+            return serializers.dump_batch(batch), etag
+
+        batch, etag = dump_product_part(cmd.sku_id, dump_batch)
+        return representation_response(batch, location, status=201, etag=etag)
+
+
+@bp.route("/batches", methods=["POST"])
+def create_batches():
+    """Creates batches in bulk.
+    ---
+    parameters:
+      - in: body
+        name: body
+        required: true
+        schema:
+          type: 'array'
+          items:
+            $ref: '#/definitions/CreateBatch'
+    responses:
+      200:
+        description: status and batch_id or error of every row
+      400:
+        description: Bad Request
+    tags:
+      - batches
+    """
+    with serializers.Validate(
+        serializers.CreateBatch, request, commands.CreateBatch, many=True
+    ) as cmds:
+        chunk_size = current_app.config["BULK_CHUNK_SIZE"]
+        batch_ids = services.create_batches(cmds, create_unit_of_work(), chunk_size)
+        return bulk_response(cmds, batch_ids, "batch_id")
 
 
 @bp.route("/batch/<uuid:batch_id>", methods=["GET"])
@@ -210,13 +547,28 @@ def get_batch(batch_id):
         description: a batch to be returned
         schema:
           $ref: '#/definitions/Batch'
+      304:
+        description: Not Modified
     tags:
       - batches
     """
-    with UnitOfWork() as uow:
-        batches = uow.products.get_all_batches()
-        batch = next(b for b in batches if b.uuid == batch_id)
-        return jsonify(serializers.Batch().dump(batch))
+    with create_unit_of_work() as uow:
+        owner = uow.products.get_batch_owner(batch_id)
+        if owner is None:
+            abort(404)
+        sku_id, version_number = owner
+
+        def load_batch():
+            product = uow.products.get(sku_id)
+            batch = next(b for b in product.batches if b.uuid == batch_id)
+            return serializers.dump_batch(batch)
+
+        return conditional_response(
+            f"{batch_id.hex}.{version_number}",
+            lambda: read_model_cache.get_or_load(
+                f"batch:{batch_id}", version_number, load_batch, tag=sku_id
+            ),
+        )
 
 
 @bp.route("/batch/update_quantity", methods=["PUT"])
@@ -237,9 +589,10 @@ def update_batch_quantity():
     tags:
       - batches
     """
-    with serializers.Validate(serializers.CreateBatch(), request) as data:
-        cmd = commands.CreateBatch(**data)
-        batch_id = services.create_batch(cmd, UnitOfWork())
+    with serializers.Validate(
+        serializers.CreateBatch, request, commands.CreateBatch
+    ) as cmd:
+        batch_id = services.create_batch(cmd, create_unit_of_work())
         response = redirect(url_for(".get_batch", batch_id=batch_id))
         return response
 
@@ -254,18 +607,33 @@ def create_product():
         required: true
         schema:
           $ref: '#/definitions/CreateSKU'
+      - in: header
+        name: Prefer
+        type: string
+        enum: ['return=minimal', 'return=representation']
     responses:
-      302:
+      201:
+        description: with Prefer return=representation
         schema:
           $ref: '#/definitions/Product'
+      302:
+        description: redirect to the product
     tags:
       - products
     """
-    with serializers.Validate(serializers.CreateSKU(), request) as data:
+    representation = prefers_representation()
+    with serializers.Validate(serializers.CreateSKU, request) as data:
         sku = domain.create_sku(**data)
         cmd = commands.CreateProductCommand(sku)
-        sku_id = services.create_product(cmd, UnitOfWork())
-        return redirect(url_for(".get_product", sku_id=sku_id))
+        sku_id = services.create_product(cmd, create_unit_of_work())
+        location = url_for(".get_product", sku_id=sku_id)
+        if not representation:
+            return redirect(location)
+        product, etag = dump_product_part(
+            sku_id,
+            lambda p: (serializers.dump_product(p), f"{sku_id.hex}.{p.version_number}"),
+        )
+        return representation_response(product, location, status=201, etag=etag)
 
 
 @bp.route("/product/<uuid:sku_id>", methods=["GET"])
@@ -282,13 +650,108 @@ def get_product(sku_id):
       200:
         schema:
           $ref: '#/definitions/Product'
+      304:
+        description: Not Modified
     tags:
       - products
     """
-    with UnitOfWork() as uow:
-        product = uow.products.get(sku_id)
-        data = serializers.Product().dump(product)
-        return jsonify(data)
+    with create_unit_of_work() as uow:
+        version_number = uow.products.get_version(sku_id)
+        if version_number is None:
+            raise allocation.repositories.InvalidSKU(
+                f"The SKU with uuid {sku_id} does not exist."
+            )
+
+        def load_product():
+            return serializers.dump_product(uow.products.get(sku_id))
+
+        return conditional_response(
+            f"{sku_id.hex}.{version_number}",
+            lambda: read_model_cache.get_or_load(
+                f"product:{sku_id}", version_number, load_product, tag=sku_id
+            ),
+        )
+
+
+@bp.route("/product/<uuid:sku_id>/availability", methods=["GET"])
+def get_availability(sku_id):
+    """Gets the stock totals of a product.
+
+    Batches without ETA are in stock. With an ETA range only batches arriving within
+    the range are counted.
+    ---
+    parameters:
+      - in: path
+        name: sku_id
+        required: true
+        schema:
+          type: string
+      - in: query
+        name: eta_from
+        type: string
+        format: date
+      - in: query
+        name: eta_to
+        type: string
+        format: date
+    responses:
+      200:
+        schema:
+          $ref: '#/definitions/Availability'
+      404:
+        description: Not Found
+    tags:
+      - products
+    """
+    eta_range = serializers.get_schema(serializers.ETARange).load(request.args)
+    availability = views.availability(sku_id, create_unit_of_work(), **eta_range)
+    if availability is None:
+        raise allocation.repositories.InvalidSKU(
+            f"The SKU with uuid {sku_id} does not exist."
+        )
+    return json_response(serializers.dump_availability(availability))
+
+
+@bp.route("/stock", methods=["GET"])
+def get_stock():
+    """Lists the stock totals of all products ordered by SKU id.
+
+    Pass the sku_id of the last row received as after to fetch the next page.
+    ---
+    parameters:
+      - in: query
+        name: eta_from
+        type: string
+        format: date
+      - in: query
+        name: eta_to
+        type: string
+        format: date
+      - in: query
+        name: after
+        type: string
+        format: uuid
+      - in: query
+        name: limit
+        type: integer
+        minimum: 1
+    produces:
+      - application/json
+      - application/x-ndjson
+    responses:
+      200:
+        schema:
+          type: 'array'
+          items:
+            $ref: '#/definitions/Availability'
+      400:
+        description: Bad Request
+    tags:
+      - products
+    """
+    query = serializers.get_schema(serializers.StockQuery).load(request.args)
+    rows = views.stock(create_unit_of_work(), **query)
+    return stream_response(map(serializers.dump_availability, rows))
 
 
 @bp.route("/product", methods=["PUT"])
@@ -308,9 +771,10 @@ def update_product():
     tags:
       - products
     """
-    with serializers.Validate(serializers.UpdateProduct(), request) as data:
-        cmd = commands.UpdateProduct(**data)
-        product_id = services.update_product(cmd, UnitOfWork())
+    with serializers.Validate(
+        serializers.UpdateProduct, request, commands.UpdateProduct
+    ) as cmd:
+        product_id = services.update_product(cmd, create_unit_of_work())
         return product_id
 
 
@@ -330,44 +794,71 @@ def discard_product():
     tags:
       - products
     """
-    with serializers.Validate(serializers.DiscardProduct(), request) as data:
-        cmd = commands.DiscardProduct(**data)
-        services.discard_product(cmd, UnitOfWork())
+    with serializers.Validate(
+        serializers.DiscardProduct, request, commands.DiscardProduct
+    ) as cmd:
+        messagebus.handle([cmd], create_unit_of_work())
         return "OK", 200
 
 
 @bp.route("/products", methods=["GET"])
 def list_products():
-    """Lists all products.
+    """Lists products ordered by SKU id.
+
+    Pass the sku_id of the last product received as after to fetch the next page.
     ---
+    parameters:
+      - in: query
+        name: after
+        type: string
+        format: uuid
+      - in: query
+        name: limit
+        type: integer
+        minimum: 1
+    produces:
+      - application/json
+      - application/x-ndjson
     responses:
       200:
         schema:
           type: 'array'
           items:
             $ref: '#/definitions/Product'
+      400:
+        description: Bad Request
     tags:
       - products
     """
-    with UnitOfWork() as uow:
-        products = uow.products.list()
-        data = serializers.Product().dump(products, many=True)
-        return jsonify(data)
+    page = serializers.get_schema(serializers.Page).load(request.args)
+    chunk_size = current_app.config["LIST_CHUNK_SIZE"]
+
+    def generate():
+        with create_unit_of_work() as uow:
+            products = uow.products.iter_products(**page, chunk_size=chunk_size)
+            yield from map(serializers.dump_product, products)
+
+    return stream_response(generate())
 
 
 @bp.route("/sku/create", methods=["POST"])
 def create_sku():
     sku_name = serializers.CreateSKU().load(request.json)
-    with UnitOfWork() as uow:
+    with create_unit_of_work() as uow:
         sku = domain.create_sku(sku_name["name"])
         product = domain.create_product(sku)
         uow.products.add(product)
-        return jsonify(serializers.SKU().dump(sku))
+        return json_response(serializers.dump_sku(sku))
 
 
 @bp.route("/skus", methods=["GET", "POST"])
 def list_skus():
-    with UnitOfWork() as uow:
-        products = uow.products.list()
-        skus = [product.sku for product in products]
-        return jsonify(serializers.SKU(many=True).dump(skus))
+    page = serializers.get_schema(serializers.Page).load(request.args)
+    chunk_size = current_app.config["LIST_CHUNK_SIZE"]
+
+    def generate():
+        with create_unit_of_work() as uow:
+            skus = uow.products.iter_skus(**page, chunk_size=chunk_size)
+            yield from map(serializers.dump_sku, skus)
+
+    return stream_response(generate())
@@ -0,0 +1,91 @@
+"""Maintenance commands of the allocation service.
+
+Usage: python -m allocation.entrypoints.cli --help
+"""
+import sys
+
+import click
+
+from allocation import messagebus, views
+from allocation.core import commands
+from allocation.interfaces.database import shards
+from allocation.unit_of_work import create_unit_of_work
+
+
+@click.group()
+def cli():
+    """Maintenance commands of the allocation service."""
+
+
+@cli.command("rebuild-allocations-view")
+def rebuild_allocations_view():
+    """Rebuilds allocations_view from the allocations of all batches."""
+    (rows,) = messagebus.handle(
+        [commands.RebuildAllocationsView()], create_unit_of_work()
+    )
+    click.echo(f"Rebuilt allocations_view with {rows} rows.")
+
+
+@cli.command("check-allocations-view")
+@click.option("--repair", is_flag=True, help="Rebuild the view if it is inconsistent.")
+def check_allocations_view(repair: bool):
+    """Compares allocations_view with the allocations of all batches.
+
+    Exits with status 1 if the view is inconsistent and was not repaired."""
+    result = views.check_allocations(create_unit_of_work())
+    for kind, rows in result.items():
+        click.echo(f"{len(rows)} {kind} rows")
+        for row in rows:
+            click.echo(
+                f"  order_item {row.order_item_id} batch {row.batch_id} "
+                f"sku {row.sku_id}"
+            )
+    if not any(result.values()):
+        return
+    if repair:
+        rebuild_allocations_view.callback()
+    else:
+        sys.exit(1)
+
+
+@cli.command("archive-discarded")
+@click.option(
+    "--chunk-size", default=1000, show_default=True, help="Rows per transaction."
+)
+def archive_discarded(chunk_size: int):
+    """Moves discarded batches, order items, Products and SKUs to the archive tables."""
+    (moved,) = messagebus.handle(
+        [commands.ArchiveDiscarded(chunk_size)], create_unit_of_work()
+    )
+    for table, rows in moved.items():
+        click.echo(f"Archived {rows} {table} rows.")
+
+
+@cli.command("reshard")
+@click.option(
+    "--to", "urls", required=True, help="Comma separated name=url pairs of the shards."
+)
+@click.option(
+    "--chunk-size", default=500, show_default=True, help="Products per transaction."
+)
+def reshard(urls: str, chunk_size: int):
+    """Moves the Products of the shards in SHARDS, or of the main database if it is
+    empty, to their shard on a new ring.
+
+    Shards keeping their name must keep their url, and the main database is the shard
+    named main. Writes must be paused meanwhile."""
+    source = (
+        shards.ShardedDatabase.from_config()
+        if shards.sharded_database is not None
+        else shards.ShardedDatabase.from_main()
+    )
+    target = shards.ShardedDatabase(shards.parse_shards(urls))
+    moved = shards.reshard(source, target, chunk_size)
+    for (old, new), count in sorted(moved.items()):
+        click.echo(f"Moved {count} Products from {old} to {new}.")
+    source.dispose()
+    target.dispose()
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,175 @@
+"""Compiled fast paths for marshmallow schemas.
+
+Marshmallow resolves every field of every nested schema on each call. The functions
+below build plain Python functions from the declared schema fields once, which
+produce the same output as Schema.dump and Schema.load. Schemas using fields or hooks
+without a compiled equivalent fall back to the marshmallow implementation."""
+import datetime
+import uuid
+from typing import Any, Callable, Dict, List
+
+from flask_marshmallow import Schema
+from marshmallow import fields, missing
+from marshmallow.decorators import (
+    POST_DUMP,
+    POST_LOAD,
+    PRE_DUMP,
+    PRE_LOAD,
+    VALIDATES,
+    VALIDATES_SCHEMA,
+)
+
+
+class UnsupportedSchema(Exception):
+    pass
+
+
+class InvalidInput(Exception):
+    """Raised by compiled loaders for input they do not handle."""
+
+
+def compile_dump(schema: Schema) -> Callable[[Any], Dict]:
+    """Returns a function dumping a single object like schema.dump."""
+    try:
+        fast_dump = _compile_dump(schema)
+    except UnsupportedSchema:
+        return schema.dump
+
+    def dump(obj):
+        try:
+            return fast_dump(obj)
+        except AttributeError:
+            # marshmallow skips missing attributes, the compiled function does not.
+            return schema.dump(obj)
+
+    return dump
+
+
+def compile_dump_many(schema: Schema) -> Callable[[Any], List[Dict]]:
+    """Returns a function dumping an iterable of objects like schema.dump(many=True)."""
+    dump = compile_dump(schema)
+    return lambda objs: [dump(obj) for obj in objs]
+
+
+def _compile_dump(schema: Schema) -> Callable[[Any], Dict]:
+    if schema._has_processors(PRE_DUMP) or schema._has_processors(POST_DUMP):
+        raise UnsupportedSchema(f"{schema} uses dump processors.")
+
+    namespace = {"_isoformat": datetime.date.isoformat}
+    lines, items = [], []
+    for i, (field_name, field) in enumerate(schema.dump_fields.items()):
+        attribute = field.attribute or field_name
+        if not attribute.isidentifier():
+            raise UnsupportedSchema(f"{schema} uses nested attribute {attribute}.")
+        lines.append(f"    v{i} = obj.{attribute}")
+        value = _compile_field(field, f"v{i}", namespace)
+        items.append(f"        {field.data_key or field_name!r}: {value},")
+
+    source = "\n".join(["def dump(obj):", *lines, "    return {", *items, "    }"])
+    exec(compile(source, f"<compiled {type(schema).__name__}>", "exec"), namespace)
+    return namespace["dump"]
+
+
+def _compile_field(field: fields.Field, value: str, namespace: Dict) -> str:
+    """Returns an expression serializing value like field.serialize."""
+    if isinstance(field, fields.Nested):
+        name = f"_dump_{len(namespace)}"
+        namespace[name] = _compile_dump(field.schema)
+        if field.many:
+            return f"None if {value} is None else [{name}(o) for o in {value}]"
+        return f"None if {value} is None else {name}({value})"
+    if isinstance(field, fields.List):
+        item = _compile_field(field.inner, "i", namespace)
+        return f"None if {value} is None else [{item} for i in {value}]"
+    if isinstance(field, fields.String):
+        return f"None if {value} is None else str({value})"
+    if isinstance(field, fields.Integer) and not field.as_string:
+        return f"None if {value} is None else int({value})"
+    if isinstance(field, fields.Date) and field.format in (None, "iso", "iso8601"):
+        return f"None if {value} is None else _isoformat({value})"
+    raise UnsupportedSchema(f"{type(field).__name__} fields are not supported.")
+
+
+def compile_load(schema: Schema) -> Callable[[Any], Dict]:
+    """Returns a function loading a single object like schema.load.
+
+    The compiled function only accepts input in its canonical form (JSON strings for
+    UUIDs and ISO dates, integers for Integer fields) and raises InvalidInput for
+    anything else, including invalid input. Callers delegate such input to
+    schema.load, which either coerces it or raises the usual ValidationError.
+    Raises UnsupportedSchema if the schema cannot be compiled."""
+    hooks = (PRE_LOAD, POST_LOAD, VALIDATES, VALIDATES_SCHEMA)
+    if any(schema._has_processors(hook) for hook in hooks):
+        raise UnsupportedSchema(f"{schema} uses load processors.")
+
+    specs = []
+    for field_name, field in schema.load_fields.items():
+        if field.validators or field.load_default is not missing:
+            raise UnsupportedSchema(f"{schema} uses validators or defaults.")
+        specs.append(
+            (
+                field.data_key or field_name,
+                field.attribute or field_name,
+                field.required,
+                _compile_converter(field),
+            )
+        )
+    known = frozenset(key for key, *_ in specs)
+
+    def load(data):
+        if type(data) is not dict or not known.issuperset(data):
+            raise InvalidInput
+        result = {}
+        for key, attribute, required, convert in specs:
+            value = data.get(key, missing)
+            if value is not missing:
+                result[attribute] = convert(value)
+            elif required:
+                raise InvalidInput
+        return result
+
+    return load
+
+
+def _compile_converter(field: fields.Field) -> Callable[[Any], Any]:
+    """Returns a function deserializing canonical input like field.deserialize."""
+    if isinstance(field, fields.UUID):
+        return _load_uuid
+    if isinstance(field, fields.String):
+        return _load_str
+    if isinstance(field, fields.Integer) and not field.strict:
+        return _load_int
+    if isinstance(field, fields.Date) and field.format in (None, "iso", "iso8601"):
+        return _load_date
+    raise UnsupportedSchema(f"{type(field).__name__} fields are not supported.")
+
+
+def _load_uuid(value) -> uuid.UUID:
+    if type(value) is not str:
+        raise InvalidInput
+    try:
+        return uuid.UUID(value)
+    except ValueError as e:
+        raise InvalidInput from e
+
+
+def _load_str(value) -> str:
+    if type(value) is not str:
+        raise InvalidInput
+    return value
+
+
+def _load_int(value) -> int:
+    if type(value) is not int:
+        raise InvalidInput
+    return value
+
+
+def _load_date(value) -> datetime.date:
+    # marshmallow accepts YYYY-MM-DD with one or two digit months and days only.
+    if type(value) is not str or len(value) != 10 or value[4] + value[7] != "--":
+        raise InvalidInput
+    try:
+        return datetime.date.fromisoformat(value)
+    except ValueError as e:
+        raise InvalidInput from e
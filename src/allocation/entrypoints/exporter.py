@@ -0,0 +1,243 @@
+"""Consistent dump of all Products with their batches, order items and allocations.
+
+Reads every table in one read-only transaction, streaming a cursor per table ordered
+by Product, so memory does not grow with the size of the catalog. When Products are
+sharded, the Products of every shard are read in a transaction of its own and merged
+by sku_id. Writes NDJSON rows
+in the format of allocation.entrypoints.importer, which restores them, and optionally
+one Parquet file per row type, which requires pyarrow. Discarded rows are not
+exported.
+
+Usage: python -m allocation.entrypoints.exporter --help
+"""
+import heapq
+import os
+from contextlib import ExitStack, contextmanager
+from operator import itemgetter
+from typing import IO, Dict, Iterator, Optional, Sequence, Union
+
+import click
+import orjson
+from sqlalchemy import select
+from sqlalchemy.engine import Connection, Engine
+
+from allocation.interfaces.database import db, orm, shards
+
+ROW_TYPES = ("product", "batch", "order_item")
+
+
+@contextmanager
+def snapshot(engine: Engine) -> Iterator[Connection]:
+    """Yields a connection in a read-only transaction, which reads every statement
+    from the same snapshot of the database."""
+    with engine.connect() as connection:
+        if engine.dialect.name == "postgresql":
+            connection = connection.execution_options(
+                isolation_level="REPEATABLE READ", postgresql_readonly=True
+            )
+        with connection.begin():
+            if engine.dialect.name == "sqlite":
+                connection.exec_driver_sql("PRAGMA query_only = ON")
+            try:
+                yield connection
+            finally:
+                if engine.dialect.name == "sqlite":
+                    connection.exec_driver_sql("PRAGMA query_only = OFF")
+
+
+def _stream(connection: Connection, stmt, chunk_size: int) -> Iterator:
+    return iter(
+        connection.execution_options(stream_results=True)
+        .execute(stmt)
+        .yield_per(chunk_size)
+    )
+
+
+def export_rows(connection: Connection, chunk_size: int = 1000) -> Iterator[Dict]:
+    """Yields a product row followed by its batch and order item rows for every
+    Product, ordered by sku_id.
+
+    Merges a cursor per table, all ordered by Product, instead of querying the
+    children of every Product."""
+    products, skus, batches = orm.products, orm.skus, orm.batches
+    order_items, association = orm.order_items, orm.order_items_batches_association
+    product_rows = _stream(
+        connection,
+        select(
+            products.c._sku_id.label("sku_id"), skus.c.name, products.c.version_number
+        )
+        .join_from(products, skus, products.c._sku_id == skus.c.uuid)
+        .where(products.c.discarded.isnot(True))
+        .order_by(products.c._sku_id),
+        chunk_size,
+    )
+    children = {
+        "batch": _stream(
+            connection,
+            select(
+                batches.c._product_id.label("sku_id"),
+                batches.c.uuid,
+                batches.c.quantity,
+                batches.c.eta,
+            )
+            .where(batches.c._product_id.isnot(None), batches.c.discarded.isnot(True))
+            .order_by(batches.c._product_id, batches.c.uuid),
+            chunk_size,
+        ),
+        "order_item": _stream(
+            connection,
+            select(
+                order_items.c._product_id.label("sku_id"),
+                order_items.c.uuid,
+                order_items.c.quantity,
+                association.c.batches_id.label("batch_id"),
+            )
+            .outerjoin_from(
+                order_items,
+                association,
+                order_items.c.uuid == association.c.order_item_id,
+            )
+            .where(
+                order_items.c._product_id.isnot(None),
+                order_items.c.discarded.isnot(True),
+            )
+            .order_by(order_items.c._product_id, order_items.c.uuid),
+            chunk_size,
+        ),
+    }
+    pending = {kind: next(rows, None) for kind, rows in children.items()}
+    for product in product_rows:
+        sku_id = product.sku_id
+        yield {"type": "product", **product._asdict()}
+        for kind, rows in children.items():
+            # Rows of discarded Products sort between the exported ones and are skipped.
+            while pending[kind] is not None and pending[kind].sku_id <= sku_id:
+                if pending[kind].sku_id == sku_id:
+                    yield {"type": kind, **pending[kind]._asdict()}
+                pending[kind] = next(rows, None)
+
+
+def write_ndjson(rows: Iterator[Dict], file: IO[bytes]) -> Iterator[Dict]:
+    """Writes every row to file as a line of JSON and yields it on."""
+    # Column names of result rows are str subclasses, which orjson only accepts with
+    # OPT_NON_STR_KEYS.
+    option = orjson.OPT_APPEND_NEWLINE | orjson.OPT_NON_STR_KEYS
+    for row in rows:
+        file.write(orjson.dumps(row, option=option))
+        yield row
+
+
+def write_parquet(
+    rows: Iterator[Dict], directory: str, chunk_size: int = 10_000
+) -> Iterator[Dict]:
+    """Writes the rows of every type to a Parquet file in directory and yields them
+    on, flushing a row group every chunk_size rows of a type."""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise click.UsageError("Writing Parquet files requires pyarrow.") from e
+
+    schemas = {
+        "product": pa.schema(
+            [
+                ("sku_id", pa.string()),
+                ("name", pa.string()),
+                ("version_number", pa.int64()),
+            ]
+        ),
+        "batch": pa.schema(
+            [
+                ("sku_id", pa.string()),
+                ("uuid", pa.string()),
+                ("quantity", pa.int64()),
+                ("eta", pa.date32()),
+            ]
+        ),
+        "order_item": pa.schema(
+            [
+                ("sku_id", pa.string()),
+                ("uuid", pa.string()),
+                ("quantity", pa.int64()),
+                ("batch_id", pa.string()),
+            ]
+        ),
+    }
+    os.makedirs(directory, exist_ok=True)
+    writers = {
+        kind: pq.ParquetWriter(os.path.join(directory, f"{kind}.parquet"), schema)
+        for kind, schema in schemas.items()
+    }
+    buffers = {kind: [] for kind in ROW_TYPES}
+
+    def flush(kind: str) -> None:
+        columns = {
+            name: [row[name] for row in buffers[kind]] for name in schemas[kind].names
+        }
+        for name in ("sku_id", "uuid", "batch_id"):
+            if name in columns:
+                columns[name] = [None if v is None else str(v) for v in columns[name]]
+        writers[kind].write_table(pa.table(columns, schema=schemas[kind]))
+        buffers[kind].clear()
+
+    try:
+        for row in rows:
+            buffers[row["type"]].append(row)
+            if len(buffers[row["type"]]) >= chunk_size:
+                flush(row["type"])
+            yield row
+        for kind in ROW_TYPES:
+            if buffers[kind]:
+                flush(kind)
+    finally:
+        for writer in writers.values():
+            writer.close()
+
+
+def export(
+    engine: Union[Engine, Sequence[Engine]],
+    file: IO[bytes],
+    parquet: Optional[str] = None,
+    chunk_size: int = 1000,
+) -> Dict[str, int]:
+    """Writes all Products of a consistent snapshot of the database, or of every
+    shard, to file and returns the number of rows of every type."""
+    engines = [engine] if isinstance(engine, Engine) else engine
+    counts = dict.fromkeys(ROW_TYPES, 0)
+    with ExitStack() as stack:
+        connections = [stack.enter_context(snapshot(e)) for e in engines]
+        products = heapq.merge(
+            *(export_rows(c, chunk_size) for c in connections),
+            key=itemgetter("sku_id"),
+        )
+        rows = write_ndjson(products, file)
+        if parquet:
+            rows = write_parquet(rows, parquet)
+        for row in rows:
+            counts[row["type"]] += 1
+    return counts
+
+
+@click.command()
+@click.argument("output", type=click.File("wb"))
+@click.option(
+    "--parquet",
+    type=click.Path(file_okay=False),
+    help="Also write Parquet files to this directory.",
+)
+@click.option(
+    "--chunk-size", default=1000, show_default=True, help="Rows fetched at a time."
+)
+def exporter(output: IO[bytes], parquet: Optional[str], chunk_size: int):
+    """Exports all Products with their batches, order items and allocations to OUTPUT
+    as NDJSON, or to stdout if OUTPUT is -."""
+    sharded = shards.sharded_database
+    engines = list(sharded.engines.values()) if sharded is not None else db.engine
+    counts = export(engines, output, parquet, chunk_size)
+    click.echo(
+        ", ".join(f"{rows} {kind} rows" for kind, rows in counts.items()), err=True
+    )
+
+
+if __name__ == "__main__":
+    exporter()
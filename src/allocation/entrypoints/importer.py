@@ -0,0 +1,283 @@
+"""Offline loader of Products, batches and order items from CSV or NDJSON files.
+
+Every row has a type, product, batch or order_item, and the fields of the matching
+serializers schema: ImportProduct, ImportBatch or ImportOrderItem. The rows of a SKU
+must be contiguous, with exactly one product row, as the file is grouped by sku_id
+while streaming. Order items with a batch_id are allocated to that batch of their
+Product. Products are written with the bulk mode of ProductsRepo.add_all, a unit of
+work per chunk, and their events are not published. A chunk conflicting with the
+database, such as a SKU already imported or repeated further in the file, is retried
+Product by Product, and the rows of the conflicting SKUs are rejected.
+
+Files written by allocation.entrypoints.exporter restore the exported state, after
+which allocations_view is rebuilt with the rebuild-allocations-view command.
+
+Usage: python -m allocation.entrypoints.importer --help
+"""
+import csv
+import itertools
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+from uuid import uuid4
+
+import click
+import orjson
+from marshmallow import ValidationError
+from sqlalchemy.exc import IntegrityError
+
+from allocation.core import domain
+from allocation.entrypoints import serializers
+from allocation.unit_of_work import create_unit_of_work
+
+ROW_SCHEMAS = {
+    "product": serializers.ImportProduct,
+    "batch": serializers.ImportBatch,
+    "order_item": serializers.ImportOrderItem,
+}
+
+
+@dataclass
+class Row:
+    number: int
+    kind: Optional[str] = None
+    data: Any = None
+    error: Optional[str] = None
+
+
+@dataclass
+class Progress:
+    rows: int = 0
+    products: int = 0
+    rejected: int = 0
+    started: float = 0.0
+
+    def rows_per_second(self) -> float:
+        return self.rows / max(time.perf_counter() - self.started, 1e-9)
+
+
+class ImportFailed(Exception):
+    pass
+
+
+def read_records(path: str, file_format: str, skip: int = 0) -> Iterator[Tuple]:
+    """Yields the number and the raw record of every row after the first skip rows.
+
+    NDJSON records are the undecoded lines, so they can be parsed by other
+    processes. Blank lines are counted, but not yielded."""
+    with open(path, newline="", encoding="utf-8") as file:
+        records = csv.DictReader(file) if file_format == "csv" else file
+        for number, record in enumerate(records, start=1):
+            if number <= skip or file_format == "ndjson" and not record.strip():
+                continue
+            yield number, record
+
+
+def parse_record(file_format: str, record) -> Tuple[str, Dict]:
+    """Returns the type and the data of a raw record, validated with its schema."""
+    data = orjson.loads(record) if file_format == "ndjson" else record
+    if type(data) is not dict:
+        raise ValidationError("Rows must be objects.")
+    data = {k: v for k, v in data.items() if v not in ("", None)}
+    kind = data.pop("type", None)
+    if kind not in ROW_SCHEMAS:
+        raise ValidationError(f"Unknown row type {kind!r}.")
+    return kind, serializers.decode(ROW_SCHEMAS[kind], data)
+
+
+def parse_records(file_format: str, records: List[Tuple]) -> List[Row]:
+    rows = []
+    for number, record in records:
+        try:
+            rows.append(Row(number, *parse_record(file_format, record)))
+        except (ValidationError, orjson.JSONDecodeError) as e:
+            rows.append(Row(number, error=str(e)))
+    return rows
+
+
+def parse(
+    records: Iterable[Tuple],
+    file_format: str,
+    workers: int = 0,
+    chunk_size: int = 1000,
+) -> Iterator[Row]:
+    """Yields the parsed rows in file order, parsed by workers processes if any.
+
+    At most two chunks per worker are in flight, so memory does not grow with the
+    size of the file."""
+    chunks = iter(lambda: list(itertools.islice(records, chunk_size)), [])
+    if not workers:
+        for chunk in chunks:
+            yield from parse_records(file_format, chunk)
+        return
+
+    with ProcessPoolExecutor(workers) as executor:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(executor.submit(parse_records, file_format, chunk))
+            if len(pending) >= 2 * workers:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+
+def build_product(rows: List[Row]) -> domain.Product:
+    """Returns a new Product from the rows of its SKU."""
+    products = [row.data for row in rows if row.kind == "product"]
+    if len(products) != 1:
+        raise ImportFailed(f"Expected one product row, found {len(products)}.")
+    sku = domain.SKU(products[0]["sku_id"], False, products[0]["name"])
+    product = domain.create_product(sku)
+    product.version_number = products[0].get("version_number", 0)
+    batches, allocations = {}, []
+    for row in rows:
+        uuid = row.data.get("uuid") or uuid4()
+        if row.kind == "batch":
+            batches[uuid] = domain.Batch(
+                uuid, False, sku, row.data["quantity"], eta=row.data.get("eta")
+            )
+        elif row.kind == "order_item":
+            order_item = domain.OrderItem(uuid, False, sku, row.data["quantity"])
+            product.order_items.add(order_item)
+            if "batch_id" in row.data:
+                allocations.append((order_item, row.data["batch_id"]))
+    for order_item, batch_id in allocations:
+        if batch_id not in batches:
+            raise ImportFailed(f"Order item {order_item.uuid} has no batch {batch_id}.")
+        batches[batch_id].allocated_order_items.add(order_item)
+        batches[batch_id].allocated_quantity += order_item.quantity
+    product.batches.update(batches.values())
+    return product
+
+
+def group_products(
+    rows: Iterable[Row], report
+) -> Iterator[Tuple[int, int, domain.Product]]:
+    """Yields the numbers of the first and the last row and the Product of every run of
+    rows with the same sku_id. Invalid rows and SKUs are passed to report and
+    skipped."""
+
+    def valid_rows():
+        for row in rows:
+            if row.error is None:
+                yield row
+            else:
+                report(row.number, row.error)
+
+    for _, group in itertools.groupby(valid_rows(), lambda row: row.data["sku_id"]):
+        group = list(group)
+        try:
+            yield group[0].number, group[-1].number, build_product(group)
+        except ImportFailed as e:
+            report(group[0].number, str(e))
+
+
+def write(
+    products: Iterable[Tuple[int, int, domain.Product]],
+    chunk_size: int,
+    on_commit,
+    report,
+) -> None:
+    """Writes Products in bulk, committing every chunk_size Products, and passes the
+    number of the last row and of the Products of every committed chunk to
+    on_commit. Products conflicting with the database are passed to report."""
+    products = iter(products)
+    while chunk := list(itertools.islice(products, chunk_size)):
+        try:
+            write_chunk([p for *_, p in chunk])
+            written = len(chunk)
+        except IntegrityError:
+            written = 0
+            for first_row, _, product in chunk:
+                try:
+                    write_chunk([product])
+                    written += 1
+                except IntegrityError as e:
+                    report(first_row, f"SKU {product.sku_id} conflicts: {e.orig}")
+        on_commit(chunk[-1][1], written)
+
+
+def write_chunk(products: List[domain.Product]) -> None:
+    with create_unit_of_work() as uow:
+        uow.products.add_all(products, bulk=True)
+        uow.commit()
+
+
+def read_checkpoint(path: Optional[str], source: str) -> int:
+    """Returns the number of rows already imported from source."""
+    if not path or not os.path.exists(path):
+        return 0
+    with open(path) as file:
+        checkpoint = json.load(file)
+    if checkpoint["source"] != os.path.abspath(source):
+        raise click.UsageError(f"{path} is the checkpoint of {checkpoint['source']}.")
+    return checkpoint["rows"]
+
+
+def write_checkpoint(path: Optional[str], source: str, rows: int) -> None:
+    if not path:
+        return
+    with open(f"{path}.tmp", "w") as file:
+        json.dump({"source": os.path.abspath(source), "rows": rows}, file)
+    os.replace(f"{path}.tmp", path)
+
+
+@click.command()
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--format", "file_format", type=click.Choice(["csv", "ndjson"]))
+@click.option(
+    "--chunk-size", default=1000, show_default=True, help="Products per transaction."
+)
+@click.option(
+    "--workers", default=0, show_default=True, help="Processes parsing the rows."
+)
+@click.option(
+    "--checkpoint",
+    type=click.Path(dir_okay=False),
+    help="File recording the imported rows, to resume an interrupted import.",
+)
+def importer(
+    path: str,
+    file_format: Optional[str],
+    chunk_size: int,
+    workers: int,
+    checkpoint: Optional[str],
+):
+    """Imports Products with their batches and order items from PATH.
+
+    The format defaults to the extension of PATH. Exits with status 1 if rows were
+    rejected."""
+    file_format = file_format or ("csv" if path.endswith(".csv") else "ndjson")
+    skip = read_checkpoint(checkpoint, path)
+    progress = Progress(started=time.perf_counter())
+
+    def report(number: int, error: str) -> None:
+        progress.rejected += 1
+        click.echo(f"Row {number}: {error}", err=True)
+
+    def on_commit(last_row: int, products: int) -> None:
+        write_checkpoint(checkpoint, path, last_row)
+        progress.rows = last_row - skip
+        progress.products += products
+        click.echo(
+            f"{progress.rows} rows, {progress.products} products, "
+            f"{progress.rows_per_second():.0f} rows/s",
+            err=True,
+        )
+
+    rows = parse(read_records(path, file_format, skip), file_format, workers)
+    write(group_products(rows, report), chunk_size, on_commit, report)
+    click.echo(
+        f"Imported {progress.products} products, rejected {progress.rejected} rows."
+    )
+    if progress.rejected:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    importer()
@@ -1,10 +1,14 @@
+import functools
 import inspect
+from typing import Any, Callable, Dict, Optional, Type, Union
 
+import orjson
 from flask import Request, abort
 from flask_marshmallow import Schema
-from marshmallow import ValidationError, fields, post_load
+from marshmallow import ValidationError, fields, post_load, validate
 
 from allocation.core import domain
+from allocation.entrypoints import compiled
 
 
 class SKU(Schema):
@@ -72,11 +76,41 @@ class CreateBatch(Schema):
 class Product(Schema):
     sku = fields.Nested(SKU)
     sku_id = fields.UUID()
-    batches = fields.Nested(Batch)
-    order_items = fields.Nested(OrderItem)
+    batches = fields.List(fields.Nested(Batch))
+    order_items = fields.List(fields.Nested(OrderItem))
     version_number = fields.Integer()
 
 
+class Page(Schema):
+    after = fields.UUID()
+    limit = fields.Integer(validate=validate.Range(min=1))
+
+
+class ETARange(Schema):
+    eta_from = fields.Date()
+    eta_to = fields.Date()
+
+
+class StockQuery(Page, ETARange):
+    pass
+
+
+class Availability(Schema):
+    sku_id = fields.UUID()
+    batches = fields.Integer()
+    quantity = fields.Integer()
+    allocated_quantity = fields.Integer()
+    available_quantity = fields.Integer()
+    in_stock_quantity = fields.Integer()
+    earliest_eta = fields.Date()
+
+
+class Allocation(Schema):
+    order_item_id = fields.UUID()
+    batch_id = fields.UUID()
+    sku_id = fields.UUID()
+
+
 class UpdateProduct(Schema):
     sku_id = fields.UUID()
     name = fields.Str()
@@ -118,28 +152,118 @@ class DiscardProduct(Schema):
     sku_id = fields.UUID()
 
 
+class ImportProduct(Schema):
+    sku_id = fields.UUID(required=True)
+    name = fields.Str(required=True)
+    version_number = fields.Integer()
+
+
+class ImportBatch(Schema):
+    sku_id = fields.UUID(required=True)
+    uuid = fields.UUID()
+    quantity = fields.Integer(required=True)
+    eta = fields.Date()
+
+
+class ImportOrderItem(Schema):
+    sku_id = fields.UUID(required=True)
+    uuid = fields.UUID()
+    quantity = fields.Integer(required=True)
+    batch_id = fields.UUID()
+
+
 # All Schema definitions
 definitions = tuple(
     s for s in locals().values() if inspect.isclass(s) and issubclass(s, Schema)
 )
 
 
+dump_sku = compiled.compile_dump(SKU())
+dump_skus = compiled.compile_dump_many(SKU())
+dump_order_item = compiled.compile_dump(OrderItem())
+dump_batch = compiled.compile_dump(Batch())
+dump_product = compiled.compile_dump(Product())
+dump_products = compiled.compile_dump_many(Product())
+dump_availability = compiled.compile_dump(Availability())
+dump_allocations = compiled.compile_dump_many(Allocation())
+
+
+@functools.lru_cache(maxsize=None)
+def get_schema(schema_class: Type[Schema]) -> Schema:
+    """Returns a shared instance of the schema class."""
+    return schema_class()
+
+
+@functools.lru_cache(maxsize=None)
+def get_loader(schema_class: Type[Schema]) -> Optional[Callable[[Any], Dict]]:
+    """Returns the compiled loader of the schema class, if it can be compiled."""
+    try:
+        return compiled.compile_load(get_schema(schema_class))
+    except compiled.UnsupportedSchema:
+        return None
+
+
+def decode(
+    schema_class: Type[Schema],
+    data: Any,
+    command: Optional[Callable] = None,
+    many: Optional[bool] = False,
+) -> Any:
+    """Deserializes data with the schema and builds command instances from it.
+
+    Accepts a list of objects if many is True, a single object if many is False and
+    either if many is None. Input the compiled loader does not handle is passed on to
+    the schema, which raises the same ValidationError as before."""
+    many = type(data) is list if many is None else many
+    load = get_loader(schema_class)
+    try:
+        if load is None or many and type(data) is not list:
+            raise compiled.InvalidInput
+        loaded = [load(item) for item in data] if many else load(data)
+    except compiled.InvalidInput:
+        loaded = get_schema(schema_class).load(data, many=many)
+
+    if command is None:
+        return loaded
+    if many:
+        return [command(**item) for item in loaded]
+    return command(**loaded)
+
+
 class Validate:
     """Wrapper for Marshmallow validation.
 
     Uses the provided schema to perform validation. Returns the deserialized data on __enter__,
-    otherwise raises ValidationError."""
-
-    def __init__(self, schema: Schema, request: Request):
+    or command instances built from it if a command is provided, otherwise raises
+    ValidationError. Schema classes are decoded straight from the request body with a
+    shared, compiled schema."""
+
+    def __init__(
+        self,
+        schema: Union[Schema, Type[Schema]],
+        request: Request,
+        command: Optional[Callable] = None,
+        many: Optional[bool] = False,
+    ):
         self.schema = schema
         self.request = request
+        self.command = command
+        self.many = many
 
     def __enter__(self):
-        try:
+        if isinstance(self.schema, Schema):
             data = self.schema.load(self.request.json)
-            return data
-        except ValidationError as err:
-            raise err
+            return self.command(**data) if self.command else data
+        return decode(self.schema, self._read_json(), self.command, self.many)
+
+    def _read_json(self) -> Any:
+        """Parses the request body like Request.get_json."""
+        if not self.request.is_json:
+            return None
+        try:
+            return orjson.loads(self.request.get_data(cache=True))
+        except orjson.JSONDecodeError as e:
+            return self.request.on_json_loading_failed(e)
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         ...
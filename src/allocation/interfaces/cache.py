@@ -0,0 +1,236 @@
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, Optional, Tuple
+from uuid import uuid4
+
+import redis
+
+from allocation.config import get_config
+from allocation.interfaces.external_bus import RedisClient, create_redis_client
+
+logger = logging.getLogger(__name__)
+
+# Deletes the lock only if it is still held by the caller.
+RELEASE_LOCK_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+
+class ProductCache:
+    """Bounded, thread-safe LRU cache of Product snapshots.
+
+    Entries are stored together with the version_number of the snapshot, so readers
+    can validate them against the persistent storage before using them."""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._entries: "OrderedDict[Hashable, Tuple[int, Dict]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._entries
+
+    @property
+    def enabled(self) -> bool:
+        return self.maxsize > 0
+
+    def get(self, key: Hashable, version_number: int) -> Optional[Dict]:
+        """Returns the snapshot stored for key, if it matches the provided version."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version_number:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: Hashable, version_number: int, snapshot: Dict) -> None:
+        """Stores the snapshot, evicting the least recently used entry when full."""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._entries[key] = (version_number, snapshot)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key: Hashable) -> None:
+        """Removes the entry stored for key."""
+        with self._lock:
+            if self._entries.pop(key, None) is not None:
+                self.invalidations += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict:
+        """Returns the cache counters."""
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+
+class ReadModelCache:
+    """Redis backed cache of serialized read models shared by all workers.
+
+    Entries are tagged with the version_number of the Product they were built from and
+    expire after ttl seconds. Concurrent misses for the same key are collapsed with a
+    single-flight lock, so only one worker loads the entry from the database. Without a
+    client every lookup falls through to the loader."""
+
+    def __init__(
+        self,
+        client: Optional[RedisClient],
+        ttl: int = 300,
+        lock_timeout: float = 5.0,
+        wait_interval: float = 0.01,
+    ):
+        self.client = client
+        self.ttl = ttl
+        self.lock_timeout = lock_timeout
+        self.wait_interval = wait_interval
+        self.hits = 0
+        self.misses = 0
+        self.lock_waits = 0
+        self.errors = 0
+        self._release_lock = (
+            client.register_script(RELEASE_LOCK_SCRIPT) if client else None
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.client is not None
+
+    def get_or_load(
+        self,
+        key: str,
+        version_number: int,
+        loader: Callable[[], Dict],
+        tag: Optional[Hashable] = None,
+    ) -> Dict:
+        """Returns the cached entry for key or stores the result of the loader.
+
+        Entries stored with a tag are removed when the tag is invalidated."""
+        if not self.enabled:
+            return loader()
+        try:
+            return self._get_or_load(key, version_number, loader, tag)
+        except redis.RedisError:
+            logger.exception("Read model cache unavailable for key %s", key)
+            self.errors += 1
+            return loader()
+
+    def invalidate(self, tag: Hashable) -> None:
+        """Removes all entries stored with the provided tag."""
+        if not self.enabled:
+            return
+        tag_key = self._tag_key(tag)
+        keys = self.client.smembers(tag_key)
+        self.client.delete(tag_key, *keys)
+
+    def stats(self) -> Dict:
+        """Returns the cache counters."""
+        return {
+            "enabled": self.enabled,
+            "hits": self.hits,
+            "misses": self.misses,
+            "lock_waits": self.lock_waits,
+            "errors": self.errors,
+        }
+
+    def _get_or_load(self, key, version_number, loader, tag) -> Dict:
+        data = self._read(key, version_number)
+        if data is not None:
+            self.hits += 1
+            return data
+
+        lock_key, token = f"{key}:lock", uuid4().hex
+        lock_timeout_ms = int(self.lock_timeout * 1000)
+        deadline = time.monotonic() + self.lock_timeout
+        locked = self.client.set(lock_key, token, nx=True, px=lock_timeout_ms)
+        while not locked and time.monotonic() < deadline:
+            self.lock_waits += 1
+            time.sleep(self.wait_interval)
+            data = self._read(key, version_number)
+            if data is not None:
+                self.hits += 1
+                return data
+            locked = self.client.set(lock_key, token, nx=True, px=lock_timeout_ms)
+
+        # Once loaded, the data is returned even if Redis then fails, so that the
+        # loader never runs twice.
+        try:
+            self.misses += 1
+            data = loader()
+            self._cache_errors(key, self._write, key, version_number, data, tag)
+            return data
+        finally:
+            if locked:
+                self._cache_errors(
+                    key, self._release_lock, keys=[lock_key], args=[token]
+                )
+
+    def _cache_errors(self, key: str, operation: Callable, *args, **kwargs) -> None:
+        try:
+            operation(*args, **kwargs)
+        except redis.RedisError:
+            logger.exception("Read model cache unavailable for key %s", key)
+            self.errors += 1
+
+    def _read(self, key: str, version_number: int) -> Optional[Dict]:
+        entry = self.client.get(key)
+        if entry is None:
+            return None
+        entry = json.loads(entry)
+        if entry["version_number"] != version_number:
+            return None
+        return entry["data"]
+
+    def _write(self, key: str, version_number: int, data: Dict, tag) -> None:
+        entry = json.dumps({"version_number": version_number, "data": data})
+        pipeline = self.client.pipeline()
+        pipeline.set(key, entry, ex=self.ttl)
+        if tag is not None:
+            tag_key = self._tag_key(tag)
+            pipeline.sadd(tag_key, key)
+            pipeline.expire(tag_key, self.ttl)
+        pipeline.execute()
+
+    @staticmethod
+    def _tag_key(tag: Hashable) -> str:
+        return f"tag:{tag}"
+
+
+def create_read_model_cache() -> ReadModelCache:
+    config = get_config()
+    client = create_redis_client() if config.READ_MODEL_CACHE_ENABLED else None
+    return ReadModelCache(
+        client,
+        ttl=config.READ_MODEL_CACHE_TTL,
+        lock_timeout=config.READ_MODEL_CACHE_LOCK_TIMEOUT,
+    )
+
+
+product_cache = ProductCache(get_config().PRODUCT_CACHE_SIZE)
+read_model_cache = create_read_model_cache()
@@ -1,6 +1,9 @@
+from typing import Dict
+
 import sqlalchemy
 from sqlalchemy import event
 from sqlalchemy.engine import Engine
+from sqlalchemy.engine.default import CACHE_HIT, CACHE_MISS
 from sqlalchemy.orm import Session, scoped_session, sessionmaker
 from allocation.config import get_config
 from allocation.interfaces.database import orm
@@ -20,8 +23,46 @@ class SessionFactory:
         return session_class(**kwargs)
 
 
+class StatementCacheStats:
+    """Counts the statements executed on an engine by how they were compiled.
+
+    SQLAlchemy flags every execution as a hit or a miss of its compiled statement
+    cache. Statements without a cache key, like raw SQL, count as uncached."""
+
+    def __init__(self, sqla_engine: Engine):
+        self.engine = sqla_engine
+        self.hits = 0
+        self.misses = 0
+        self.uncached = 0
+        event.listen(sqla_engine, "before_cursor_execute", self._count)
+
+    def remove(self) -> None:
+        """Stops counting the statements of the engine, if not stopped already."""
+        if event.contains(self.engine, "before_cursor_execute", self._count):
+            event.remove(self.engine, "before_cursor_execute", self._count)
+
+    def _count(self, conn, cursor, statement, parameters, context, executemany):
+        if context.cache_hit is CACHE_HIT:
+            self.hits += 1
+        elif context.cache_hit is CACHE_MISS:
+            self.misses += 1
+        else:
+            self.uncached += 1
+
+    def stats(self) -> Dict:
+        """Returns the counters and the hit rate of cacheable statements."""
+        cacheable = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "uncached": self.uncached,
+            "hit_rate": round(self.hits / cacheable, 4) if cacheable else None,
+        }
+
+
 engine = orm.create_engine()
 session_factory = SessionFactory(engine)
+statement_cache = StatementCacheStats(engine)
 
 
 @event.listens_for(engine, "connect")
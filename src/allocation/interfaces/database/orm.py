@@ -1,8 +1,27 @@
 import sqlalchemy
-from sqlalchemy import Column, Date, ForeignKey, Integer, String, Table, Boolean
-from sqlalchemy.engine import Engine
-from sqlalchemy.orm import registry, relationship
+from sqlalchemy import (
+    Boolean,
+    Column,
+    Date,
+    DateTime,
+    ForeignKey,
+    Index,
+    Integer,
+    LargeBinary,
+    String,
+    Table,
+    event,
+)
+from sqlalchemy.orm import (
+    ORMExecuteState,
+    Session,
+    registry,
+    relationship,
+    synonym,
+    with_loader_criteria,
+)
 from sqlalchemy.pool import StaticPool
+from sqlalchemy.sql import Select
 
 from allocation.config import get_config
 from allocation.core import domain
@@ -50,6 +69,8 @@ products = Table(
     Column("_sku_id", GUID, ForeignKey("skus.uuid"), primary_key=True),
     Column("version_number", Integer),
     Column("discarded", Boolean()),
+    # Serialized aggregate written by ProductsRepo, not mapped to Product.
+    Column("snapshot", LargeBinary),
 )
 
 batches = Table(
@@ -62,6 +83,7 @@ batches = Table(
     Column("eta", Date),
     Column("allocated_quantity", Integer),
     Column("discarded", Boolean()),
+    Index("ix_batches_product_id_eta", "_product_id", "eta"),
 )
 
 order_items_batches_association = Table(
@@ -71,6 +93,53 @@ order_items_batches_association = Table(
     Column("batches_id", ForeignKey("batches.uuid")),
 )
 
+# Denormalized read model of the allocations, maintained by event handlers.
+allocations_view = Table(
+    "allocations_view",
+    mapper_registry.metadata,
+    Column("order_item_id", GUID, primary_key=True),
+    Column("batch_id", GUID, primary_key=True),
+    Column("sku_id", GUID),
+)
+
+# Append-only event streams of Products and their latest snapshots, written by
+# EventSourcedRepo instead of the tables above.
+product_events = Table(
+    "product_events",
+    mapper_registry.metadata,
+    Column("sku_id", GUID, primary_key=True),
+    Column("sequence", Integer, primary_key=True, autoincrement=False),
+    Column("type", String(64)),
+    Column("version_number", Integer),
+    Column("data", LargeBinary),
+)
+product_stream_snapshots = Table(
+    "product_stream_snapshots",
+    mapper_registry.metadata,
+    Column("sku_id", GUID, primary_key=True),
+    Column("sequence", Integer),
+    Column("data", LargeBinary),
+)
+
+
+def archive_of(table: Table) -> Table:
+    """Returns a table for the discarded rows of table, with the same columns without
+    constraints, and the time they were archived at."""
+    return Table(
+        f"{table.name}_archive",
+        mapper_registry.metadata,
+        *(Column(c.name, c.type, primary_key=c.primary_key) for c in table.columns),
+        Column("archived_at", DateTime),
+    )
+
+
+# Discarded rows moved out of the hot tables by services.archive_discarded.
+skus_archive = archive_of(skus)
+products_archive = archive_of(products)
+batches_archive = archive_of(batches)
+order_items_archive = archive_of(order_items)
+association_archive = archive_of(order_items_batches_association)
+
 
 def start_mappers():
     """Maps SQLAlchemy models to Domain models."""
@@ -82,7 +151,7 @@ def start_mappers():
             order_items,
             properties={
                 "sku": relationship(
-                    domain.SKU, backref="order_items", lazy="subquery", cascade="all"
+                    domain.SKU, backref="order_items", lazy="selectin", cascade="all"
                 ),
             },
         )
@@ -93,13 +162,13 @@ def start_mappers():
                 "allocated_order_items": relationship(
                     domain.OrderItem,
                     secondary=order_items_batches_association,
-                    lazy="subquery",
+                    lazy="selectin",
                     backref="batches",
                     cascade="all",
                     collection_class=set,
                 ),
                 "sku": relationship(
-                    domain.SKU, backref="batches", lazy="subquery", cascade="all"
+                    domain.SKU, backref="batches", lazy="selectin", cascade="all"
                 ),
             },
         )
@@ -107,30 +176,71 @@ def start_mappers():
         mapper_registry.map_imperatively(
             domain.Product,
             products,
+            exclude_properties=["snapshot"],
             properties={
                 "batches": relationship(
                     domain.Batch,
                     backref="product",
-                    lazy="subquery",
+                    lazy="selectin",
                     cascade="all",
                     collection_class=set,
                 ),
                 "order_items": relationship(
                     domain.OrderItem,
-                    lazy="subquery",
+                    lazy="selectin",
                     backref="order_items",
                     cascade="all",
                     collection_class=set,
                 ),
                 "sku": relationship(
-                    domain.SKU, backref="product", lazy="subquery", cascade="all"
+                    domain.SKU, backref="product", lazy="selectin", cascade="all"
                 ),
+                "sku_id": synonym("_sku_id"),
             },
         )
 
 
 start_mappers()
 
+# Discarded rows are hidden from ORM queries and relationship loads. Subquery eager loads
+# embed the statement that started them with its options, so the criteria are only added
+# for the entities a statement selects, and are not propagated to the loaders.
+NOT_DISCARDED = {
+    entity: with_loader_criteria(
+        entity,
+        lambda cls: cls.discarded.isnot(True),
+        include_aliases=True,
+        propagate_to_loaders=False,
+    )
+    for entity in (domain.Product, domain.Batch, domain.OrderItem)
+}
+
+
+@event.listens_for(Session, "do_orm_execute")
+def exclude_discarded(execute_state: ORMExecuteState) -> None:
+    """Adds NOT_DISCARDED criteria to ORM selects of Products, batches and order items,
+    unless executed with the include_discarded execution option.
+
+    Refreshes of loaded objects still find discarded rows, and so do the allocations of
+    a batch, since its allocated_quantity counts discarded order items as well."""
+    if (
+        not isinstance(execute_state.statement, Select)
+        or execute_state.is_column_load
+        or execute_state.execution_options.get("include_discarded", False)
+    ):
+        return
+    if execute_state.is_relationship_load:
+        prop = getattr(execute_state.loader_strategy_path, "prop", None)
+        if prop is domain.Batch.allocated_order_items.property:
+            return
+    criteria = [
+        NOT_DISCARDED[mapper.class_]
+        for mapper in execute_state.all_mappers
+        if mapper.class_ in NOT_DISCARDED
+    ]
+    if criteria:
+        execute_state.statement = execute_state.statement.options(*criteria)
+
 
 def create_engine():
     config = get_config()
@@ -0,0 +1,208 @@
+import bisect
+import hashlib
+import logging
+from typing import Dict, Iterable, List, Mapping, Optional, Tuple, Union
+from uuid import UUID
+
+import sqlalchemy
+from sqlalchemy import delete, event, insert, select, union
+from sqlalchemy.engine import Connection, Engine
+
+from allocation.config import get_config
+from allocation.interfaces.database import db, orm
+from allocation.interfaces.database.db import SessionFactory, do_begin, do_connect
+
+logger = logging.getLogger(__name__)
+
+# Name of the main database when it is resharded, see ShardedDatabase.from_main.
+MAIN_SHARD = "main"
+
+
+class HashRing:
+    """Consistent hash ring assigning SKU ids to shards.
+
+    Every shard owns vnodes points on the ring, and a SKU belongs to the shard of the
+    first point at or after the hash of its id. Adding or removing a shard only moves
+    the SKUs between its points and their predecessors, about 1/n of the catalog."""
+
+    def __init__(self, shards: Iterable[str], vnodes: int = 64):
+        self.shards = sorted(set(shards))
+        if not self.shards:
+            raise ValueError("A hash ring requires at least one shard.")
+        points = sorted(
+            (_hash(f"{shard}#{i}".encode()), shard)
+            for shard in self.shards
+            for i in range(vnodes)
+        )
+        self._hashes = [h for h, _ in points]
+        self._owners = [shard for _, shard in points]
+
+    def shard_for(self, sku_id) -> str:
+        sku_id = sku_id if isinstance(sku_id, UUID) else UUID(str(sku_id))
+        i = bisect.bisect_left(self._hashes, _hash(sku_id.bytes))
+        return self._owners[i % len(self._owners)]
+
+
+class ShardedDatabase:
+    """Engines and session factories of the databases Products are sharded across,
+    keyed by shard name, and the ring routing SKUs to them.
+
+    Shards are given by url, or by an engine created elsewhere, which dispose leaves
+    open. Shards are identified by name on the ring, so renaming a shard moves its
+    SKUs."""
+
+    def __init__(
+        self, urls: Mapping[str, Union[str, Engine]], vnodes: Optional[int] = None
+    ):
+        self.ring = HashRing(urls, vnodes or get_config().SHARD_VNODES)
+        self.engines: Dict[str, Engine] = {
+            name: url if isinstance(url, Engine) else _create_engine(url)
+            for name, url in urls.items()
+        }
+        self.urls = {name: str(engine.url) for name, engine in self.engines.items()}
+        self.factories: Dict[str, SessionFactory] = {
+            name: SessionFactory(engine) for name, engine in self.engines.items()
+        }
+        self._created = [name for name, url in urls.items() if isinstance(url, str)]
+
+    @classmethod
+    def from_config(cls) -> "ShardedDatabase":
+        return cls(parse_shards(get_config().SHARDS))
+
+    @classmethod
+    def from_main(cls) -> "ShardedDatabase":
+        """Returns the main database as the single shard MAIN_SHARD, to shard the
+        catalog of a deployment without SHARDS."""
+        return cls({MAIN_SHARD: db.engine})
+
+    def create_all(self) -> None:
+        for engine in self.engines.values():
+            orm.mapper_registry.metadata.create_all(engine)
+
+    def dispose(self) -> None:
+        for name in self._created:
+            self.engines[name].dispose()
+
+
+def parse_shards(value: str) -> Dict[str, str]:
+    """Parses shards given as comma separated name=url pairs."""
+    shards = {}
+    for pair in filter(None, (p.strip() for p in value.split(","))):
+        name, sep, url = pair.partition("=")
+        if not sep or not name or not url:
+            raise ValueError(f"Invalid shard {pair!r}, expected name=url.")
+        shards[name.strip()] = url.strip()
+    return shards
+
+
+# Tables holding the rows of a Product, in foreign key order, with the condition
+# selecting the rows of a list of SKU ids. Archived rows stay where they are.
+_batches, _association = orm.batches, orm.order_items_batches_association
+SHARDED_TABLES = (
+    (orm.skus, lambda ids: orm.skus.c.uuid.in_(ids)),
+    (orm.products, lambda ids: orm.products.c._sku_id.in_(ids)),
+    (_batches, lambda ids: _batches.c._sku_id.in_(ids)),
+    (orm.order_items, lambda ids: orm.order_items.c._sku_id.in_(ids)),
+    (
+        _association,
+        lambda ids: _association.c.batches_id.in_(
+            select(_batches.c.uuid).where(_batches.c._sku_id.in_(ids))
+        ),
+    ),
+    (orm.allocations_view, lambda ids: orm.allocations_view.c.sku_id.in_(ids)),
+    (orm.product_events, lambda ids: orm.product_events.c.sku_id.in_(ids)),
+    (
+        orm.product_stream_snapshots,
+        lambda ids: orm.product_stream_snapshots.c.sku_id.in_(ids),
+    ),
+)
+
+
+def reshard(
+    source: ShardedDatabase, target: ShardedDatabase, chunk_size: int = 500
+) -> Dict[Tuple[str, str], int]:
+    """Moves every Product to the shard owning its SKU on the ring of target.
+
+    Shards with the same name in source and target must be the same database. The rows
+    of chunk_size Products at a time are copied to their new shard, replacing any copy
+    left there by an interrupted run, and deleted from the old one after the copy was
+    committed. Writes to the moved SKUs must be paused while it runs. Returns the number
+    of Products moved from and to every pair of shards."""
+    moved: Dict[Tuple[str, str], int] = {}
+    for name, engine in source.engines.items():
+        after = None
+        while sku_ids := _sku_ids(engine, after, chunk_size):
+            after = sku_ids[-1]
+            owners: Dict[str, List[UUID]] = {}
+            for sku_id in sku_ids:
+                owner = target.ring.shard_for(sku_id)
+                if owner != name:
+                    owners.setdefault(owner, []).append(sku_id)
+            for owner, ids in owners.items():
+                _move(ids, engine, target.engines[owner])
+                moved[name, owner] = moved.get((name, owner), 0) + len(ids)
+                logger.info("Moved %s Products from %s to %s.", len(ids), name, owner)
+    return moved
+
+
+def _sku_ids(engine: Engine, after: Optional[UUID], limit: int) -> List[UUID]:
+    """Returns the next limit SKU ids stored in a shard, including event streams."""
+    ids = union(
+        select(orm.skus.c.uuid.label("sku_id")),
+        select(orm.product_events.c.sku_id),
+    ).subquery()
+    query = select(ids.c.sku_id).order_by(ids.c.sku_id).limit(limit)
+    if after is not None:
+        query = query.where(ids.c.sku_id > after)
+    with engine.connect() as connection:
+        return connection.execute(query).scalars().all()
+
+
+def _move(sku_ids: List[UUID], source: Engine, target: Engine) -> None:
+    with source.begin() as from_connection:
+        rows = [
+            (
+                table,
+                from_connection.execute(select(table).where(condition(sku_ids)))
+                .mappings()
+                .all(),
+            )
+            for table, condition in SHARDED_TABLES
+        ]
+        with target.begin() as to_connection:
+            _delete_rows(to_connection, sku_ids)
+            for table, values in rows:
+                if values:
+                    to_connection.execute(insert(table), values)
+        _delete_rows(from_connection, sku_ids)
+
+
+def _delete_rows(connection: Connection, sku_ids: List[UUID]) -> None:
+    for table, condition in reversed(SHARDED_TABLES):
+        connection.execute(delete(table).where(condition(sku_ids)))
+
+
+def _create_engine(url: str) -> Engine:
+    isolation_level = (
+        "REPEATABLE READ" if get_config().DB_TYPE == "PSYCOPG" else "SERIALIZABLE"
+    )
+    engine = sqlalchemy.create_engine(url, isolation_level=isolation_level)
+    if engine.dialect.name == "sqlite":
+        event.listen(engine, "connect", do_connect)
+        event.listen(engine, "begin", do_begin)
+    return engine
+
+
+def _hash(key: bytes) -> int:
+    return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), "big")
+
+
+def create_sharded_database() -> Optional[ShardedDatabase]:
+    """Returns the shards in SHARDS, or None to keep all Products in the main
+    database."""
+    if not get_config().SHARDS:
+        return None
+    return ShardedDatabase.from_config()
+
+
+sharded_database = create_sharded_database()
@@ -47,3 +47,7 @@ def parse_redis_message(message: dict) -> events.Event:
         data = message.get("data")
         event = pickle.loads(data)
         return event
+
+
+# Client publishing events, shared so that every publish reuses its connection pool.
+redis_client = create_redis_client()
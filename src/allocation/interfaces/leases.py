@@ -0,0 +1,236 @@
+import logging
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, Optional, Sequence, Tuple
+from uuid import UUID, uuid4
+
+from allocation.config import get_config
+from allocation.interfaces.cache import RELEASE_LOCK_SCRIPT
+from allocation.interfaces.external_bus import RedisClient, create_redis_client
+
+logger = logging.getLogger(__name__)
+
+
+class LeaseTimeout(Exception):
+    pass
+
+
+class StaleLease(Exception):
+    pass
+
+
+@dataclass
+class Lease:
+    sku_id: UUID
+    # Fencing token, greater for every lease granted on the same SKU.
+    token: int
+    manager: "LeaseManager"
+    owner: str = field(default_factory=lambda: uuid4().hex)
+
+
+class LeaseManager(ABC):
+    """Grants exclusive, expiring leases on SKUs, so that the commands of a SKU are
+    handled one at a time across all workers and wait in line instead of conflicting.
+
+    A lease expires after ttl seconds, so a worker that stalls does not block its SKU
+    forever. Its unit of work must then not commit, which check verifies."""
+
+    def __init__(self, ttl: float = 5.0, timeout: float = 10.0):
+        self.ttl = ttl
+        self.timeout = timeout
+        self.acquired = 0
+        self.waits = 0
+        self.timeouts = 0
+        self.stale = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self._stats_lock = threading.Lock()
+
+    @contextmanager
+    def acquire(self, sku_id: UUID) -> Iterator[Lease]:
+        """Holds the lease of a SKU, waiting up to timeout seconds for it.
+
+        Raises LeaseTimeout if the lease is still held by someone else by then."""
+        start = time.monotonic()
+        deadline = start + self.timeout
+        lease = self._try_acquire(sku_id)
+        waited = lease is None
+        while lease is None and (remaining := deadline - time.monotonic()) > 0:
+            self._wait(sku_id, remaining)
+            lease = self._try_acquire(sku_id)
+        self._record(lease, waited, time.monotonic() - start)
+        if lease is None:
+            raise LeaseTimeout(f"Timed out waiting for the lease of SKU {sku_id}.")
+        try:
+            yield lease
+        finally:
+            self._release(lease)
+
+    def check(self, lease: Lease, stale_sku_ids: Sequence[UUID] = ()) -> None:
+        """Raises StaleLease if the lease was lost, or if Products loaded under it were
+        committed by someone else since, which happens when it expired meanwhile."""
+        if self.holds(lease) and not stale_sku_ids:
+            return
+        with self._stats_lock:
+            self.stale += 1
+        logger.warning("Lease %s of SKU %s is stale.", lease.token, lease.sku_id)
+        raise StaleLease(
+            f"The lease {lease.token} of SKU {lease.sku_id} expired before commit."
+        )
+
+    @abstractmethod
+    def holds(self, lease: Lease) -> bool:
+        """Returns whether the lease is unexpired and its token is still the latest
+        granted for its SKU."""
+
+    @abstractmethod
+    def _try_acquire(self, sku_id: UUID) -> Optional[Lease]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def _wait(self, sku_id: UUID, timeout: float) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    def _release(self, lease: Lease) -> None:
+        raise NotImplementedError
+
+    def _record(self, lease: Optional[Lease], waited: bool, seconds: float) -> None:
+        with self._stats_lock:
+            if lease is None:
+                self.timeouts += 1
+            else:
+                self.acquired += 1
+            if waited:
+                self.waits += 1
+                self.wait_seconds += seconds
+                self.max_wait_seconds = max(self.max_wait_seconds, seconds)
+
+    def stats(self) -> Dict:
+        """Returns the lease counters and the mean wait of the leases that waited."""
+        with self._stats_lock:
+            return {
+                "acquired": self.acquired,
+                "waits": self.waits,
+                "timeouts": self.timeouts,
+                "stale": self.stale,
+                "mean_wait_seconds": round(self.wait_seconds / self.waits, 6)
+                if self.waits
+                else None,
+                "max_wait_seconds": round(self.max_wait_seconds, 6),
+            }
+
+
+class LocalLeaseManager(LeaseManager):
+    """Leases shared by the threads of a single process, for tests and for running
+    without Redis. Waiting threads are woken up as soon as a lease is released."""
+
+    def __init__(self, ttl: float = 5.0, timeout: float = 10.0):
+        super().__init__(ttl, timeout)
+        self._condition = threading.Condition()
+        # Owner and expiry time of the current lease of every SKU.
+        self._holders: Dict[UUID, Tuple[str, float]] = {}
+        self._tokens: Dict[UUID, int] = {}
+
+    def holds(self, lease: Lease) -> bool:
+        with self._condition:
+            return (
+                self._held_by(lease.sku_id) == lease.owner
+                and self._tokens.get(lease.sku_id) == lease.token
+            )
+
+    def _held_by(self, sku_id: UUID) -> Optional[str]:
+        holder = self._holders.get(sku_id)
+        if holder is None or holder[1] <= time.monotonic():
+            return None
+        return holder[0]
+
+    def _try_acquire(self, sku_id: UUID) -> Optional[Lease]:
+        with self._condition:
+            if self._held_by(sku_id) is not None:
+                return None
+            token = self._tokens[sku_id] = self._tokens.get(sku_id, 0) + 1
+            lease = Lease(sku_id, token, self)
+            self._holders[sku_id] = (lease.owner, time.monotonic() + self.ttl)
+            return lease
+
+    def _wait(self, sku_id: UUID, timeout: float) -> None:
+        with self._condition:
+            holder = self._holders.get(sku_id)
+            if holder is not None:
+                timeout = min(timeout, holder[1] - time.monotonic())
+            self._condition.wait_for(lambda: self._held_by(sku_id) is None, timeout)
+
+    def _release(self, lease: Lease) -> None:
+        with self._condition:
+            if self._held_by(lease.sku_id) == lease.owner:
+                del self._holders[lease.sku_id]
+                self._condition.notify_all()
+
+
+class RedisLeaseManager(LeaseManager):
+    """Leases shared by all workers through Redis.
+
+    A lease is a key set only if absent and expiring after ttl, holding a random owner,
+    and its fencing token is incremented in a second key that does not expire. Waiting
+    workers poll the key every wait_interval seconds."""
+
+    def __init__(
+        self,
+        client: RedisClient,
+        ttl: float = 5.0,
+        timeout: float = 10.0,
+        wait_interval: float = 0.005,
+    ):
+        super().__init__(ttl, timeout)
+        self.client = client
+        self.wait_interval = wait_interval
+        self._release_lock = client.register_script(RELEASE_LOCK_SCRIPT)
+
+    def holds(self, lease: Lease) -> bool:
+        key = self._key(lease.sku_id)
+        owner, token = self.client.mget(key, f"{key}:token")
+        return (
+            owner is not None
+            and _text(owner) == lease.owner
+            and token is not None
+            and int(token) == lease.token
+        )
+
+    def _try_acquire(self, sku_id: UUID) -> Optional[Lease]:
+        owner, key = uuid4().hex, self._key(sku_id)
+        if not self.client.set(key, owner, nx=True, px=int(self.ttl * 1000)):
+            return None
+        return Lease(sku_id, self.client.incr(f"{key}:token"), self, owner)
+
+    def _wait(self, sku_id: UUID, timeout: float) -> None:
+        time.sleep(min(self.wait_interval, timeout))
+
+    def _release(self, lease: Lease) -> None:
+        self._release_lock(keys=[self._key(lease.sku_id)], args=[lease.owner])
+
+    @staticmethod
+    def _key(sku_id: UUID) -> str:
+        return f"lease:{sku_id}"
+
+
+def _text(value) -> str:
+    return value.decode() if isinstance(value, bytes) else value
+
+
+def create_lease_manager() -> Optional[LeaseManager]:
+    """Returns the lease manager selected by SKU_LEASES, or None if disabled."""
+    config = get_config()
+    if config.SKU_LEASES == "redis":
+        return RedisLeaseManager(
+            create_redis_client(), config.SKU_LEASE_TTL, config.SKU_LEASE_TIMEOUT
+        )
+    if config.SKU_LEASES == "local":
+        return LocalLeaseManager(config.SKU_LEASE_TTL, config.SKU_LEASE_TIMEOUT)
+    return None
+
+
+sku_leases = create_lease_manager()
@@ -0,0 +1,174 @@
+import logging
+import os
+import threading
+from typing import Dict, List, Mapping, Optional
+from uuid import UUID
+
+import orjson
+
+from allocation.config import get_config
+
+logger = logging.getLogger(__name__)
+
+
+class ConflictError(Exception):
+    pass
+
+
+class InMemoryStore:
+    """Thread-safe store of committed Product snapshots, indexed by the ids of their
+    SKU, batches and order items.
+
+    If a directory is provided, every commit is appended to a write-ahead log in it
+    before it becomes visible, and the whole store is written to a snapshot file every
+    snapshot_interval commits, after which the log starts over. Opening a store on the
+    same directory recovers it from the snapshot and the log, ignoring a last log
+    record that was only partially written."""
+
+    def __init__(
+        self,
+        directory: Optional[str] = None,
+        snapshot_interval: Optional[int] = None,
+        fsync: bool = True,
+    ):
+        self.directory = directory
+        self.snapshot_interval = (
+            snapshot_interval or get_config().MEMORY_SNAPSHOT_INTERVAL
+        )
+        self.fsync = fsync
+        # Log sequence number of the last commit.
+        self.lsn = 0
+        self._products: Dict[UUID, Dict] = {}
+        self._batches: Dict[UUID, UUID] = {}
+        self._order_items: Dict[UUID, UUID] = {}
+        self._lock = threading.Lock()
+        self._log = None
+        self._logged = 0
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+            self._recover()
+            self._log = open(self._log_path, "ab")
+
+    @property
+    def _log_path(self) -> str:
+        return os.path.join(self.directory, "wal.ndjson")
+
+    @property
+    def _snapshot_path(self) -> str:
+        return os.path.join(self.directory, "snapshot.json")
+
+    def __len__(self) -> int:
+        return len(self._products)
+
+    def get(self, sku_id: UUID) -> Optional[Dict]:
+        """Returns the committed snapshot of a Product, which must not be modified."""
+        return self._products.get(sku_id)
+
+    def sku_ids(self) -> List[UUID]:
+        return list(self._products)
+
+    def batch_owner(self, batch_id: UUID) -> Optional[UUID]:
+        return self._batches.get(batch_id)
+
+    def order_item_owner(self, order_item_id: UUID) -> Optional[UUID]:
+        return self._order_items.get(order_item_id)
+
+    def commit(
+        self,
+        changes: Mapping[UUID, Optional[Dict]],
+        versions: Mapping[UUID, Optional[int]],
+    ) -> None:
+        """Stores the snapshot of every changed Product, or deletes it if None.
+
+        versions holds the version_number every Product had when it was read, or None
+        if it was created. If any of them was committed since, nothing is stored and
+        ConflictError is raised."""
+        with self._lock:
+            for sku_id in changes:
+                current = self._products.get(sku_id)
+                version_number = None if current is None else current["version_number"]
+                if version_number != versions.get(sku_id):
+                    raise ConflictError(
+                        f"The Product {sku_id} was changed by another unit of work."
+                    )
+            self.lsn += 1
+            if self._log is not None:
+                self._append(changes)
+            self._apply(changes)
+            if self._log is not None and self._logged >= self.snapshot_interval:
+                self._write_snapshot()
+
+    def close(self) -> None:
+        if self._log is not None:
+            self._log.close()
+            self._log = None
+
+    def _apply(self, changes: Mapping[UUID, Optional[Dict]]) -> None:
+        for sku_id, snapshot in changes.items():
+            previous = self._products.pop(sku_id, None)
+            if previous is not None:
+                for batch in previous["batches"]:
+                    self._batches.pop(UUID(batch[0]), None)
+                for order_item in previous["order_items"]:
+                    self._order_items.pop(UUID(order_item[0]), None)
+            if snapshot is not None:
+                self._products[sku_id] = snapshot
+                for batch in snapshot["batches"]:
+                    self._batches[UUID(batch[0])] = sku_id
+                for order_item in snapshot["order_items"]:
+                    self._order_items[UUID(order_item[0])] = sku_id
+
+    def _append(self, changes: Mapping[UUID, Optional[Dict]]) -> None:
+        record = {"lsn": self.lsn, "products": _encode(changes)}
+        self._log.write(orjson.dumps(record, option=orjson.OPT_APPEND_NEWLINE))
+        self._log.flush()
+        if self.fsync:
+            os.fsync(self._log.fileno())
+        self._logged += 1
+
+    def _write_snapshot(self) -> None:
+        path = f"{self._snapshot_path}.tmp"
+        with open(path, "wb") as file:
+            file.write(
+                orjson.dumps({"lsn": self.lsn, "products": _encode(self._products)})
+            )
+            file.flush()
+            if self.fsync:
+                os.fsync(file.fileno())
+        os.replace(path, self._snapshot_path)
+        # Records up to lsn are skipped on recovery, should this truncation not happen.
+        self._log.truncate(0)
+        self._logged = 0
+
+    def _recover(self) -> None:
+        if os.path.exists(self._snapshot_path):
+            with open(self._snapshot_path, "rb") as file:
+                snapshot = orjson.loads(file.read())
+            self.lsn = snapshot["lsn"]
+            self._apply(_decode(snapshot["products"]))
+        if not os.path.exists(self._log_path):
+            return
+        valid = 0
+        with open(self._log_path, "rb") as file:
+            for line in file:
+                try:
+                    record = orjson.loads(line) if line.endswith(b"\n") else None
+                except orjson.JSONDecodeError:
+                    record = None
+                if record is None:
+                    logger.warning("Ignoring a partial record at the end of the log.")
+                    break
+                valid += len(line)
+                if record["lsn"] > self.lsn:
+                    self.lsn = record["lsn"]
+                    self._apply(_decode(record["products"]))
+                    self._logged += 1
+        os.truncate(self._log_path, valid)
+
+
+def _encode(products: Mapping[UUID, Optional[Dict]]) -> Dict[str, Optional[Dict]]:
+    return {sku_id.hex: snapshot for sku_id, snapshot in products.items()}
+
+
+def _decode(products: Dict[str, Optional[Dict]]) -> Dict[UUID, Optional[Dict]]:
+    return {UUID(sku_id): snapshot for sku_id, snapshot in products.items()}
@@ -1,29 +1,53 @@
 import logging
-from typing import Callable, Dict, List, Type
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Type
 
 from allocation import services
+from allocation.actors import ActorSystem
+from allocation.config import get_config
 from allocation.core import Message
 from allocation.core.commands import (
     Allocate,
+    ArchiveDiscarded,
     ChangeBatchQuantity,
     Command,
     CreateProductCommand,
+    DiscardBatch,
+    DiscardProduct,
+    RebuildAllocationsView,
 )
 from allocation.core.events import (
     Event,
     OrderItemAllocated,
     OrderItemDeallocated,
+    OrderItemsDeallocated,
     OutOfStock,
     ProductCreated,
 )
-from allocation.unit_of_work import AbstractUnitOfWork
+from allocation.interfaces import leases
+from allocation.interfaces.database import shards
+from allocation.unit_of_work import AbstractUnitOfWork, create_unit_of_work
 
 logger = logging.getLogger(__name__)
 
 QUEUE: List[Message] = []
 
 
-def handle_event(event: Event):
+UnitOfWorkFactory = Callable[[], AbstractUnitOfWork]
+
+
+def handle_event(event: Event, uow_factory: UnitOfWorkFactory = create_unit_of_work):
+    """Calls the read model handlers of the event, then its other handlers.
+
+    Read model handlers get a unit of work of their own, created with uow_factory, as
+    the unit of work of the command raising the event has committed."""
+    for handler in READ_MODEL_HANDLERS.get(type(event), []):
+        try:
+            logger.debug("Handling Event %s with Handler %s", event, handler)
+            handler(event, uow_factory())
+        except Exception:
+            logger.exception("Exception handling Event %s", event)
+            continue
     for handler in EVENT_HANDLERS[type(event)]:
         try:
             logger.debug("Handling Event %s with Handler %s", event, handler)
@@ -34,10 +58,16 @@ def handle_event(event: Event):
 
 
 def handle_command(command: Command, queue: List[Message], uow: AbstractUnitOfWork):
+    # Actors take no SKU lease, their commits are fenced like those of lease holders.
+    future = ACTORS.submit(command) if ACTORS is not None else None
+    if future is not None:
+        logger.debug("Handling Command %s with the actor of its SKU", command)
+        return future.result()
     for handler in COMMAND_HANDLERS[type(command)]:
         try:
             logger.debug("Handling Command %s with Handler %s", command, handler)
-            result = handler(command, uow)
+            with sku_lease(command, uow):
+                result = handler(command, uow)
             queue.extend(uow.collect_new_messages())
             return result
         except Exception:
@@ -45,31 +75,113 @@ def handle_command(command: Command, queue: List[Message], uow: AbstractUnitOfWo
             raise
 
 
-def handle(queue: List[Message], uow: AbstractUnitOfWork):
+@contextmanager
+def sku_lease(command: Command, uow: AbstractUnitOfWork) -> Iterator[None]:
+    """Holds the lease of the SKU of the command, if it has one and leases are enabled,
+    and hands it to the unit of work, which checks it before committing."""
+    sku_id = getattr(command, "sku_id", None)
+    if leases.sku_leases is None or sku_id is None:
+        yield
+        return
+    with leases.sku_leases.acquire(sku_id) as lease:
+        uow.lease = lease
+        try:
+            yield
+        finally:
+            uow.lease = None
+
+
+def handle(
+    queue: List[Message],
+    uow: AbstractUnitOfWork,
+    uow_factory: UnitOfWorkFactory = create_unit_of_work,
+):
     results = []
     while queue:
         message = queue.pop(0)
         if isinstance(message, Event):
-            handle_event(message)
+            handle_event(message, uow_factory)
         elif isinstance(message, Command):
             cmd_results = handle_command(message, queue, uow)
             results.append(cmd_results)
         else:
             raise Exception(f"Message {message} was not an Event or Command.")
+    return results
 
 
 EVENT_HANDLERS: Dict[Type[Event], List[Callable]] = {
     OutOfStock: [services.send_email_notification],
-    ProductCreated: [services.mock_send_email_notification],
-    OrderItemAllocated: [services.publish_message_to_external_bus],
+    ProductCreated: [
+        services.invalidate_cached_product,
+        services.invalidate_cached_read_models,
+        services.mock_send_email_notification,
+    ],
+    OrderItemAllocated: [
+        services.invalidate_cached_product,
+        services.invalidate_cached_read_models,
+        services.publish_message_to_external_bus,
+    ],
     OrderItemDeallocated: [
+        services.invalidate_cached_product,
+        services.invalidate_cached_read_models,
         services.publish_message_to_external_bus,
         services.mock_send_email_notification,
     ],
+    OrderItemsDeallocated: [
+        services.invalidate_cached_product,
+        services.invalidate_cached_read_models,
+        services.publish_message_to_external_bus,
+        services.mock_send_email_notification,
+    ],
+}
+
+# Handlers updating allocations_view, called with a unit of work.
+READ_MODEL_HANDLERS: Dict[Type[Event], List[Callable]] = {
+    OrderItemAllocated: [services.add_allocation_to_read_model],
+    OrderItemDeallocated: [services.remove_allocation_from_read_model],
+    OrderItemsDeallocated: [services.remove_allocations_from_read_model],
 }
 
 COMMAND_HANDLERS: Dict[Type[Command], List[Callable]] = {
-    Allocate: [services.allocate],
+    Allocate: [
+        services.allocate_fast
+        if get_config().ALLOCATION_FAST_PATH
+        else services.allocate
+    ],
     CreateProductCommand: [services.create_product],
     ChangeBatchQuantity: [services.change_batch_quantity],
+    DiscardBatch: [services.discard_batch],
+    DiscardProduct: [services.discard_product],
+    RebuildAllocationsView: [services.rebuild_allocations_view],
+    ArchiveDiscarded: [services.archive_discarded],
 }
+
+# Actors allocate on the Product they keep loaded, which the fast path would skip.
+ACTOR_HANDLERS: Dict[Type[Command], List[Callable]] = {
+    **COMMAND_HANDLERS,
+    Allocate: [services.allocate],
+}
+
+
+def create_actor_system() -> Optional[ActorSystem]:
+    """Returns the actors handling the commands of hot SKUs, if PRODUCT_ACTORS is set.
+
+    The actors handle the events of their commands themselves. They keep their Product
+    in the main database, so they are disabled when Products are sharded."""
+    config = get_config()
+    if not config.PRODUCT_ACTORS:
+        return None
+    if shards.sharded_database is not None:
+        logger.warning("PRODUCT_ACTORS is ignored as Products are sharded.")
+        return None
+    return ActorSystem(
+        ACTOR_HANDLERS,
+        handle_event,
+        hot_rate=config.ACTOR_HOT_RATE,
+        max_batch=config.ACTOR_BATCH_SIZE,
+        max_delay=config.ACTOR_BATCH_INTERVAL_MS / 1000,
+        idle_timeout=config.ACTOR_IDLE_TIMEOUT,
+    )
+
+
+ACTORS = create_actor_system()
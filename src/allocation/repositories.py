@@ -1,15 +1,55 @@
+import heapq
 import os
 from abc import ABC, abstractmethod
-from typing import Dict, Iterator, List
+from dataclasses import replace
+from datetime import date
+from itertools import chain, islice
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Set, Tuple
+from uuid import UUID
 
-from sqlalchemy.orm import Session
+import orjson
+from pyrsistent import pmap
+from pyrsistent.typing import PMap
+from sqlalchemy import (
+    bindparam,
+    delete,
+    event,
+    func,
+    insert,
+    inspect,
+    select,
+    update,
+)
+from sqlalchemy.orm import (
+    Session,
+    class_mapper,
+    joinedload,
+    lazyload,
+    make_transient_to_detached,
+    selectinload,
+)
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.orm.util import identity_key
 
+from allocation.config import get_config
+from allocation.core import snapshots, streams
 from allocation.core.domain import SKU, Batch, OrderItem, Product
+from allocation.core.events import (
+    Event,
+    OrderItemAllocated,
+    OrderItemsDeallocated,
+    ProductDiscarded,
+)
+from allocation.interfaces.cache import ProductCache
+from allocation.interfaces.database import orm
+from allocation.interfaces.database.shards import HashRing
+from allocation.interfaces.memory import InMemoryStore
 
 
 class AbstractRepo(ABC):
     def __init__(self):
         self.seen = set()
+        self.events: List[Event] = []
 
     def get(self, reference) -> Product:
         """Retrieves Product by reference."""
@@ -29,10 +69,21 @@ class AbstractRepo(ABC):
         self._delete(product)
         self.seen.remove(product)
 
-    def add_all(self, products: List[Product]) -> None:
-        """Adds list of Product to persistent storage."""
+    def add_all(
+        self, products: List[Product], bulk: bool = False, chunk_size: int = None
+    ) -> None:
+        """Adds list of Product to persistent storage.
+
+        In bulk mode new Products are written chunk_size at a time, without tracking
+        their objects for changes. They are still collected as seen, so their events
+        are published, but must not be modified afterwards in the same unit of work.
+        """
         self.seen.update(products)
-        self._add_all(products)
+        if bulk:
+            chunk_size = chunk_size or get_config().INGEST_CHUNK_SIZE
+            self._bulk_add_all(products, chunk_size)
+        else:
+            self._add_all(products)
 
     @abstractmethod
     def _get(self, reference):
@@ -50,6 +101,10 @@ class AbstractRepo(ABC):
     def _add_all(self, products: List[Product]):
         raise NotImplementedError
 
+    def _bulk_add_all(self, products: List[Product], chunk_size: int) -> None:
+        """Repositories without a bulk path add the Products one by one."""
+        self._add_all(products)
+
     @abstractmethod
     def get_all_batches(self) -> Iterator[Batch]:
         """Retrieves all batches currently registered."""
@@ -69,30 +124,465 @@ class AbstractRepo(ABC):
     def _list(self) -> List[Product]:
         raise NotImplementedError
 
+    def try_allocate(self, sku_id, order_item_id) -> Optional[UUID]:
+        """Allocates a registered order item without loading the Product.
+
+        Returns the id of the batch, or None if the allocation requires the aggregate.
+        Repositories without a fast path always return None."""
+        return None
+
+    def discard_batches(self, sku_id, batch_ids: Sequence[UUID]) -> Optional[int]:
+        """Discards batches of a Product without loading it.
+
+        Returns the number of batches discarded, or None if the Product must be loaded
+        to discard them. Repositories without a fast path always return None."""
+        return None
+
+    def discard_product(self, sku_id) -> Optional[int]:
+        """Discards a Product and all of its batches without loading it.
+
+        Returns the number of batches discarded, or None if the Product must be loaded
+        to discard it. Repositories without a fast path always return None."""
+        return None
+
+    def fence_products(self) -> List[UUID]:
+        """Writes the version_number of every retrieved Product, only where the stored
+        one is still the version_number it was loaded with, and returns the SKU ids of
+        the Products without a matching row. The written rows stay locked until the
+        unit of work commits or rolls back. Repositories that do not track the versions
+        they read always return an empty list."""
+        return []
+
+
+# Loads the relationships of each chunk with one query per collection. All SKU references
+# of a Product point to its own SKU, which lazy loading finds in the identity map.
+ITER_PRODUCTS_OPTIONS = (
+    joinedload(Product.sku),
+    selectinload(Product.order_items).options(lazyload(OrderItem.sku)),
+    selectinload(Product.batches).options(
+        lazyload(Batch.sku),
+        selectinload(Batch.allocated_order_items).options(lazyload(OrderItem.sku)),
+    ),
+)
+
+# Statements of the hot Core queries, built once with bound parameters. SQLAlchemy
+# memoizes the cache key of a statement object, so executing them skips building the
+# statement and its cache key on top of the compilation it already caches.
+_products, _batches = orm.products, orm.batches
+_order_items, _association = orm.order_items, orm.order_items_batches_association
+_allocated_quantity = func.coalesce(_batches.c.allocated_quantity, 0)
+_has_quantity = _batches.c.quantity - _allocated_quantity >= bindparam(
+    "requested_quantity"
+)
+
+GET_VERSION = select(_products.c.version_number).where(
+    _products.c._sku_id == bindparam("sku_id"), _products.c.discarded.isnot(True)
+)
+GET_BATCH_OWNER = (
+    select(_products.c._sku_id, _products.c.version_number)
+    .join_from(_batches, _products, _batches.c._product_id == _products.c._sku_id)
+    .where(_batches.c.uuid == bindparam("batch_id"), _batches.c.discarded.isnot(True))
+)
+GET_ORDER_ITEM_QUANTITY = (
+    select(_order_items.c.quantity)
+    .join_from(
+        _order_items, _products, _order_items.c._product_id == _products.c._sku_id
+    )
+    .where(
+        _order_items.c.uuid == bindparam("order_item_id"),
+        _order_items.c._product_id == bindparam("sku_id"),
+        _order_items.c.discarded.isnot(True),
+        _products.c.discarded.isnot(True),
+    )
+)
+GET_ALLOCATION = select(_association.c.batches_id).where(
+    _association.c.order_item_id == bindparam("order_item_id")
+)
+GET_CANDIDATE_BATCH = (
+    select(_batches.c.uuid)
+    .where(
+        _batches.c._product_id == bindparam("sku_id"),
+        _batches.c.discarded.isnot(True),
+        _has_quantity,
+    )
+    .order_by(_batches.c.eta.asc().nulls_first())
+    .limit(1)
+)
+RESERVE_BATCH = (
+    update(_batches)
+    .where(_batches.c.uuid == bindparam("batch_id"), _has_quantity)
+    .values(allocated_quantity=_allocated_quantity + bindparam("requested_quantity"))
+)
+INSERT_ALLOCATION = insert(_association)
+GET_SNAPSHOT = select(_products.c.version_number, _products.c.snapshot).where(
+    _products.c._sku_id == bindparam("sku_id"), _products.c.discarded.isnot(True)
+)
+WRITE_SNAPSHOT = (
+    update(_products)
+    .where(_products.c._sku_id == bindparam("sku_id"))
+    .values(snapshot=bindparam("data"))
+)
+INCREMENT_VERSION = (
+    update(_products)
+    .where(_products.c._sku_id == bindparam("sku_id"))
+    .values(version_number=func.coalesce(_products.c.version_number, 0) + 1)
+)
+FENCE_VERSION = (
+    update(_products)
+    .where(
+        _products.c._sku_id == bindparam("sku_id"),
+        func.coalesce(_products.c.version_number, 0) == bindparam("loaded"),
+    )
+    .values(version_number=bindparam("version"))
+)
+
 
 class ProductsRepo(AbstractRepo):
-    def __init__(self, session: Session):
+    def __init__(
+        self,
+        session: Session,
+        cache: Optional[ProductCache] = None,
+        snapshots: Optional[bool] = None,
+        fence: bool = False,
+    ):
         super().__init__()
         self.session = session
+        self.cache = cache if cache is not None and cache.enabled else None
+        self.snapshots = (
+            get_config().PRODUCT_SNAPSHOTS if snapshots is None else snapshots
+        )
+        # version_number of every Product when it was loaded or None if it was added.
+        self._snapshot_versions: Dict[UUID, Optional[int]] = {}
+        if self.snapshots:
+            event.listen(session, "before_commit", self._write_snapshots)
+        # With fence, the version_number of every retrieved Product as it was read from
+        # the database or last written by the fence, or None if it was added.
+        self.fence = fence
+        self._fence_versions: Dict[UUID, Optional[int]] = {}
+        self._stale: Set[UUID] = set()
+        if fence:
+            event.listen(session, "before_flush", self._fence_changed)
 
     def _get(self, reference) -> Product:
-        return self.session.get(Product, reference)
+        product = self._load(reference)
+        if product is not None and self.snapshots:
+            self._snapshot_versions.setdefault(product.sku_id, product.version_number)
+        if product is not None and self.fence:
+            self._fence_versions.setdefault(product.sku_id, product.version_number)
+        return product
+
+    def _load(self, reference) -> Optional[Product]:
+        if self.cache is None and not self.snapshots:
+            return self.session.get(Product, reference)
+
+        sku_id = reference if isinstance(reference, UUID) else UUID(str(reference))
+        product = self.session.identity_map.get(identity_key(Product, sku_id))
+        if product is not None:
+            return product
+
+        stored = None
+        if self.snapshots:
+            row = self.session.execute(GET_SNAPSHOT, {"sku_id": sku_id}).first()
+            version_number = None if row is None else row.version_number or 0
+            stored = row and row.snapshot
+        else:
+            version_number = self.get_version(sku_id)
+        if version_number is None:
+            if self.cache is not None:
+                self.cache.invalidate(sku_id)
+            return None
+
+        snapshot = None
+        if self.cache is not None:
+            snapshot = self.cache.get(sku_id, version_number)
+        if snapshot is None and stored is not None:
+            snapshot = orjson.loads(stored)
+            if snapshot["version_number"] != version_number:
+                snapshot = None
+            elif self.cache is not None:
+                self.cache.put(sku_id, version_number, snapshot)
+        if snapshot is None:
+            product = self.session.get(Product, sku_id)
+            if product is not None and self.cache is not None:
+                self.cache.put(sku_id, version_number, snapshots.dump(product))
+            return product
+
+        return self._hydrate(snapshot)
+
+    def get_version(self, reference) -> Optional[int]:
+        """Retrieves the version_number of a Product without loading the aggregate.
+
+        Returns None if the Product does not exist or is discarded."""
+        row = self.session.execute(GET_VERSION, {"sku_id": reference}).first()
+        if row is None:
+            return None
+        return row.version_number or 0
+
+    def get_batch_owner(self, batch_id) -> Optional[Tuple[UUID, int]]:
+        """Retrieves the SKU and version_number of the Product owning a batch."""
+        row = self.session.execute(GET_BATCH_OWNER, {"batch_id": batch_id}).first()
+        if row is None:
+            return None
+        return row._sku_id, row.version_number or 0
+
+    def try_allocate(self, sku_id, order_item_id, attempts: int = 3) -> Optional[UUID]:
+        """Allocates a registered, unallocated order item with a conditional UPDATE.
+
+        Picks the batch with the earliest ETA and enough available quantity, batches
+        without ETA first, and records OrderItemAllocated in events. The UPDATE only
+        applies if the batch still has enough quantity, so concurrent allocations move
+        on to the next batch. Returns None, without changes, if the Product is already
+        loaded in the session, if the order item is unknown, discarded or allocated, or
+        if no batch has enough quantity."""
+        if self._is_loaded(sku_id):
+            return None
+
+        params = {"sku_id": sku_id, "order_item_id": order_item_id}
+        quantity = self.session.execute(GET_ORDER_ITEM_QUANTITY, params).scalar()
+        allocated = self.session.execute(GET_ALLOCATION, params).first()
+        if quantity is None or allocated is not None:
+            return None
+
+        params["requested_quantity"] = quantity
+        for _ in range(attempts):
+            batch_id = self.session.execute(GET_CANDIDATE_BATCH, params).scalar()
+            if batch_id is None:
+                return None
+            result = self.session.execute(
+                RESERVE_BATCH, {"batch_id": batch_id, "requested_quantity": quantity}
+            )
+            if result.rowcount == 1:
+                break
+        else:
+            return None
+
+        self.session.execute(
+            INSERT_ALLOCATION, {"order_item_id": order_item_id, "batches_id": batch_id}
+        )
+        self._increment_version(sku_id)
+        self.events.append(OrderItemAllocated(sku_id, order_item_id, batch_id))
+        return batch_id
+
+    def discard_batches(self, sku_id, batch_ids: Sequence[UUID]) -> Optional[int]:
+        """Discards batches of a Product and deallocates their order items, with one
+        statement per table.
+
+        Records a single OrderItemsDeallocated of all allocations in events. Batches which are
+        unknown or already discarded are skipped. Returns None, without changes, if the
+        Product is loaded in the session, discarded or unknown."""
+        if self._is_loaded(sku_id) or self.get_version(sku_id) is None:
+            return None
+        discarded = self._discard_batches(sku_id, orm.batches.c.uuid.in_(batch_ids))
+        self._increment_version(sku_id)
+        return discarded
+
+    def discard_product(self, sku_id) -> Optional[int]:
+        """Discards a Product with its SKU, order items and batches, deallocating the
+        order items, with one statement per table.
+
+        Records a single OrderItemsDeallocated of all allocations in events. Returns None,
+        without changes, if the Product is loaded in the session, discarded or
+        unknown."""
+        if self._is_loaded(sku_id) or self.get_version(sku_id) is None:
+            return None
+        discarded = self._discard_batches(sku_id)
+        self.session.execute(
+            update(orm.order_items)
+            .where(orm.order_items.c._product_id == sku_id)
+            .values(discarded=True)
+        )
+        self.session.execute(
+            update(orm.skus).where(orm.skus.c.uuid == sku_id).values(discarded=True)
+        )
+        self._increment_version(sku_id, discarded=True)
+        return discarded
+
+    def _discard_batches(self, sku_id, *conditions) -> int:
+        batches, association = orm.batches, orm.order_items_batches_association
+        order_items = orm.order_items
+        selected = (
+            batches.c._product_id == sku_id,
+            batches.c.discarded.isnot(True),
+            *conditions,
+        )
+        batch_ids = select(batches.c.uuid).where(*selected)
+        allocations = self.session.execute(
+            select(
+                association.c.order_item_id,
+                association.c.batches_id,
+                order_items.c.quantity,
+            )
+            .join_from(
+                association,
+                order_items,
+                association.c.order_item_id == order_items.c.uuid,
+            )
+            .where(association.c.batches_id.in_(batch_ids))
+        ).all()
+        self.session.execute(
+            delete(association).where(association.c.batches_id.in_(batch_ids))
+        )
+        result = self.session.execute(
+            update(batches)
+            .where(*selected)
+            .values(discarded=True, allocated_quantity=0)
+        )
+        if allocations:
+            self.events.append(
+                OrderItemsDeallocated(
+                    sku_id,
+                    [(a.order_item_id, a.quantity, a.batches_id) for a in allocations],
+                )
+            )
+        return result.rowcount
+
+    def fence_products(self) -> List[UUID]:
+        # Changed Products are fenced by the flush, before their rows are written.
+        self.session.flush()
+        for product, version in self._fenced_products():
+            if product.version_number == version:
+                self._fence(product.sku_id, version, version)
+        return list(self._stale)
+
+    def _fence_changed(self, session: Session, *_) -> None:
+        """Fences the retrieved Products whose version_number changed before the flush
+        writes them, as the written version_number is no longer the one they were
+        loaded with."""
+        with session.no_autoflush:
+            for product, version in self._fenced_products():
+                if product.version_number != version:
+                    self._fence(product.sku_id, version, product.version_number)
+
+    def _fenced_products(self) -> Iterator[Tuple[Product, int]]:
+        for product in list(self.seen):
+            version = self._fence_versions.get(product.sku_id) if product else None
+            if version is not None and inspect(product).persistent:
+                yield product, version
+
+    def _fence(self, sku_id, loaded: int, version: int) -> None:
+        params = {"sku_id": sku_id, "loaded": loaded, "version": version}
+        if self.session.execute(FENCE_VERSION, params).rowcount:
+            self._fence_versions[sku_id] = version
+        else:
+            self._stale.add(sku_id)
+
+    def _increment_version(self, sku_id, **values) -> None:
+        stmt = INCREMENT_VERSION.values(**values) if values else INCREMENT_VERSION
+        self.session.execute(stmt, {"sku_id": sku_id})
+
+    def _is_loaded(self, sku_id) -> bool:
+        return self.session.identity_map.get(identity_key(Product, sku_id)) is not None
+
+    def _hydrate(self, snapshot: Dict) -> Product:
+        """Adds the Product of a snapshot to the session without emitting SQL."""
+        product, objects = _hydrate(snapshot)
+        for obj in objects:
+            make_transient_to_detached(obj)
+        self.session.add(product)
+        return product
 
     def _add(self, product: Product) -> None:
         self.session.add(product)
+        if self.snapshots:
+            self._snapshot_versions[product.sku_id] = None
+        if self.fence:
+            self._fence_versions[product.sku_id] = None
 
     def _add_all(self, products: List[Product]) -> None:
         self.session.add_all(products)
+        if self.snapshots:
+            self._snapshot_versions.update((p.sku_id, None) for p in products)
+        if self.fence:
+            self._fence_versions.update((p.sku_id, None) for p in products)
+
+    def _write_snapshots(self, session: Session) -> None:
+        """Stores the snapshot of every added or loaded Product whose version_number
+        changed, flushing them first so their rows exist."""
+        changed = [
+            p
+            for p in self.seen
+            if p is not None
+            and p.sku_id in self._snapshot_versions
+            and p.version_number != self._snapshot_versions[p.sku_id]
+        ]
+        if not changed:
+            return
+        session.flush()
+        session.execute(
+            WRITE_SNAPSHOT,
+            [
+                {"sku_id": p.sku_id, "data": orjson.dumps(snapshots.dump(p))}
+                for p in changed
+            ],
+        )
+        self._snapshot_versions.update((p.sku_id, p.version_number) for p in changed)
+
+    def _bulk_add_all(self, products: List[Product], chunk_size: int) -> None:
+        """Inserts new Products with one executemany per table and chunk, skipping the
+        identity map and the unit of work flush of the session."""
+        products = iter(products)
+        while chunk := list(islice(products, chunk_size)):
+            rows = _ingest_rows(chunk)
+            for table in INGEST_TABLES:
+                if rows[table.name]:
+                    self.session.execute(insert(table), rows[table.name])
 
     def _delete(self, product: Product) -> None:
         self.session.delete(product)
 
     def _list(self) -> List[Product]:
         products = self.session.query(Product).all()
+        if self.fence:
+            for product in products:
+                self._fence_versions.setdefault(product.sku_id, product.version_number)
         return products
 
+    def iter_products(
+        self, after=None, limit: Optional[int] = None, chunk_size: int = 500
+    ) -> Iterator[Product]:
+        """Yields Products ordered by SKU id, starting after the provided SKU id.
+
+        Rows are fetched chunk_size at a time with their relationships loaded per chunk,
+        and every Product is expunged from the session once the caller moves on to the
+        next one, so memory does not grow with the size of the catalog. The Products
+        are not tracked as seen and must not be modified."""
+        products = orm.products
+        query = (
+            self.session.query(Product)
+            .options(*ITER_PRODUCTS_OPTIONS)
+            .order_by(products.c._sku_id)
+        )
+        if after is not None:
+            query = query.filter(products.c._sku_id > after)
+        if limit is not None:
+            query = query.limit(limit)
+        for product in query.yield_per(chunk_size):
+            yield product
+            self.session.expunge(product)
+
+    def iter_skus(
+        self, after=None, limit: Optional[int] = None, chunk_size: int = 500
+    ) -> Iterator[SKU]:
+        """Yields the SKUs of all Products ordered by id, starting after the provided id."""
+        skus, products = orm.skus, orm.products
+        query = (
+            self.session.query(SKU)
+            .join(products, products.c._sku_id == skus.c.uuid)
+            .filter(products.c.discarded.isnot(True))
+            .order_by(skus.c.uuid)
+        )
+        if after is not None:
+            query = query.filter(skus.c.uuid > after)
+        if limit is not None:
+            query = query.limit(limit)
+        for sku in query.yield_per(chunk_size):
+            yield sku
+            self.session.expunge(sku)
+
     def get_by_sku_uuid(self, uuid):
         product = self.session.get(Product, uuid)
+        if product is not None and self.fence:
+            self._fence_versions.setdefault(product.sku_id, product.version_number)
         self.seen.add(product)
         return product
 
@@ -103,31 +593,587 @@ class ProductsRepo(AbstractRepo):
         return (o for p in self.list() for o in p.order_items)
 
     def get_all_batches(self) -> Iterator[Batch]:
-        return (b for p in self.list() for b in p.batches if not b.discarded)
+        return iter(self.session.query(Batch).all())
 
 
-class MockRepo(AbstractRepo, Dict):
-    def _get(self, reference) -> Product:
-        return self.__getitem__(reference)
+# Tables written by ProductsRepo._bulk_add_all, in foreign key order.
+INGEST_TABLES = (
+    orm.skus,
+    orm.products,
+    orm.batches,
+    orm.order_items,
+    orm.order_items_batches_association,
+)
+
+
+def _ingest_rows(products: List[Product]) -> Dict[str, List[Dict]]:
+    """Returns the rows of new Products, their SKUs, batches, order items and
+    allocations, by table name."""
+    skus: Dict[UUID, SKU] = {}
+    order_items: Dict[UUID, Tuple[OrderItem, UUID]] = {}
+    rows = {table.name: [] for table in INGEST_TABLES}
+    for product in products:
+        sku_id = product.sku.uuid
+        skus[sku_id] = product.sku
+        rows["products"].append(
+            {
+                "_sku_id": sku_id,
+                "version_number": product.version_number,
+                "discarded": product.discarded,
+            }
+        )
+        for order_item in product.order_items:
+            order_items[order_item.uuid] = order_item, sku_id
+        for batch in product.batches:
+            skus[batch.sku.uuid] = batch.sku
+            rows["batches"].append(
+                {
+                    "uuid": batch.uuid,
+                    "_sku_id": batch.sku.uuid,
+                    "_product_id": sku_id,
+                    "quantity": batch.quantity,
+                    "eta": batch.eta,
+                    "allocated_quantity": batch.allocated_quantity,
+                    "discarded": batch.discarded,
+                }
+            )
+            for order_item in batch.allocated_order_items:
+                order_items[order_item.uuid] = order_item, sku_id
+                rows["association"].append(
+                    {"order_item_id": order_item.uuid, "batches_id": batch.uuid}
+                )
+    for order_item, product_id in order_items.values():
+        skus[order_item.sku.uuid] = order_item.sku
+        rows["order_items"].append(
+            {
+                "uuid": order_item.uuid,
+                "_sku_id": order_item.sku.uuid,
+                "_product_id": product_id,
+                "quantity": order_item.quantity,
+                "discarded": order_item.discarded,
+            }
+        )
+    rows["skus"] = [
+        {"uuid": sku.uuid, "name": sku.name, "discarded": sku.discarded}
+        for sku in skus.values()
+    ]
+    return rows
+
+
+def _hydrate(snapshot: Dict) -> Tuple[Product, List]:
+    """Builds the Product of a snapshot and returns it with all the objects it holds.
+
+    Sets the attributes as if they were loaded from the database, which skips the
+    attribute events and backrefs that rebuilding it with snapshots.load runs."""
+    sku_id, name, sku_discarded = snapshot["sku"]
+    sku_id = UUID(sku_id)
+    sku = _loaded(SKU, uuid=sku_id, name=name, discarded=sku_discarded)
+
+    order_items, registered = {}, set()
+    for uuid, quantity, discarded, is_registered in snapshot["order_items"]:
+        values = {"_product_id": sku_id} if is_registered else {}
+        order_item = _loaded(
+            OrderItem,
+            uuid=UUID(uuid),
+            _sku_id=sku_id,
+            sku=sku,
+            quantity=quantity,
+            discarded=discarded,
+            **values,
+        )
+        order_items[uuid] = order_item
+        if is_registered:
+            registered.add(order_item)
+
+    batches = set()
+    for uuid, quantity, allocated, eta, discarded, allocations in snapshot["batches"]:
+        batch = _loaded(
+            Batch,
+            uuid=UUID(uuid),
+            _sku_id=sku_id,
+            _product_id=sku_id,
+            sku=sku,
+            quantity=quantity,
+            allocated_quantity=allocated,
+            eta=date.fromisoformat(eta) if eta else None,
+            discarded=discarded,
+            allocated_order_items={order_items[oi] for oi in allocations},
+        )
+        batches.add(batch)
+
+    product = _loaded(
+        Product,
+        _sku_id=sku_id,
+        sku=sku,
+        version_number=snapshot["version_number"],
+        discarded=snapshot["discarded"],
+        batches=batches,
+        order_items=registered,
+    )
+    return product, [sku, product, *batches, *order_items.values()]
+
+
+def _loaded(cls, **values):
+    """Returns a new instance of a mapped class with values set as loaded state."""
+    instance = class_mapper(cls).class_manager.new_instance()
+    for key, value in values.items():
+        set_committed_value(instance, key, value)
+    return instance
+
+
+_events, _stream_snapshots = orm.product_events, orm.product_stream_snapshots
+GET_STREAM_SNAPSHOT = select(
+    _stream_snapshots.c.sequence, _stream_snapshots.c.data
+).where(_stream_snapshots.c.sku_id == bindparam("sku_id"))
+GET_STREAM_EVENTS = (
+    select(_events.c.sequence, _events.c.version_number, _events.c.data)
+    .where(
+        _events.c.sku_id == bindparam("sku_id"),
+        _events.c.sequence > bindparam("sequence"),
+    )
+    .order_by(_events.c.sequence)
+)
+GET_STREAM_HEAD = (
+    select(_events.c.type, _events.c.version_number)
+    .where(_events.c.sku_id == bindparam("sku_id"))
+    .order_by(_events.c.sequence.desc())
+    .limit(1)
+)
+GET_STREAM_IDS = select(_events.c.sku_id).distinct().order_by(_events.c.sku_id)
+APPEND_EVENTS = insert(_events)
+DELETE_STREAM = delete(_events).where(_events.c.sku_id == bindparam("sku_id"))
+DELETE_STREAM_SNAPSHOT = delete(_stream_snapshots).where(
+    _stream_snapshots.c.sku_id == bindparam("sku_id")
+)
+INSERT_STREAM_SNAPSHOT = insert(_stream_snapshots)
+
+
+class EventSourcedRepo(AbstractRepo):
+    """Stores every Product as an append-only stream of events per sku_id.
+
+    On commit, the changes of every added or loaded Product are appended as events
+    derived by allocation.core.streams, instead of updating the rows of its batches
+    and order items. A snapshot of the Product is stored every snapshot_interval
+    events, and a Product is rebuilt from its latest snapshot and the events after it.
+    Two units of work appending to the same stream conflict on its primary key, and
+    the last one to commit fails with an IntegrityError.
+
+    The relational tables, and the views, fast paths and exports reading them, are
+    not maintained."""
+
+    def __init__(self, session: Session, snapshot_interval: Optional[int] = None):
+        super().__init__()
+        self.session = session
+        self.snapshot_interval = (
+            snapshot_interval or get_config().EVENT_SNAPSHOT_INTERVAL
+        )
+        self._products: Dict[UUID, Product] = {}
+        # Snapshot and last sequence of every stream, when it was loaded or appended to.
+        self._streams: Dict[UUID, Tuple[Optional[Dict], int]] = {}
+        event.listen(session, "before_commit", self._append_events)
+
+    def _get(self, reference) -> Optional[Product]:
+        sku_id = reference if isinstance(reference, UUID) else UUID(str(reference))
+        if sku_id in self._products:
+            return self._products[sku_id]
+        row = self.session.execute(GET_STREAM_SNAPSHOT, {"sku_id": sku_id}).first()
+        snapshot, sequence = (
+            (None, 0) if row is None else (orjson.loads(row.data), row.sequence)
+        )
+        rows = self.session.execute(
+            GET_STREAM_EVENTS, {"sku_id": sku_id, "sequence": sequence}
+        ).all()
+        if snapshot is None and not rows:
+            return None
+        if rows:
+            events = [Event.from_dict(orjson.loads(r.data)) for r in rows]
+            snapshot = streams.replay(snapshot, events, rows[-1].version_number)
+            sequence = rows[-1].sequence
+        product = snapshots.load(snapshot)
+        self._products[sku_id] = product
+        self._streams[sku_id] = (snapshot, sequence)
+        return product
+
+    def get_version(self, reference) -> Optional[int]:
+        """Retrieves the version_number of a Product from the last event of its stream.
+
+        Returns None if the Product does not exist or is discarded."""
+        row = self.session.execute(GET_STREAM_HEAD, {"sku_id": reference}).first()
+        if row is None or row.type == ProductDiscarded.__name__:
+            return None
+        return row.version_number
+
+    def history(self, reference) -> List[Event]:
+        """Retrieves all events of the stream of a Product, oldest first."""
+        rows = self.session.execute(
+            GET_STREAM_EVENTS, {"sku_id": reference, "sequence": 0}
+        )
+        return [Event.from_dict(orjson.loads(row.data)) for row in rows]
+
+    def _add(self, product: Product) -> None:
+        self._products[product.sku_id] = product
+        self._streams[product.sku_id] = (None, 0)
+
+    def _add_all(self, products: List[Product]) -> None:
+        for product in products:
+            self._add(product)
+
+    def _delete(self, product: Product) -> None:
+        for stmt in (DELETE_STREAM, DELETE_STREAM_SNAPSHOT):
+            self.session.execute(stmt, {"sku_id": product.sku_id})
+        self._products.pop(product.sku_id, None)
+        self._streams.pop(product.sku_id, None)
+
+    def _list(self) -> List[Product]:
+        sku_ids = self.session.execute(GET_STREAM_IDS).scalars().all()
+        return [p for p in map(self._get, sku_ids) if not p.discarded]
+
+    def get_all_order_items(self) -> Iterator[OrderItem]:
+        return (o for p in self.list() for o in p.order_items)
+
+    def get_all_batches(self) -> Iterator[Batch]:
+        return (b for p in self.list() for b in p.batches)
+
+    def _append_events(self, session: Session) -> None:
+        """Appends the events of every changed Product to its stream, and stores a
+        snapshot when the stream passes a multiple of snapshot_interval events.
+
+        A snapshot is stored as well when the events do not reproduce the Product,
+        which happens for changes the events cannot describe, like a version_number
+        incremented without a change."""
+        rows, snapshot_rows = [], []
+        for sku_id, product in self._products.items():
+            before, sequence = self._streams[sku_id]
+            after = snapshots.dump(product)
+            if before is not None and streams.same(before, after):
+                continue
+            events = streams.changes(before, after)
+            rows.extend(
+                {
+                    "sku_id": sku_id,
+                    "sequence": sequence + i,
+                    "type": e.cname,
+                    "version_number": product.version_number,
+                    "data": orjson.dumps(e.to_dict()),
+                }
+                for i, e in enumerate(events, 1)
+            )
+            last = sequence + len(events)
+            # Without events, the version_number is only stored with a snapshot.
+            version_number = product.version_number if events else None
+            replayed = streams.replay(before, events, version_number)
+            if last // self.snapshot_interval > sequence // self.snapshot_interval or (
+                not streams.same(replayed, after)
+            ):
+                snapshot_rows.append(
+                    {"sku_id": sku_id, "sequence": last, "data": orjson.dumps(after)}
+                )
+            self._streams[sku_id] = (after, last)
+        if rows:
+            session.execute(APPEND_EVENTS, rows)
+        if snapshot_rows:
+            session.execute(DELETE_STREAM_SNAPSHOT, snapshot_rows)
+            session.execute(INSERT_STREAM_SNAPSHOT, snapshot_rows)
+
+
+class InMemoryRepo(AbstractRepo):
+    """Keeps Products in an InMemoryStore shared by units of work.
+
+    Every unit of work rebuilds its own copies of the Products it loads, so their
+    changes are not visible to other units of work until committed. On commit, the
+    Products whose version_number changed are written back to the store, which
+    raises ConflictError if another unit of work committed one of them in the
+    meantime."""
+
+    def __init__(self, store: InMemoryStore):
+        super().__init__()
+        self.store = store
+        self._products: Dict[UUID, Product] = {}
+        # version_number of every Product when it was loaded, or None if it was added.
+        self._versions: Dict[UUID, Optional[int]] = {}
+        self._deleted: Dict[UUID, Optional[int]] = {}
+
+    def _get(self, reference) -> Optional[Product]:
+        sku_id = reference if isinstance(reference, UUID) else UUID(str(reference))
+        product = self._products.get(sku_id)
+        if product is None and sku_id not in self._deleted:
+            snapshot = self.store.get(sku_id)
+            if snapshot is not None:
+                product = self._products[sku_id] = snapshots.load(snapshot)
+                self._versions[sku_id] = product.version_number
+        return product
+
+    def get_version(self, reference) -> Optional[int]:
+        """Retrieves the committed version_number of a Product.
+
+        Returns None if the Product does not exist or is discarded."""
+        sku_id = reference if isinstance(reference, UUID) else UUID(str(reference))
+        snapshot = self.store.get(sku_id)
+        if snapshot is None or snapshot["discarded"]:
+            return None
+        return snapshot["version_number"]
+
+    def get_batch_owner(self, batch_id) -> Optional[Tuple[UUID, int]]:
+        """Retrieves the SKU and version_number of the Product owning a batch."""
+        sku_id = self.store.batch_owner(batch_id)
+        version_number = self.get_version(sku_id) if sku_id else None
+        if version_number is None:
+            return None
+        return sku_id, version_number
+
+    def _add(self, product: Product) -> None:
+        self._products[product.sku_id] = product
+        self._versions[product.sku_id] = None
+        self._deleted.pop(product.sku_id, None)
+
+    def _add_all(self, products: List[Product]) -> None:
+        for product in products:
+            self._add(product)
+
+    def _delete(self, product: Product) -> None:
+        self._products.pop(product.sku_id, None)
+        version_number = self._versions.pop(product.sku_id, None)
+        if version_number is not None:
+            self._deleted[product.sku_id] = version_number
+
+    def _list(self) -> List[Product]:
+        products = map(self._get, self.store.sku_ids())
+        return [p for p in products if p is not None and not p.discarded]
+
+    def get_all_order_items(self) -> Iterator[OrderItem]:
+        return (o for p in self.list() for o in p.order_items)
+
+    def get_all_batches(self) -> Iterator[Batch]:
+        return (b for p in self.list() for b in p.batches)
+
+    def commit(self) -> None:
+        changes = {
+            sku_id: snapshots.dump(product)
+            for sku_id, product in self._products.items()
+            if product.version_number != self._versions[sku_id]
+        }
+        changes.update(dict.fromkeys(self._deleted))
+        versions = {**self._versions, **self._deleted}
+        if changes:
+            self.store.commit(changes, versions)
+        self._versions.update(
+            (sku_id, s["version_number"]) for sku_id, s in changes.items() if s
+        )
+        self._deleted.clear()
+
+    def rollback(self) -> None:
+        """Discards the Products of the unit of work, which are reloaded on access."""
+        self._products.clear()
+        self._versions.clear()
+        self._deleted.clear()
+        self.seen.clear()
+
+
+class PinnedProductsRepo(ProductsRepo):
+    """ProductsRepo of a ProductActor, whose session only holds the Product of the
+    actor. The order items of all Products are limited to the retrieved ones, which
+    spares loading the whole catalog when allocating."""
+
+    def get_all_order_items(self) -> Iterator[OrderItem]:
+        return (o for p in self.seen for o in p.order_items)
+
+
+class ShardedRepo(AbstractRepo):
+    """Routes every Product to the ProductsRepo of the shard owning its SKU on a ring.
+
+    The session of a shard is only requested once one of its Products is used, so a
+    unit of work about a single SKU touches a single database. Listings gather the
+    Products of all shards, and the ordered iterators merge them by SKU id."""
+
+    def __init__(
+        self,
+        ring: HashRing,
+        session_for: Callable[[str], Session],
+        cache: Optional[ProductCache] = None,
+        fence: bool = False,
+    ):
+        super().__init__()
+        self.ring = ring
+        self.session_for = session_for
+        self.cache = cache
+        self.fence = fence
+        self.repos: Dict[str, ProductsRepo] = {}
+
+    def repo_for(self, sku_id) -> ProductsRepo:
+        return self._repo(self.ring.shard_for(sku_id))
+
+    def _repo(self, shard: str) -> ProductsRepo:
+        repo = self.repos.get(shard)
+        if repo is None:
+            repo = ProductsRepo(self.session_for(shard), self.cache, fence=self.fence)
+            # Events recorded by the fast paths of a shard are collected from this repo.
+            repo.events = self.events
+            self.repos[shard] = repo
+        return repo
+
+    def _all(self) -> List[ProductsRepo]:
+        return [self._repo(shard) for shard in self.ring.shards]
+
+    def _by_shard(self, products: List[Product]) -> Dict[str, List[Product]]:
+        shards: Dict[str, List[Product]] = {}
+        for product in products:
+            shards.setdefault(self.ring.shard_for(product.sku_id), []).append(product)
+        return shards
+
+    def _get(self, reference) -> Optional[Product]:
+        repo = self.repo_for(reference)
+        product = repo._get(reference)
+        if product is not None:
+            repo.seen.add(product)
+        return product
+
+    def _add(self, product: Product) -> None:
+        self.repo_for(product.sku_id).add(product)
+
+    def _add_all(self, products: List[Product]) -> None:
+        for shard, group in self._by_shard(products).items():
+            self._repo(shard).add_all(group)
+
+    def _bulk_add_all(self, products: List[Product], chunk_size: int) -> None:
+        for shard, group in self._by_shard(products).items():
+            self._repo(shard).add_all(group, bulk=True, chunk_size=chunk_size)
+
+    def _delete(self, product: Product) -> None:
+        self.repo_for(product.sku_id).delete(product)
+
+    def _list(self) -> List[Product]:
+        return [p for repo in self._all() for p in repo.list()]
+
+    def get_version(self, reference) -> Optional[int]:
+        return self.repo_for(reference).get_version(reference)
+
+    def get_batch_owner(self, batch_id) -> Optional[Tuple[UUID, int]]:
+        for repo in self._all():
+            owner = repo.get_batch_owner(batch_id)
+            if owner is not None:
+                return owner
+        return None
+
+    def try_allocate(self, sku_id, order_item_id) -> Optional[UUID]:
+        return self.repo_for(sku_id).try_allocate(sku_id, order_item_id)
+
+    def discard_batches(self, sku_id, batch_ids: Sequence[UUID]) -> Optional[int]:
+        return self.repo_for(sku_id).discard_batches(sku_id, batch_ids)
+
+    def discard_product(self, sku_id) -> Optional[int]:
+        return self.repo_for(sku_id).discard_product(sku_id)
+
+    def iter_products(
+        self, after=None, limit: Optional[int] = None, chunk_size: int = 500
+    ) -> Iterator[Product]:
+        """Yields the Products of all shards ordered by SKU id, see
+        ProductsRepo.iter_products."""
+        products = heapq.merge(
+            *(r.iter_products(after, limit, chunk_size) for r in self._all()),
+            key=lambda p: p.sku_id,
+        )
+        return islice(products, limit)
+
+    def iter_skus(
+        self, after=None, limit: Optional[int] = None, chunk_size: int = 500
+    ) -> Iterator[SKU]:
+        """Yields the SKUs of all shards ordered by id, see ProductsRepo.iter_skus."""
+        skus = heapq.merge(
+            *(r.iter_skus(after, limit, chunk_size) for r in self._all()),
+            key=lambda s: s.uuid,
+        )
+        return islice(skus, limit)
+
+    def fence_products(self) -> List[UUID]:
+        return [s for repo in self.repos.values() for s in repo.fence_products()]
+
+    def get_all_order_items(self) -> Iterator[OrderItem]:
+        return chain.from_iterable(r.get_all_order_items() for r in self._all())
+
+    def get_all_batches(self) -> Iterator[Batch]:
+        return chain.from_iterable(r.get_all_batches() for r in self._all())
+
+
+def _copy_product(product: Product) -> Product:
+    """Returns a copy of a Product sharing no mutable object with it, with its discarded
+    batches and order items, its version_number and its pending events."""
+    sku = replace(product.sku)
+    order_items = {o.uuid: replace(o, sku=sku) for o in product.order_items}
+    batches = {
+        replace(
+            b,
+            sku=sku,
+            allocated_order_items={
+                order_items.get(o.uuid) or replace(o, sku=sku)
+                for o in b.allocated_order_items
+            },
+        )
+        for b in product.batches
+    }
+    copied = Product(sku, set(order_items.values()), batches, product.discarded)
+    copied.version_number = product.version_number
+    copied.events = list(product.events)
+    return copied
+
+
+class MockRepo(AbstractRepo):
+    """Keeps Products in a persistent map, which shares its structure with the
+    versions of itself taken by snapshot, so that snapshot and restore are O(1).
+
+    The domain collections of a Product are mutable, so every Product is copied the
+    first time it is retrieved after a snapshot, and the copy replaces it in the map.
+    Restoring a snapshot then also undoes the changes made to the Products."""
+
+    def __init__(self, products: Optional[Dict[UUID, Product]] = None):
+        super().__init__()
+        self.products: PMap = pmap(products or {})
+        # sku_ids of the Products stored since the last snapshot, which are not copied.
+        self._owned = set()
+
+    def __len__(self) -> int:
+        return len(self.products)
+
+    def __contains__(self, sku_id) -> bool:
+        return sku_id in self.products
+
+    def snapshot(self) -> PMap:
+        self._owned = set()
+        return self.products
+
+    def restore(self, snapshot: PMap) -> None:
+        self.products = snapshot
+        self._owned = set()
+
+    def _get(self, reference) -> Optional[Product]:
+        sku_id = reference if isinstance(reference, UUID) else UUID(str(reference))
+        product = self.products.get(sku_id)
+        if product is not None and sku_id not in self._owned:
+            product = _copy_product(product)
+            self._store({sku_id: product})
+        return product
 
     def _add(self, product) -> None:
-        self[product.sku_id] = product
+        self._store({product.sku_id: product})
 
     def _add_all(self, products: List[Product]) -> None:
-        for prod in products:
-            self.update({prod.sku_id: prod})
+        self._store({p.sku_id: p for p in products})
+
+    def _store(self, products: Dict[UUID, Product]) -> None:
+        self.products = self.products.update(products)
+        self._owned.update(products)
 
     def _delete(self, product: Product) -> None:
-        try:
-            del self[product]
-        except KeyError:
-            pass
+        self.products = self.products.discard(product.sku_id)
+        self._owned.discard(product.sku_id)
+
+    def _list(self) -> List[Product]:
+        return [self._get(sku_id) for sku_id in self.products]
 
-    def _list(self) -> Iterator[Product]:
-        return list(self.values())
+    def get_all_order_items(self) -> Iterator[OrderItem]:
+        return (o for p in self.list() for o in p.order_items)
 
     def get_all_batches(self) -> Iterator[Batch]:
-        pass
+        return (b for p in self.list() for b in p.batches)
 
 
 repos = {
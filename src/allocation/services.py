@@ -1,8 +1,18 @@
 import smtplib
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Sequence, Union
 from uuid import UUID
 
+from sqlalchemy import DateTime, delete, exists, insert, literal, select
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import ColumnElement
+
+from allocation import views
 from allocation.core import commands, domain, events
-from allocation.interfaces.external_bus import create_redis_client
+from allocation.interfaces.cache import product_cache, read_model_cache
+from allocation.interfaces.database import orm
+from allocation.interfaces.external_bus import redis_client
+from allocation.repositories import InvalidSKU
 from allocation.unit_of_work import AbstractUnitOfWork
 
 
@@ -23,10 +33,176 @@ def mock_send_email_notification(event: events.Event) -> None:
 
 
 def publish_message_to_external_bus(event: events.Event) -> None:
-    redis_client = create_redis_client()
     redis_client.publish_channel_message(event)
 
 
+def invalidate_cached_product(event: events.Event) -> None:
+    product_cache.invalidate(event.sku_id)
+
+
+def invalidate_cached_read_models(event: events.Event) -> None:
+    read_model_cache.invalidate(event.sku_id)
+
+
+def add_allocation_to_read_model(
+    event: events.OrderItemAllocated, uow: AbstractUnitOfWork
+) -> None:
+    if event.batch_id is None:
+        return
+    view = orm.allocations_view
+    with uow:
+        session = uow.session_for(event.sku_id)
+        if session is None:
+            return
+        session.execute(
+            delete(view).where(
+                view.c.order_item_id == event.order_item_id,
+                view.c.batch_id == event.batch_id,
+            )
+        )
+        session.execute(
+            insert(view).values(
+                order_item_id=event.order_item_id,
+                batch_id=event.batch_id,
+                sku_id=event.sku_id,
+            )
+        )
+
+
+def remove_allocation_from_read_model(
+    event: events.OrderItemDeallocated, uow: AbstractUnitOfWork
+) -> None:
+    view = orm.allocations_view
+    stmt = delete(view).where(view.c.order_item_id == event.order_item_id)
+    if event.batch_id is not None:
+        stmt = stmt.where(view.c.batch_id == event.batch_id)
+    with uow:
+        session = uow.session_for(event.sku_id)
+        if session is not None:
+            session.execute(stmt)
+
+
+def remove_allocations_from_read_model(
+    event: events.OrderItemsDeallocated, uow: AbstractUnitOfWork
+) -> None:
+    """Removes the allocations of the discarded batches with one statement, which
+    deallocated all of their order items."""
+    view = orm.allocations_view
+    batch_ids = {batch_id for _, _, batch_id in event.allocations}
+    with uow:
+        session = uow.session_for(event.sku_id)
+        if session is not None:
+            session.execute(delete(view).where(view.c.batch_id.in_(batch_ids)))
+
+
+def rebuild_allocations_view(
+    cmd: commands.RebuildAllocationsView, uow: AbstractUnitOfWork
+) -> int:
+    """Replaces the content of allocations_view and returns the number of rows."""
+    view = orm.allocations_view
+    rows = 0
+    with uow:
+        for session in uow.all_sessions():
+            session.execute(delete(view))
+            rows += session.execute(
+                insert(view).from_select(
+                    ["order_item_id", "batch_id", "sku_id"], views.allocations_source()
+                )
+            ).rowcount
+    return rows
+
+
+def archive_discarded(
+    cmd: commands.ArchiveDiscarded, uow: AbstractUnitOfWork
+) -> Dict[str, int]:
+    """Moves discarded batches, order items, Products and SKUs to their archive tables.
+
+    Rows are moved cmd.chunk_size at a time per shard with their allocations, each
+    chunk in its own transaction. Discarding a Product discards its SKU and all of its
+    batches and order items, so they are all moved. Order items allocated to a batch
+    which is not discarded stay, as its allocated_quantity includes them, and so do
+    Products with remaining batches or order items, and SKUs still referenced. Returns
+    the number of rows moved per table."""
+    skus, products, batches = orm.skus, orm.products, orm.batches
+    order_items, association = orm.order_items, orm.order_items_batches_association
+    allocated = (
+        select(association.c.order_item_id)
+        .join_from(association, batches, association.c.batches_id == batches.c.uuid)
+        .where(
+            association.c.order_item_id == order_items.c.uuid,
+            batches.c.discarded.isnot(True),
+        )
+    )
+    candidates = (
+        (batches, batches.c.discarded.is_(True), association.c.batches_id),
+        (
+            order_items,
+            order_items.c.discarded.is_(True) & ~exists(allocated),
+            association.c.order_item_id,
+        ),
+        (
+            products,
+            products.c.discarded.is_(True)
+            & ~exists().where(batches.c._product_id == products.c._sku_id)
+            & ~exists().where(order_items.c._product_id == products.c._sku_id),
+            None,
+        ),
+        (
+            skus,
+            skus.c.discarded.is_(True)
+            & ~exists().where(products.c._sku_id == skus.c.uuid)
+            & ~exists().where(batches.c._sku_id == skus.c.uuid)
+            & ~exists().where(order_items.c._sku_id == skus.c.uuid)
+            & ~exists().where(orm.orders.c.uuid == skus.c.uuid),
+            None,
+        ),
+    )
+    archived_at = datetime.utcnow()
+    moved = dict.fromkeys(
+        ["association", "batches", "order_items", "products", "skus"], 0
+    )
+    for table, condition, allocations in candidates:
+        (key,) = table.primary_key.columns
+        found = True
+        while found:
+            found = False
+            with uow:
+                for session in uow.all_sessions():
+                    ids = (
+                        session.execute(
+                            select(key).where(condition).limit(cmd.chunk_size)
+                        )
+                        .scalars()
+                        .all()
+                    )
+                    if not ids:
+                        continue
+                    found = True
+                    if allocations is not None:
+                        moved["association"] += _archive_rows(
+                            session, association, allocations.in_(ids), archived_at
+                        )
+                    moved[table.name] += _archive_rows(
+                        session, table, key.in_(ids), archived_at
+                    )
+    return moved
+
+
+def _archive_rows(
+    session: Session, table, condition: ColumnElement, archived_at: datetime
+) -> int:
+    """Copies the rows of table matching condition to its archive table and deletes
+    them. Returns the number of rows moved."""
+    archive = orm.mapper_registry.metadata.tables[f"{table.name}_archive"]
+    session.execute(
+        insert(archive).from_select(
+            [*table.c.keys(), "archived_at"],
+            select(*table.c, literal(archived_at, DateTime)).where(condition),
+        )
+    )
+    return session.execute(delete(table).where(condition)).rowcount
+
+
 def create_order_item(cmd: commands.CreateOrderItem, uow: AbstractUnitOfWork) -> UUID:
     with uow:
         product = uow.products.get(cmd.sku_id)
@@ -50,6 +226,81 @@ def create_batch(cmd: commands.CreateBatch, uow: AbstractUnitOfWork) -> UUID:
         return batch.uuid
 
 
+def create_batches(
+    cmds: Sequence[commands.CreateBatch], uow: AbstractUnitOfWork, chunk_size: int = 100
+) -> List[Union[UUID, Exception]]:
+    """Creates batches for any number of SKUs.
+
+    Returns the id of each created batch in the order of the commands, or the error
+    which prevented it, see _apply_per_product."""
+
+    def register_batch(product: domain.Product, cmd: commands.CreateBatch) -> UUID:
+        batch = domain.create_batch(product.sku, cmd.quantity, cmd.eta)
+        product.register_batch(batch)
+        return batch.uuid
+
+    return _apply_per_product(cmds, uow, register_batch, chunk_size)
+
+
+def create_order_items(
+    cmds: Sequence[commands.CreateOrderItem],
+    uow: AbstractUnitOfWork,
+    chunk_size: int = 100,
+) -> List[Union[UUID, Exception]]:
+    """Creates order items for any number of SKUs.
+
+    Returns the id of each created order item in the order of the commands, or the
+    error which prevented it, see _apply_per_product."""
+
+    def register_order_item(
+        product: domain.Product, cmd: commands.CreateOrderItem
+    ) -> UUID:
+        order_item = domain.create_order_item(product.sku, cmd.quantity)
+        product.register_order_item(order_item)
+        return order_item.uuid
+
+    return _apply_per_product(cmds, uow, register_order_item, chunk_size)
+
+
+def _apply_per_product(
+    cmds: Sequence[commands.Command],
+    uow: AbstractUnitOfWork,
+    apply: Callable[[domain.Product, commands.Command], UUID],
+    chunk_size: int,
+) -> List[Union[UUID, Exception]]:
+    """Applies the commands grouped by sku_id, loading every Product once.
+
+    The Products are changed and committed chunk_size at a time, each chunk in its own
+    transaction. A chunk that fails is rolled back, while the chunks before and after
+    it stay committed. Returns the id created by each command, or the error that
+    prevented it: InvalidSKU for an unknown SKU, or the error of its failed chunk."""
+    by_sku: Dict[UUID, List[int]] = {}
+    for index, cmd in enumerate(cmds):
+        by_sku.setdefault(cmd.sku_id, []).append(index)
+
+    results: List[Union[UUID, Exception]] = [None] * len(cmds)
+    groups = list(by_sku.items())
+    for start in range(0, len(groups), chunk_size):
+        chunk = groups[start : start + chunk_size]
+        try:
+            with uow:
+                for sku_id, indexes in chunk:
+                    try:
+                        product = uow.products.get(sku_id)
+                    except InvalidSKU as e:
+                        for index in indexes:
+                            results[index] = e
+                        continue
+                    for index in indexes:
+                        results[index] = apply(product, cmds[index])
+        except Exception as e:
+            for _, indexes in chunk:
+                for index in indexes:
+                    if not isinstance(results[index], InvalidSKU):
+                        results[index] = e
+    return results
+
+
 def discard_order_item(cmd: commands.DiscardOrderItem, uow: AbstractUnitOfWork) -> None:
     with uow:
         product = uow.products.get(cmd.sku_id)
@@ -60,14 +311,27 @@ def discard_order_item(cmd: commands.DiscardOrderItem, uow: AbstractUnitOfWork)
             product.deregister_order_item(order_item)
 
 
-def allocate(cmd: commands.Allocate, uow: AbstractUnitOfWork) -> UUID:
-    """Takes an order item and allocates available stock from known batches."""
+def allocate(cmd: commands.Allocate, uow: AbstractUnitOfWork) -> Optional[UUID]:
+    """Takes an order item and allocates available stock from known batches.
+
+    Returns None if no batch has enough stock available."""
     with uow:
         product = uow.products.get(cmd.sku_id)
         all_order_items = uow.products.get_all_order_items()
         order_item = next(oi for oi in all_order_items if oi.uuid == cmd.order_item_id)
         batch = product.allocate(order_item)
-        return batch.uuid
+        return batch.uuid if batch else None
+
+
+def allocate_fast(cmd: commands.Allocate, uow: AbstractUnitOfWork) -> Optional[UUID]:
+    """Allocates an order item with a conditional UPDATE of the chosen batch.
+
+    Falls back to allocate, if the allocation cannot be made without the aggregate."""
+    with uow:
+        batch_id = uow.products.try_allocate(cmd.sku_id, cmd.order_item_id)
+    if batch_id is None:
+        return allocate(cmd, uow)
+    return batch_id
 
 
 def change_batch_quantity(
@@ -81,6 +345,8 @@ def change_batch_quantity(
 
 def discard_batch(cmd: commands.DiscardBatch, uow: AbstractUnitOfWork) -> None:
     with uow:
+        if uow.products.discard_batches(cmd.sku_id, [cmd.batch_id]) is not None:
+            return
         product = uow.products.get(cmd.sku_id)
         batch = next((b for b in product.batches if b.uuid == cmd.batch_id), None)
         if batch:
@@ -90,24 +356,20 @@ def discard_batch(cmd: commands.DiscardBatch, uow: AbstractUnitOfWork) -> None:
 def update_product(cmd: commands.UpdateProduct, uow: AbstractUnitOfWork) -> UUID:
     with uow:
         product = uow.products.get(cmd.sku_id)
-        product.sku.name = cmd.name
+        product.rename(cmd.name)
         return product.sku.uuid
 
 
 def update_order_item(cmd: commands.UpdateOrderItem, uow: AbstractUnitOfWork) -> UUID:
     with uow:
         product = uow.products.get(cmd.sku_id)
-        order_item = next(
-            oi for oi in product.order_items if oi.uuid == cmd.order_item_id
-        )
-        order_item.quantity = cmd.quantity
+        order_item = product.change_order_item_quantity(cmd.order_item_id, cmd.quantity)
         return order_item.uuid
 
 
 def discard_product(cmd: commands.DiscardProduct, uow: AbstractUnitOfWork) -> None:
     with uow:
+        if uow.products.discard_product(cmd.sku_id) is not None:
+            return
         product = uow.products.get(cmd.sku_id)
-        if product:
-            for b in product.batches:
-                discard_batch(b, uow)
-            product.discarded = True
+        product.discard()
@@ -1,15 +1,31 @@
-import copy
 from abc import ABC, abstractmethod
 from sqlite3 import OperationalError
+from typing import Dict, List, Optional
 
+from pyrsistent.typing import PMap
 from sqlalchemy.orm import Session
 
+from allocation.interfaces.cache import ProductCache, product_cache
+from allocation.interfaces.database import shards
 from allocation.interfaces.database.db import SessionFactory, session_factory
-from allocation.repositories import AbstractRepo, MockRepo, ProductsRepo
+from allocation.interfaces.database.shards import ShardedDatabase
+from allocation.interfaces.leases import Lease, StaleLease
+from allocation.interfaces.memory import InMemoryStore
+from allocation.repositories import (
+    AbstractRepo,
+    EventSourcedRepo,
+    InMemoryRepo,
+    MockRepo,
+    PinnedProductsRepo,
+    ProductsRepo,
+    ShardedRepo,
+)
 
 
 class AbstractUnitOfWork(ABC):
     products: AbstractRepo
+    # Lease of the SKU of the command handled, set by the message bus.
+    lease: Optional[Lease] = None
 
     @abstractmethod
     def __enter__(self):
@@ -25,11 +41,37 @@ class AbstractUnitOfWork(ABC):
         return self._close()
 
     def commit(self) -> None:
+        try:
+            self.check_lease()
+        except StaleLease:
+            self.rollback()
+            raise
         return self._commit()
 
     def rollback(self) -> None:
         return self._rollback()
 
+    def session_for(self, sku_id) -> Optional[Session]:
+        """Returns the session holding the rows of the SKU, or None if the unit of work
+        does not store Products in a database."""
+        return None
+
+    def all_sessions(self) -> List[Session]:
+        """Returns the sessions of all databases, for queries across all SKUs."""
+        return []
+
+    def check_lease(self) -> None:
+        """Raises StaleLease if the unit of work holds a lease that was lost, or that
+        expired while a Product it retrieved was committed by someone else.
+
+        The version_number of the retrieved Products is written only where it is still
+        the one they were read with, which locks their rows until commit, so a worker
+        taking over the expired lease cannot commit them in between. The lease is
+        checked after, so its fencing token is still the latest of its SKU once the
+        rows are locked."""
+        if self.lease is not None:
+            self.lease.manager.check(self.lease, self.products.fence_products())
+
     @abstractmethod
     def _close(self):
         raise NotImplementedError
@@ -43,6 +85,8 @@ class AbstractUnitOfWork(ABC):
         raise NotImplementedError
 
     def collect_new_messages(self):
+        while self.products.events:
+            yield self.products.events.pop(0)
         for product in self.products.seen:
             while product.events:
                 yield product.events.pop(0)
@@ -50,13 +94,13 @@ class AbstractUnitOfWork(ABC):
 
 class MockUnitOfWork(AbstractUnitOfWork):
     products: MockRepo
-    _rollback_version: MockRepo
+    _rollback_version: PMap
 
     def __init__(self, products):
         self.products = products
 
     def __enter__(self):
-        self._rollback_version = copy.copy(self.products)
+        self._rollback_version = self.products.snapshot()
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
@@ -69,34 +113,78 @@ class MockUnitOfWork(AbstractUnitOfWork):
         ...
 
     def _commit(self):
-        self._rollback_version = self.products
+        self._rollback_version = self.products.snapshot()
 
     def _rollback(self):
-        self.products = self._rollback_version
+        self.products.restore(self._rollback_version)
+
+
+class InMemoryUnitOfWork(AbstractUnitOfWork):
+    products: InMemoryRepo
+
+    def __init__(self, store: InMemoryStore):
+        self.store = store
+
+    def __enter__(self):
+        self.products = InMemoryRepo(self.store)
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type:
+            self.rollback()
+        else:
+            self.commit()
+
+    def _close(self):
+        ...
+
+    def _commit(self):
+        self.products.commit()
+
+    def _rollback(self):
+        self.products.rollback()
 
 
 class UnitOfWork(AbstractUnitOfWork):
     session: Session
     products: ProductsRepo
 
-    def __init__(self, factory: SessionFactory = session_factory):
+    def __init__(
+        self,
+        factory: SessionFactory = session_factory,
+        cache: ProductCache = product_cache,
+        expire_on_commit: bool = True,
+    ):
         self.session_factory = factory
+        self.cache = cache
+        self.expire_on_commit = expire_on_commit
 
     def __enter__(self):
-        self.session = self.session_factory()
-        self.products = ProductsRepo(self.session)
+        self.session = self.session_factory(expire_on_commit=self.expire_on_commit)
+        self.products = ProductsRepo(
+            self.session, self.cache, fence=self.lease is not None
+        )
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         if exc_type:
             self.rollback()
         try:
+            # Work committed with commit() was checked already.
+            if not exc_type and self.session.in_transaction():
+                self.check_lease()
             self.session.commit()
         except OperationalError:
             self.session.rollback()
         finally:
             self.session.close()
 
+    def session_for(self, sku_id) -> Session:
+        return self.session
+
+    def all_sessions(self) -> List[Session]:
+        return [self.session]
+
     def _close(self):
         if self.session.is_active:
             self.session.close()
@@ -106,3 +194,132 @@ class UnitOfWork(AbstractUnitOfWork):
 
     def _rollback(self):
         self.session.rollback()
+
+
+class EventSourcedUnitOfWork(UnitOfWork):
+    """UnitOfWork storing Products as event streams, see EventSourcedRepo."""
+
+    products: EventSourcedRepo
+
+    def __enter__(self):
+        self.session = self.session_factory(expire_on_commit=self.expire_on_commit)
+        self.products = EventSourcedRepo(self.session)
+        return self
+
+
+class ShardedUnitOfWork(AbstractUnitOfWork):
+    """UnitOfWork over a ShardedDatabase, with a session for every shard it uses.
+
+    The sessions are committed one after another, so a unit of work writing to
+    several shards is not atomic across them. Commands only change the Product of
+    their sku_id, which lives on a single shard."""
+
+    products: ShardedRepo
+    sessions: Dict[str, Session]
+
+    def __init__(
+        self,
+        database: ShardedDatabase,
+        cache: ProductCache = product_cache,
+        expire_on_commit: bool = True,
+    ):
+        self.database = database
+        self.cache = cache
+        self.expire_on_commit = expire_on_commit
+
+    def __enter__(self):
+        self.sessions = {}
+        self.products = ShardedRepo(
+            self.database.ring, self._session, self.cache, fence=self.lease is not None
+        )
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type:
+            self.rollback()
+        try:
+            # Work committed with commit() was checked already.
+            if not exc_type and any(s.in_transaction() for s in self.sessions.values()):
+                self.check_lease()
+            for session in self.sessions.values():
+                try:
+                    session.commit()
+                except OperationalError:
+                    session.rollback()
+        finally:
+            for session in self.sessions.values():
+                session.close()
+
+    def session_for(self, sku_id) -> Session:
+        return self._session(self.database.ring.shard_for(sku_id))
+
+    def all_sessions(self) -> List[Session]:
+        return [self._session(shard) for shard in self.database.ring.shards]
+
+    def _session(self, shard: str) -> Session:
+        session = self.sessions.get(shard)
+        if session is None:
+            factory = self.database.factories[shard]
+            session = factory(expire_on_commit=self.expire_on_commit)
+            self.sessions[shard] = session
+        return session
+
+    def _close(self):
+        for session in self.sessions.values():
+            if session.is_active:
+                session.close()
+
+    def _commit(self):
+        for session in self.sessions.values():
+            session.commit()
+
+    def _rollback(self):
+        for session in self.sessions.values():
+            session.rollback()
+
+
+class ActorUnitOfWork(AbstractUnitOfWork):
+    """UnitOfWork of a ProductActor, whose session stays open across commands and keeps
+    the Product loaded. Entering and leaving it does nothing, the actor commits and
+    rolls back the commands of a batch together. Rolling back starts a new session."""
+
+    session: Session
+    products: PinnedProductsRepo
+
+    def __init__(self, factory: SessionFactory = session_factory):
+        self.session_factory = factory
+        self._open()
+
+    def _open(self) -> None:
+        self.session = self.session_factory(expire_on_commit=False)
+        self.products = PinnedProductsRepo(self.session, fence=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        ...
+
+    def session_for(self, sku_id) -> Session:
+        return self.session
+
+    def all_sessions(self) -> List[Session]:
+        return [self.session]
+
+    def _close(self):
+        self.session.close()
+
+    def _commit(self):
+        self.session.commit()
+
+    def _rollback(self):
+        self.session.close()
+        self._open()
+
+
+def create_unit_of_work() -> AbstractUnitOfWork:
+    """Returns a unit of work over the shards in SHARDS if any, otherwise over the main
+    database."""
+    if shards.sharded_database is not None:
+        return ShardedUnitOfWork(shards.sharded_database)
+    return UnitOfWork()
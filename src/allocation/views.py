@@ -0,0 +1,135 @@
+"""Read only queries answered straight from the database tables.
+
+Views aggregate in SQL and never hydrate domain objects. Their results must not be
+used to make decisions in the write model."""
+import datetime
+import heapq
+from itertools import chain, islice
+from operator import attrgetter
+from typing import Dict, Iterator, List, Optional
+from uuid import UUID
+
+from sqlalchemy import and_, case, func, select
+from sqlalchemy.engine import Row
+from sqlalchemy.sql import Select
+
+from allocation.interfaces.database import orm
+from allocation.unit_of_work import AbstractUnitOfWork
+
+
+def availability(
+    sku_id: UUID,
+    uow: AbstractUnitOfWork,
+    eta_from: Optional[datetime.date] = None,
+    eta_to: Optional[datetime.date] = None,
+) -> Optional[Row]:
+    """Returns the stock totals of a Product, or None if the Product does not exist."""
+    with uow:
+        stmt = _stock_query(eta_from, eta_to).where(orm.products.c._sku_id == sku_id)
+        return uow.session_for(sku_id).execute(stmt).first()
+
+
+def stock(
+    uow: AbstractUnitOfWork,
+    eta_from: Optional[datetime.date] = None,
+    eta_to: Optional[datetime.date] = None,
+    after: Optional[UUID] = None,
+    limit: Optional[int] = None,
+) -> Iterator[Row]:
+    """Yields the stock totals of all Products ordered by SKU id, starting after the
+    provided SKU id. The ordered results of every shard are merged."""
+    with uow:
+        stmt = _stock_query(eta_from, eta_to).order_by(orm.products.c._sku_id)
+        if after is not None:
+            stmt = stmt.where(orm.products.c._sku_id > after)
+        if limit is not None:
+            stmt = stmt.limit(limit)
+        stmt = stmt.execution_options(stream_results=True)
+        rows = heapq.merge(
+            *(session.execute(stmt) for session in uow.all_sessions()),
+            key=attrgetter("sku_id"),
+        )
+        yield from islice(rows, limit)
+
+
+def allocations(order_item_id: UUID, uow: AbstractUnitOfWork) -> List[Row]:
+    """Returns the batches an order item is allocated to from allocations_view."""
+    view = orm.allocations_view
+    with uow:
+        stmt = select(view).where(view.c.order_item_id == order_item_id)
+        return list(
+            chain.from_iterable(
+                session.execute(stmt).all() for session in uow.all_sessions()
+            )
+        )
+
+
+def allocations_source() -> Select:
+    """Returns the allocations of all batches as stored by the write model."""
+    association, batches = orm.order_items_batches_association, orm.batches
+    return (
+        select(
+            association.c.order_item_id,
+            association.c.batches_id.label("batch_id"),
+            batches.c._product_id.label("sku_id"),
+        )
+        .join_from(association, batches, association.c.batches_id == batches.c.uuid)
+        .where(batches.c.discarded.isnot(True))
+    )
+
+
+def check_allocations(uow: AbstractUnitOfWork) -> Dict[str, List[Row]]:
+    """Compares allocations_view with the allocations of the write model.
+
+    Returns the allocations missing from the view and the rows of the view without a
+    matching allocation. Both are empty if the view is consistent."""
+    view = orm.allocations_view
+    rows = select(view.c.order_item_id, view.c.batch_id, view.c.sku_id)
+    source = allocations_source()
+    missing, stale = [], []
+    with uow:
+        for session in uow.all_sessions():
+            missing += session.execute(source.except_(rows)).all()
+            stale += session.execute(rows.except_(source)).all()
+    return {"missing": missing, "stale": stale}
+
+
+def _stock_query(
+    eta_from: Optional[datetime.date], eta_to: Optional[datetime.date]
+) -> Select:
+    """Returns the stock totals per Product over its batches.
+
+    Batches without ETA are in stock and count as in_stock_quantity. earliest_eta is the
+    earliest ETA of a batch with available quantity. An ETA range only matches batches
+    with an ETA inside of it."""
+    products, batches = orm.products, orm.batches
+    conditions = [
+        batches.c._product_id == products.c._sku_id,
+        batches.c.discarded.isnot(True),
+    ]
+    if eta_from is not None:
+        conditions.append(batches.c.eta >= eta_from)
+    if eta_to is not None:
+        conditions.append(batches.c.eta <= eta_to)
+
+    quantity = func.coalesce(batches.c.quantity, 0)
+    allocated_quantity = func.coalesce(batches.c.allocated_quantity, 0)
+    available_quantity = quantity - allocated_quantity
+    return (
+        select(
+            products.c._sku_id.label("sku_id"),
+            func.count(batches.c.uuid).label("batches"),
+            func.sum(quantity).label("quantity"),
+            func.sum(allocated_quantity).label("allocated_quantity"),
+            func.sum(available_quantity).label("available_quantity"),
+            func.sum(
+                case((batches.c.eta.is_(None), available_quantity), else_=0)
+            ).label("in_stock_quantity"),
+            func.min(case((available_quantity > 0, batches.c.eta))).label(
+                "earliest_eta"
+            ),
+        )
+        .select_from(products.outerjoin(batches, and_(*conditions)))
+        .where(products.c.discarded.isnot(True))
+        .group_by(products.c._sku_id)
+    )
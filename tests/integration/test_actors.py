@@ -0,0 +1,109 @@
+from uuid import uuid4
+
+import pytest
+import sqlalchemy
+
+from allocation import messagebus, services
+from allocation.actors import ActorSystem, HotnessTracker
+from allocation.core import commands
+from allocation.core.events import OrderItemAllocated
+from allocation.interfaces.database import orm
+from allocation.interfaces.database.db import SessionFactory
+from allocation.unit_of_work import ActorUnitOfWork, UnitOfWork
+from conftest import (
+    make_test_batch,
+    make_test_order_item,
+    make_test_product,
+    make_test_sku,
+)
+
+
+@pytest.fixture
+def factory(tmp_path):
+    engine = sqlalchemy.create_engine(f"sqlite:///{tmp_path / 'actors.db'}")
+    orm.mapper_registry.metadata.create_all(engine)
+    yield SessionFactory(engine)
+    engine.dispose()
+
+
+@pytest.fixture
+def make_actors(factory):
+    systems = []
+
+    def make(handle_event, **kwargs):
+        system = ActorSystem(
+            {commands.Allocate: [services.allocate]},
+            handle_event,
+            hot_rate=0,
+            uow_factory=lambda: ActorUnitOfWork(factory),
+            **kwargs,
+        )
+        systems.append(system)
+        return system
+
+    yield make
+    for system in systems:
+        system.stop()
+
+
+def add_product(factory, order_items: int):
+    sku = make_test_sku()
+    order_items = [make_test_order_item(sku, 1) for _ in range(order_items)]
+    product = make_test_product(sku, {make_test_batch(sku, 100)}, set(order_items))
+    sku_id, order_item_ids = sku.uuid, [o.uuid for o in order_items]
+    with UnitOfWork(factory) as uow:
+        uow.products.add(product)
+    return sku_id, order_item_ids
+
+
+def test_sku_becomes_hot_above_rate():
+    tracker = HotnessTracker(hot_rate=5, half_life=10)
+    sku_id = uuid4()
+
+    hot = [tracker.record(sku_id) for _ in range(80)]
+
+    assert 70 < hot.index(True) < 75
+    assert not tracker.record(uuid4())
+
+
+def test_actors_allocate_on_their_loaded_product():
+    assert messagebus.ACTOR_HANDLERS[commands.Allocate] == [services.allocate]
+
+
+def test_actor_commits_commands_of_hot_sku_in_batches(factory, make_actors):
+    sku_id, order_item_ids = add_product(factory, 20)
+    events = []
+    actors = make_actors(events.append, max_batch=8, max_delay=0.05)
+
+    futures = [
+        actors.submit(commands.Allocate(sku_id, order_item_id))
+        for order_item_id in order_item_ids
+    ]
+    missing = actors.submit(commands.Allocate(sku_id, uuid4()))
+
+    assert len({f.result(timeout=5) for f in futures}) == 1
+    with pytest.raises(StopIteration):
+        missing.result(timeout=5)
+    assert len([e for e in events if isinstance(e, OrderItemAllocated)]) == 20
+    stats = actors.stats()[str(sku_id)]
+    assert stats["batches"] < 20 and stats["failures"] == 1
+    with UnitOfWork(factory) as uow:
+        (batch,) = uow.products.get(sku_id).batches
+        assert batch.allocated_quantity == 20
+
+
+def test_actor_reloads_product_committed_by_others(factory, make_actors):
+    sku_id, (first, second) = add_product(factory, 2)
+    actors = make_actors(lambda event: None, max_delay=0.01)
+    actors.submit(commands.Allocate(sku_id, first)).result(timeout=5)
+
+    with UnitOfWork(factory) as uow:
+        uow.products.get(sku_id).rename("Renamed")
+    actors.submit(commands.Allocate(sku_id, second)).result(timeout=5)
+
+    assert actors.stats()[str(sku_id)]["reloads"] == 1
+    with UnitOfWork(factory) as uow:
+        product = uow.products.get(sku_id)
+        (batch,) = product.batches
+        assert (product.sku.name, batch.allocated_quantity) == ("Renamed", 2)
+        assert product.version_number == 3
@@ -1,4 +1,5 @@
 import datetime
+import uuid
 
 from conftest import (
     make_test_batch,
@@ -6,6 +7,7 @@ from conftest import (
     make_test_product,
     make_test_sku,
     make_test_sku_and_product,
+    make_test_sku_product_and_batch,
 )
 from flask.testing import FlaskClient
 
@@ -39,6 +41,25 @@ def test_list_skus(client: FlaskClient):
         assert sku_ref in retrieved_skus_refs
 
 
+def test_list_products_in_pages(client: FlaskClient):
+    with UnitOfWork() as uow:
+        uow.products.add_all([make_test_product() for _ in range(3)])
+
+    sku_ids = [p["sku"]["uuid"] for p in client.get("/products").json]
+    assert len(sku_ids) >= 3 and sku_ids == sorted(sku_ids)
+
+    response = client.get(f"/products?after={sku_ids[0]}&limit=2")
+    assert [p["sku"]["uuid"] for p in response.json] == sku_ids[1:3]
+
+    response = client.get("/skus?limit=2", headers={"Accept": "application/x-ndjson"})
+    assert response.mimetype == "application/x-ndjson"
+    lines = response.get_data(as_text=True).splitlines()
+    assert [str(SKU().loads(line).uuid) for line in lines] == sku_ids[:2]
+
+    assert client.get("/products?limit=0").status_code == 400
+    assert client.get("/products?after=unknown").status_code == 400
+
+
 def test_create_product(client: FlaskClient):
 
     name = make_test_sku().name
@@ -70,6 +91,34 @@ def test_create_batch(client: FlaskClient):
         assert len(product.batches) == 1
 
 
+def test_create_batches_and_order_items_in_bulk(client: FlaskClient):
+    with UnitOfWork() as uow:
+        product = make_test_product()
+        uow.products.add(product)
+        sku_id = str(product.sku.uuid)
+    unknown_sku_id = str(make_test_sku().uuid)
+
+    eta = str(datetime.date.today())
+    rows = [{"sku_id": sku_id, "eta": eta, "quantity": q} for q in (10, 20)]
+    rows.append({"sku_id": unknown_sku_id, "eta": eta, "quantity": 30})
+    response = client.post("/batches", json=rows)
+    results = response.json
+    assert [r["status"] for r in results] == [201, 201, 404]
+
+    rows = [{"sku_id": sku_id, "quantity": 2}, {"sku_id": sku_id, "quantity": 3}]
+    response = client.post("/order_items", json=rows)
+    order_item_ids = {r["order_item_id"] for r in response.json}
+
+    with UnitOfWork() as uow:
+        product = uow.products.get(sku_id)
+        assert {str(b.uuid) for b in product.batches} == {
+            r["batch_id"] for r in results[:2]
+        }
+        assert {str(o.uuid) for o in product.order_items} == order_item_ids
+
+    assert client.post("/batches", json=rows[0]).status_code == 400
+
+
 def test_redirect_on_create_batch(client: FlaskClient):
     with UnitOfWork() as uow:
         sku, product = make_test_sku_and_product()
@@ -89,6 +138,58 @@ def test_redirect_on_create_batch(client: FlaskClient):
         assert response_batch == saved_batch
 
 
+def test_return_representation_on_create(client: FlaskClient):
+    prefer = {"Prefer": "return=representation"}
+    response = client.post("/product", json={"name": "SKU-PREFER"}, headers=prefer)
+    assert response.status_code == 201
+    assert response.headers["Preference-Applied"] == "return=representation"
+    sku_id = response.json["sku"]["uuid"]
+    assert response.headers["Location"].endswith(f"/product/{sku_id}")
+
+    data = {"sku_id": sku_id, "eta": str(datetime.date.today()), "quantity": 20}
+    response = client.post("/batch", json=data, headers=prefer)
+    assert response.status_code == 201
+
+    with UnitOfWork() as uow:
+        product = uow.products.get(sku_id)
+        assert response.json == serializers.Batch().dump(product.batches.pop())
+        batch_id = uuid.UUID(response.json["uuid"])
+        assert response.get_etag()[0] == f"{batch_id.hex}.{product.version_number}"
+
+    response = client.post("/batch", json=data, headers={"Prefer": "return=minimal"})
+    assert response.status_code == 302
+
+
+def test_return_representation_on_update_order_item(client: FlaskClient):
+    with UnitOfWork() as uow:
+        sku = make_test_sku()
+        _, order_item = make_test_batch_and_order_item(sku, 20, 2)
+        uow.products.add(make_test_product(sku, order_items={order_item}))
+        data = {"sku_id": sku.uuid, "order_item_id": order_item.uuid, "quantity": 5}
+
+    response = client.put(
+        "/order_item", json=data, headers={"Prefer": "return=representation"}
+    )
+    assert response.status_code == 200
+    assert response.json["quantity"] == 5
+    assert response.json["uuid"] == str(data["order_item_id"])
+
+
+def test_return_representation_of_missing_entity_is_not_found(
+    client: FlaskClient, monkeypatch
+):
+    with UnitOfWork() as uow:
+        sku, product = make_test_sku_and_product()
+        uow.products.add(product)
+        data = {"sku_id": sku.uuid, "eta": str(datetime.date.today()), "quantity": 20}
+    monkeypatch.setattr(services, "create_batch", lambda cmd, uow: uuid.uuid4())
+
+    response = client.post(
+        "/batch", json=data, headers={"Prefer": "return=representation"}
+    )
+    assert response.status_code == 404
+
+
 def test_get_batch(client: FlaskClient):
 
     sku = make_test_sku()
@@ -142,3 +243,39 @@ def test_bad_request_on_invalid_marshmallow_schema(client: FlaskClient):
     assert response.status_code == 400
     assert ["Not a valid string."] in response.json.values()
     assert ["Unknown field."] in response.json.values()
+
+
+def test_not_modified_product_on_matching_etag(client: FlaskClient):
+    with UnitOfWork() as uow:
+        sku, product = make_test_sku_and_product()
+        uow.products.add(product)
+        sku_id = sku.uuid
+
+    response = client.get(f"/product/{sku_id}")
+    etag = response.headers["ETag"]
+    assert response.status_code == 200
+    assert "max-age" in response.headers["Cache-Control"]
+
+    response = client.get(f"/product/{sku_id}", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.data == b""
+
+    with UnitOfWork() as uow:
+        product = uow.products.get(sku_id)
+        product.register_batch(make_test_batch(product.sku))
+
+    response = client.get(f"/product/{sku_id}", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+
+def test_not_modified_batch_on_matching_etag(client: FlaskClient):
+    with UnitOfWork() as uow:
+        sku, product, batch = make_test_sku_product_and_batch()
+        product.register_batch(batch)
+        uow.products.add(product)
+        batch_id = batch.uuid
+
+    etag = client.get(f"/batch/{batch_id}").headers["ETag"]
+    response = client.get(f"/batch/{batch_id}", headers={"If-None-Match": etag})
+    assert response.status_code == 304
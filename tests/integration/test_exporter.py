@@ -0,0 +1,88 @@
+import io
+from uuid import uuid4
+
+import orjson
+import pytest
+from click.testing import CliRunner
+
+from allocation.entrypoints.exporter import export
+from allocation.entrypoints.importer import importer
+from allocation.interfaces.database.db import engine
+from allocation.unit_of_work import UnitOfWork
+from conftest import (
+    make_test_batch,
+    make_test_order_item,
+    make_test_product,
+    make_test_sku,
+)
+
+
+def make_allocated_product():
+    sku = make_test_sku()
+    batches = {make_test_batch(sku, 10), make_test_batch(sku, 10, eta=None)}
+    order_items = {make_test_order_item(sku, 6) for _ in range(3)}
+    product = make_test_product(sku, batches, order_items)
+    for order_item in list(order_items)[:2]:
+        product.allocate(order_item)
+    sku_id = sku.uuid
+    with UnitOfWork() as uow:
+        uow.products.add(product)
+    return sku_id
+
+
+def export_rows(parquet=None):
+    file = io.BytesIO()
+    counts = export(engine, file, parquet)
+    rows = [orjson.loads(line) for line in file.getvalue().splitlines()]
+    assert sum(counts.values()) == len(rows)
+    return rows
+
+
+def test_export_skips_discarded_products():
+    exported, discarded = make_allocated_product(), make_allocated_product()
+    with UnitOfWork() as uow:
+        uow.products.get(discarded).discard()
+
+    rows = export_rows()
+
+    assert not [row for row in rows if row["sku_id"] == str(discarded)]
+    rows = [row for row in rows if row["sku_id"] == str(exported)]
+    assert [row["type"] for row in rows] == ["product"] + ["batch"] * 2 + [
+        "order_item"
+    ] * 3
+    assert len([row for row in rows if row.get("batch_id")]) == 2
+
+
+def test_restore_exported_rows(tmp_path):
+    sku_id = make_allocated_product()
+    rows = [row for row in export_rows() if row["sku_id"] == str(sku_id)]
+    # Restores the Product under new ids, as the exported one still exists.
+    new_ids = {}
+    for row in rows:
+        for key in ("sku_id", "uuid", "batch_id"):
+            if row.get(key):
+                row[key] = new_ids.setdefault(row[key], str(uuid4()))
+    path = tmp_path / "export.ndjson"
+    path.write_bytes(b"\n".join(orjson.dumps(row) for row in rows))
+
+    result = CliRunner(mix_stderr=False).invoke(importer, [str(path)])
+
+    assert result.exit_code == 0, result.output
+    with UnitOfWork() as uow:
+        original = uow.products.get(sku_id)
+        restored = uow.products.get(new_ids[str(sku_id)])
+        assert restored.version_number == original.version_number
+        assert sorted(b.available_quantity for b in restored.batches) == sorted(
+            b.available_quantity for b in original.batches
+        )
+        assert sum(len(b.allocated_order_items) for b in restored.batches) == 2
+
+
+def test_export_parquet(tmp_path):
+    pq = pytest.importorskip("pyarrow.parquet")
+    sku_id = make_allocated_product()
+
+    export_rows(parquet=str(tmp_path))
+
+    table = pq.read_table(tmp_path / "order_item.parquet").to_pylist()
+    assert len([row for row in table if row["sku_id"] == str(sku_id)]) == 3
@@ -0,0 +1,93 @@
+import csv
+import json
+from datetime import date
+from uuid import uuid4
+
+from click.testing import CliRunner
+
+from allocation.entrypoints.importer import importer
+from allocation.unit_of_work import UnitOfWork
+
+
+def make_rows(sku_id, batches=2, order_items=3):
+    rows = [{"type": "product", "sku_id": str(sku_id), "name": f"SKU-{sku_id}"}]
+    rows += [
+        {
+            "type": "batch",
+            "sku_id": str(sku_id),
+            "quantity": 20,
+            "eta": str(date.today()),
+        }
+        for _ in range(batches)
+    ]
+    rows += [
+        {"type": "order_item", "sku_id": str(sku_id), "quantity": 2}
+        for _ in range(order_items)
+    ]
+    return rows
+
+
+def test_import_ndjson_resumes_from_checkpoint(tmp_path):
+    sku_ids = [uuid4() for _ in range(3)]
+    rows = [row for sku_id in sku_ids for row in make_rows(sku_id)]
+    path, checkpoint = tmp_path / "catalog.ndjson", tmp_path / "checkpoint.json"
+    path.write_text("\n".join(json.dumps(row) for row in rows[:12]) + "\n")
+
+    args = [str(path), "--chunk-size", "1", "--checkpoint", str(checkpoint)]
+    result = CliRunner(mix_stderr=False).invoke(importer, args)
+
+    assert result.exit_code == 0, result.output
+    assert "Imported 2 products" in result.output
+    assert json.loads(checkpoint.read_text())["rows"] == 12
+
+    path.write_text("\n".join(json.dumps(row) for row in rows) + "\n")
+    result = CliRunner(mix_stderr=False).invoke(importer, args)
+
+    assert result.exit_code == 0, result.output
+    assert "Imported 1 products" in result.output
+    with UnitOfWork() as uow:
+        for sku_id in sku_ids:
+            product = uow.products.get(sku_id)
+            assert len(product.batches) == 2
+            assert len(product.order_items) == 3
+
+
+def test_import_csv_with_workers_rejects_invalid_rows(tmp_path):
+    valid, invalid = uuid4(), uuid4()
+    rows = make_rows(valid) + make_rows(invalid)[1:]
+    rows.insert(1, {"type": "batch", "sku_id": str(valid), "quantity": "many"})
+    path = tmp_path / "catalog.csv"
+    with open(path, "w", newline="") as file:
+        writer = csv.DictWriter(file, ["type", "sku_id", "name", "quantity", "eta"])
+        writer.writeheader()
+        writer.writerows(rows)
+
+    result = CliRunner(mix_stderr=False).invoke(importer, [str(path), "--workers", "2"])
+
+    assert result.exit_code == 1
+    assert "Imported 1 products, rejected 2 rows." in result.output
+    assert "Row 2: " in result.stderr
+    assert "Expected one product row, found 0." in result.stderr
+    with UnitOfWork() as uow:
+        assert len(uow.products.get(valid).batches) == 2
+        assert uow.products.get_version(invalid) is None
+
+
+def test_import_rejects_skus_conflicting_with_database(tmp_path):
+    existing, repeated, new = uuid4(), uuid4(), uuid4()
+    path = tmp_path / "catalog.ndjson"
+    path.write_text("\n".join(json.dumps(row) for row in make_rows(existing)) + "\n")
+    assert CliRunner(mix_stderr=False).invoke(importer, [str(path)]).exit_code == 0
+
+    rows = make_rows(repeated) + make_rows(existing) + make_rows(new)
+    rows += make_rows(repeated, batches=1)
+    path.write_text("\n".join(json.dumps(row) for row in rows) + "\n")
+    result = CliRunner(mix_stderr=False).invoke(importer, [str(path)])
+
+    assert result.exit_code == 1
+    assert "Imported 2 products, rejected 2 rows." in result.output
+    assert f"Row 7: SKU {existing} conflicts" in result.stderr
+    assert f"Row 19: SKU {repeated} conflicts" in result.stderr
+    with UnitOfWork() as uow:
+        assert len(uow.products.get(repeated).batches) == 2
+        assert len(uow.products.get(new).batches) == 2
@@ -0,0 +1,163 @@
+import threading
+import time
+from uuid import UUID, uuid4
+
+import pytest
+import sqlalchemy
+
+from allocation import messagebus
+from allocation.core import commands
+from allocation.interfaces import leases
+from allocation.interfaces.database import orm
+from allocation.interfaces.database.db import SessionFactory
+from allocation.interfaces.leases import LeaseTimeout, LocalLeaseManager, StaleLease
+from allocation.repositories import MockRepo
+from allocation.unit_of_work import MockUnitOfWork, UnitOfWork
+from conftest import make_test_batch_and_order_item, make_test_product, make_test_sku
+
+
+def test_leases_of_same_sku_wait_in_line():
+    manager = LocalLeaseManager(ttl=5, timeout=1)
+    sku_id, tokens = uuid4(), []
+
+    def hold():
+        with manager.acquire(sku_id) as lease:
+            tokens.append(lease.token)
+            time.sleep(0.05)
+
+    threads = [threading.Thread(target=hold) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert tokens == [1, 2, 3]
+    stats = manager.stats()
+    assert stats["acquired"] == 3 and stats["waits"] == 2
+    assert stats["max_wait_seconds"] >= 0.05
+
+
+def test_lease_times_out_while_held():
+    manager = LocalLeaseManager(ttl=5, timeout=0.05)
+    sku_id = uuid4()
+
+    with manager.acquire(sku_id) as lease:
+        with pytest.raises(LeaseTimeout):
+            with manager.acquire(sku_id):
+                pass
+        assert manager.holds(lease)
+
+    assert manager.stats()["timeouts"] == 1
+
+
+def test_message_bus_holds_lease_around_command(monkeypatch):
+    manager = LocalLeaseManager()
+    monkeypatch.setattr(leases, "sku_leases", manager)
+    sku = make_test_sku()
+    batch, order_item = make_test_batch_and_order_item(sku, 20, 2)
+    product = make_test_product(sku, {batch}, {order_item})
+    uow = MockUnitOfWork(MockRepo({sku.uuid: product}))
+
+    cmd = commands.Allocate(sku.uuid, order_item.uuid)
+    messagebus.handle([cmd], uow)
+
+    assert manager.stats()["acquired"] == 1
+    assert uow.lease is None
+
+
+@pytest.fixture
+def factory(tmp_path):
+    engine = sqlalchemy.create_engine(f"sqlite:///{tmp_path / 'leases.db'}")
+    orm.mapper_registry.metadata.create_all(engine)
+    yield SessionFactory(engine)
+    engine.dispose()
+
+
+def add_product(factory) -> UUID:
+    sku = make_test_sku()
+    batch, order_item = make_test_batch_and_order_item(sku, 20, 2)
+    product = make_test_product(sku, {batch}, {order_item})
+    sku_id = sku.uuid
+    with UnitOfWork(factory) as uow:
+        uow.products.add(product)
+    return sku_id
+
+
+def test_expired_lease_does_not_commit(factory):
+    sku_id = add_product(factory)
+    manager = LocalLeaseManager(ttl=0.05)
+
+    with pytest.raises(StaleLease):
+        with manager.acquire(sku_id) as lease:
+            first = UnitOfWork(factory)
+            first.lease = lease
+            with first:
+                first.products.get(sku_id).rename("First")
+                time.sleep(0.1)
+                with manager.acquire(sku_id) as second_lease:
+                    second = UnitOfWork(factory)
+                    second.lease = second_lease
+                    with second:
+                        second.products.get(sku_id).rename("Second")
+
+    with UnitOfWork(factory) as uow:
+        product = uow.products.get(sku_id)
+        assert (product.sku.name, product.version_number) == ("Second", 1)
+    assert manager.stats()["stale"] == 1
+
+
+def test_fence_rejects_product_committed_since_loaded(factory):
+    sku_id = add_product(factory)
+    manager = LocalLeaseManager()
+
+    with pytest.raises(StaleLease):
+        with manager.acquire(sku_id) as lease:
+            first = UnitOfWork(factory)
+            first.lease = lease
+            with first:
+                first.products.get(sku_id).rename("First")
+                with UnitOfWork(factory) as second:
+                    second.products.get(sku_id).rename("Second")
+
+    with UnitOfWork(factory) as uow:
+        product = uow.products.get(sku_id)
+        assert (product.sku.name, product.version_number) == ("Second", 1)
+
+
+def test_fence_rejects_product_committed_before_flush(factory):
+    sku_id = add_product(factory)
+    manager = LocalLeaseManager()
+
+    with pytest.raises(StaleLease):
+        with manager.acquire(sku_id) as lease:
+            first = UnitOfWork(factory)
+            first.lease = lease
+            with first:
+                product = first.products.get(sku_id)
+                with UnitOfWork(factory) as second:
+                    second.products.get(sku_id).rename("Second")
+                product.rename("First")
+                # Writes version_number 1 over the one committed by second.
+                first.session.flush()
+
+    with UnitOfWork(factory) as uow:
+        product = uow.products.get(sku_id)
+        assert (product.sku.name, product.version_number) == ("Second", 1)
+
+
+def test_lease_is_checked_once_per_commit(factory, monkeypatch):
+    sku_id = add_product(factory)
+    manager = LocalLeaseManager()
+    checks = []
+    monkeypatch.setattr(manager, "check", lambda *args: checks.append(args))
+
+    with manager.acquire(sku_id) as lease:
+        uow = UnitOfWork(factory)
+        uow.lease = lease
+        with uow:
+            uow.products.get(sku_id).rename("Renamed")
+            uow.commit()
+
+    assert checks == [(lease, [])]
+    with UnitOfWork(factory) as uow:
+        assert uow.products.get(sku_id).version_number == 1
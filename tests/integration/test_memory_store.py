@@ -0,0 +1,58 @@
+import pytest
+
+from allocation.interfaces.memory import ConflictError, InMemoryStore
+from allocation.unit_of_work import InMemoryUnitOfWork
+from conftest import make_test_batch_and_order_item, make_test_product, make_test_sku
+
+
+def add_product(store: InMemoryStore):
+    sku = make_test_sku()
+    batch, order_item = make_test_batch_and_order_item(sku, 20, 2)
+    product = make_test_product(sku, {batch}, {order_item})
+    with InMemoryUnitOfWork(store) as uow:
+        uow.products.add(product)
+    return sku.uuid, batch.uuid, order_item.uuid
+
+
+def test_changes_are_isolated_until_commit():
+    store = InMemoryStore()
+    sku_id, batch_id, order_item_id = add_product(store)
+
+    first, second = InMemoryUnitOfWork(store), InMemoryUnitOfWork(store)
+    with first, second:
+        product = first.products.get(sku_id)
+        product.allocate(next(iter(product.order_items)))
+        assert second.products.get(sku_id).version_number == 0
+        first.commit()
+        second.products.get(sku_id).rename("Renamed")
+        with pytest.raises(ConflictError):
+            second.commit()
+        second.rollback()
+
+    with InMemoryUnitOfWork(store) as uow:
+        (batch,) = uow.products.get(sku_id).batches
+        assert batch.available_quantity == 18
+        assert uow.products.get_batch_owner(batch_id) == (sku_id, 1)
+        assert store.order_item_owner(order_item_id) == sku_id
+
+
+def test_recover_store_from_snapshot_and_log(tmp_path):
+    store = InMemoryStore(str(tmp_path), snapshot_interval=3)
+    sku_ids = [add_product(store)[0] for _ in range(3)]
+    with InMemoryUnitOfWork(store) as uow:
+        product = uow.products.get(sku_ids[0])
+        product.allocate(next(iter(product.order_items)))
+    store.close()
+    # A commit interrupted while it was written to the log is not recovered.
+    with open(tmp_path / "wal.ndjson", "ab") as log:
+        log.write(b'{"lsn": 5, "products": {')
+
+    store = InMemoryStore(str(tmp_path), snapshot_interval=3)
+
+    assert store.lsn == 4
+    assert set(store.sku_ids()) == set(sku_ids)
+    with InMemoryUnitOfWork(store) as uow:
+        assert uow.products.get_version(sku_ids[0]) == 1
+        uow.products.get(sku_ids[1]).rename("Renamed")
+    store.close()
+    assert InMemoryStore(str(tmp_path)).get(sku_ids[1])["sku"][1] == "Renamed"
@@ -1,6 +1,14 @@
-from conftest import make_test_sku
+from uuid import uuid4
 
-from allocation import messagebus
+import pytest
+from conftest import (
+    make_test_order_item,
+    make_test_product,
+    make_test_sku,
+    make_test_sku_product_and_batch,
+)
+
+from allocation import messagebus, services
 from allocation.core import Message, commands, events
 from allocation.messagebus import EVENT_HANDLERS
 from allocation.repositories import MockRepo
@@ -42,9 +50,74 @@ def test_handle_workflow_from_command_to_event():
         assert product.sku.name == sku.name
 
 
+def test_read_model_handlers_get_unit_of_work_from_factory(monkeypatch):
+    sku = make_test_sku()
+    uow = MockUnitOfWork(MockRepo())
+    received = []
+    monkeypatch.setitem(
+        messagebus.READ_MODEL_HANDLERS,
+        events.ProductCreated,
+        [lambda event, uow: received.append(uow)],
+    )
+
+    messagebus.handle([commands.CreateProductCommand(sku)], uow, lambda: uow)
+
+    assert received == [uow]
+
+
+def test_read_model_handlers_skip_units_of_work_without_database():
+    event = events.OrderItemAllocated(uuid4(), uuid4(), uuid4())
+    uow = MockUnitOfWork(MockRepo())
+
+    services.add_allocation_to_read_model(event, uow)
+    services.remove_allocations_from_read_model(
+        events.OrderItemsDeallocated(event.sku_id, [(uuid4(), 2, uuid4())]), uow
+    )
+
+
 def test_generate_event_after_command_handled():
     sku = make_test_sku()
     cmd = commands.CreateProductCommand(sku)
     uow = MockUnitOfWork(MockRepo())
     messagebus.handle_command(cmd, messagebus.QUEUE, uow)
     assert isinstance(messagebus.QUEUE.pop(), events.ProductCreated)
+
+
+def test_rollback_restores_products_of_mock_unit_of_work():
+    sku, product, batch = make_test_sku_product_and_batch()
+    uow = MockUnitOfWork(MockRepo({product.sku_id: product}))
+
+    with pytest.raises(ValueError):
+        with uow:
+            product = uow.products.get(sku.uuid)
+            product.change_batch_quantity(batch.uuid, 5)
+            uow.products.add(make_test_product())
+            raise ValueError()
+
+    assert len(uow.products) == 1
+    with uow:
+        (batch,) = uow.products.get(sku.uuid).batches
+        assert batch.quantity == 20
+
+
+def test_mock_unit_of_work_copies_discarded_objects_and_events():
+    sku, product, batch = make_test_sku_product_and_batch()
+    order_item = make_test_order_item(sku, 5)
+    product.register_order_item(order_item)
+    product.allocate(order_item)
+    product.deregister_batch(batch)
+    uow = MockUnitOfWork(MockRepo({product.sku_id: product}))
+
+    with uow:
+        copied = uow.products.get(sku.uuid)
+        (copied_batch,) = copied.batches
+        (copied_order_item,) = copied.order_items
+
+        assert copied is not product and copied_batch is not batch
+        assert copied_batch.discarded and copied_batch.quantity == batch.quantity
+        assert copied_order_item.uuid == order_item.uuid
+        assert copied.events == product.events
+        assert copied.version_number == product.version_number
+
+        uow.products.delete(copied)
+        assert sku.uuid not in uow.products
@@ -0,0 +1,68 @@
+import threading
+import time
+from uuid import uuid4
+
+import pytest
+import redis
+
+from allocation.interfaces.cache import ReadModelCache
+from allocation.interfaces.external_bus import create_redis_client
+
+
+def redis_available() -> bool:
+    try:
+        return create_redis_client().ping()
+    except redis.RedisError:
+        return False
+
+
+pytestmark = pytest.mark.skipif(not redis_available(), reason="Redis is unavailable.")
+
+
+def make_test_read_model_cache() -> ReadModelCache:
+    return ReadModelCache(create_redis_client(), ttl=10, lock_timeout=2)
+
+
+def test_store_and_retrieve_read_model():
+    cache = make_test_read_model_cache()
+    key = f"test:{uuid4()}"
+    cache.get_or_load(key, 1, lambda: {"name": "SKU"})
+    assert cache.get_or_load(key, 1, lambda: {"name": "OTHER"}) == {"name": "SKU"}
+    assert cache.hits == 1
+
+
+def test_reload_read_model_on_version_change():
+    cache = make_test_read_model_cache()
+    key = f"test:{uuid4()}"
+    cache.get_or_load(key, 1, lambda: {"name": "SKU"})
+    assert cache.get_or_load(key, 2, lambda: {"name": "OTHER"}) == {"name": "OTHER"}
+
+
+def test_invalidate_read_models_by_tag():
+    cache = make_test_read_model_cache()
+    tag, key = uuid4(), f"test:{uuid4()}"
+    cache.get_or_load(key, 1, lambda: {"name": "SKU"}, tag=tag)
+    cache.invalidate(tag)
+    assert cache.get_or_load(key, 1, lambda: {"name": "OTHER"}) == {"name": "OTHER"}
+
+
+def test_load_cold_key_only_once_under_concurrency():
+    cache = make_test_read_model_cache()
+    key = f"test:{uuid4()}"
+    calls = []
+
+    def loader():
+        calls.append(1)
+        time.sleep(0.2)
+        return {"name": "SKU"}
+
+    threads = [
+        threading.Thread(target=lambda: cache.get_or_load(key, 1, loader))
+        for _ in range(5)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(calls) == 1
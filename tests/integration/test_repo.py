@@ -1,3 +1,4 @@
+import gc
 import random
 import threading
 import time
@@ -8,8 +9,11 @@ from uuid import UUID
 
 import pytest
 import sqlalchemy.exc
+from sqlalchemy import event, select, update
 
-from allocation import repositories
+from allocation import repositories, services
+from allocation.core import commands
+from allocation.core.domain import Batch, Product
 from conftest import (
     make_test_batch,
     make_test_batch_and_order_item,
@@ -21,8 +25,15 @@ from conftest import (
 )
 
 from allocation.core.domain import AllocationError
-from allocation.interfaces.database.db import session_factory
-from allocation.unit_of_work import UnitOfWork
+from allocation.core.events import OrderItemAllocated, ProductCreated
+from allocation.interfaces.cache import ProductCache
+from allocation.interfaces.database import orm
+from allocation.interfaces.database.db import (
+    StatementCacheStats,
+    engine,
+    session_factory,
+)
+from allocation.unit_of_work import EventSourcedUnitOfWork, UnitOfWork
 
 
 class TestUnitOfWork:
@@ -230,3 +241,300 @@ def test_unit_of_work_rollback_on_error():
     with pytest.raises(repositories.InvalidSKU):
         with UnitOfWork() as uow:
             uow.products.get(sku_id)
+
+
+def test_retrieve_product_from_cache_until_version_changes():
+    cache = ProductCache(10)
+    with UnitOfWork(session_factory, cache) as uow:
+        sku = make_test_sku()
+        batch, order_item = make_test_batch_and_order_item(sku, 20, 2)
+        product = make_test_product(sku, batches={batch}, order_items={order_item})
+        uow.products.add(product)
+        sku_id, order_item_id = sku.uuid, order_item.uuid
+
+    with UnitOfWork(session_factory, cache) as uow:
+        uow.products.get(sku_id)
+    with UnitOfWork(session_factory, cache) as uow:
+        product = uow.products.get(sku_id)
+        order_item = next(o for o in product.order_items if o.uuid == order_item_id)
+        product.allocate(order_item)
+    assert (cache.misses, cache.hits) == (1, 1)
+
+    with UnitOfWork(session_factory, cache) as uow:
+        product = uow.products.get(sku_id)
+        assert product.batches.pop().available_quantity == 18
+    assert (cache.misses, cache.hits) == (2, 1)
+
+
+def test_iter_products_in_keyset_pages():
+    with UnitOfWork(session_factory) as uow:
+        created = set()
+        for _ in range(5):
+            sku = make_test_sku()
+            batch, order_item = make_test_batch_and_order_item(sku, 20, 2)
+            product = make_test_product(sku, batches={batch}, order_items={order_item})
+            product.allocate(order_item)
+            uow.products.add(product)
+            created.add(sku.uuid)
+
+    with UnitOfWork(session_factory) as uow:
+        sku_ids = [p.sku.uuid for p in uow.products.iter_products(chunk_size=2)]
+        assert sku_ids == sorted(sku_ids) and created <= set(sku_ids)
+        gc.collect()
+        assert not uow.session.identity_map
+
+        page = list(uow.products.iter_products(after=sku_ids[1], limit=2))
+        assert [p.sku.uuid for p in page] == sku_ids[2:4]
+        assert [s.uuid for s in uow.products.iter_skus(limit=3)] == sku_ids[:3]
+
+        products = uow.products.iter_products(chunk_size=2)
+        allocated = [
+            p.batches.pop().allocated_quantity
+            for p in products
+            if p.sku.uuid in created
+        ]
+        assert allocated == [2] * 5
+
+
+def test_discarded_rows_are_excluded_from_queries():
+    sku = make_test_sku()
+    batch, discarded_batch = make_test_batch(sku, 10), make_test_batch(sku, 10)
+    discarded_batch.discarded = True
+    order_item = make_test_order_item(sku, 2)
+    order_item.discarded = True
+    with UnitOfWork(session_factory) as uow:
+        uow.products.add(make_test_product(sku, {batch, discarded_batch}, {order_item}))
+        sku_id, batch_id, discarded_id = sku.uuid, batch.uuid, discarded_batch.uuid
+
+    with UnitOfWork(session_factory) as uow:
+        product = uow.products.get(sku_id)
+        assert {b.uuid for b in product.batches} == {batch_id}
+        assert not product.order_items
+        assert discarded_id not in {b.uuid for b in uow.products.get_all_batches()}
+
+        stmt = select(Batch).where(orm.batches.c.uuid == discarded_id)
+        assert uow.session.execute(stmt).scalar() is None
+        stmt = stmt.execution_options(include_discarded=True)
+        assert uow.session.execute(stmt).scalar().uuid == discarded_id
+        product.discard()
+
+    with UnitOfWork(session_factory) as uow:
+        assert uow.session.get(Product, sku_id) is None
+        with pytest.raises(repositories.InvalidSKU):
+            uow.products.get(sku_id)
+
+
+def test_archive_discarded_rows():
+    sku = make_test_sku()
+    batch, discarded_batch = make_test_batch(sku, 10), make_test_batch(sku, 10)
+    kept, archived = make_test_order_item(sku, 2), make_test_order_item(sku, 2)
+    batch.allocate_available_quantity(kept)
+    discarded_batch.allocate_available_quantity(archived)
+    for obj in (discarded_batch, kept, archived):
+        obj.discarded = True
+    discarded_product = make_test_product()
+    discarded_product.discard()
+    with UnitOfWork(session_factory) as uow:
+        uow.products.add(make_test_product(sku, {batch, discarded_batch}))
+        uow.products.add(discarded_product)
+        sku_id, batch_id = sku.uuid, batch.uuid
+        discarded_id, kept_id, archived_id = (
+            discarded_batch.uuid,
+            kept.uuid,
+            archived.uuid,
+        )
+        discarded_sku_id = discarded_product.sku.uuid
+
+    cmd = commands.ArchiveDiscarded(chunk_size=1)
+    moved = services.archive_discarded(cmd, UnitOfWork(session_factory))
+    assert all(moved[table] >= 1 for table in moved)
+
+    def ids(table, column="uuid"):
+        with UnitOfWork(session_factory) as uow:
+            return set(uow.session.execute(select(table.c[column])).scalars())
+
+    assert discarded_id not in ids(orm.batches)
+    assert discarded_id in ids(orm.batches_archive)
+    assert archived_id in ids(orm.order_items_archive)
+    assert archived_id in ids(orm.association_archive, "order_item_id")
+    assert kept_id in ids(orm.order_items)
+    assert discarded_sku_id in ids(orm.products_archive, "_sku_id")
+    assert discarded_sku_id in ids(orm.skus_archive)
+    assert sku_id in ids(orm.products, "_sku_id")
+    assert sku_id in ids(orm.skus)
+
+    with UnitOfWork(session_factory) as uow:
+        (remaining,) = uow.products.get(sku_id).batches
+        assert remaining.uuid == batch_id
+        assert {oi.uuid for oi in remaining.allocated_order_items} == {kept_id}
+
+
+@pytest.mark.parametrize("loaded", [False, True])
+def test_archive_discarded_product_with_order_items(loaded: bool):
+    sku = make_test_sku()
+    batch, allocated = make_test_batch_and_order_item(sku, 10, 2)
+    unallocated = make_test_order_item(sku, 3)
+    product = make_test_product(sku, {batch}, {allocated, unallocated})
+    product.allocate(allocated)
+    sku_id = sku.uuid
+    order_item_ids = {allocated.uuid, unallocated.uuid}
+    with UnitOfWork(session_factory) as uow:
+        uow.products.add(product)
+
+    if loaded:
+        with UnitOfWork(session_factory) as uow:
+            uow.products.get(sku_id).discard()
+    else:
+        cmd = commands.DiscardProduct(sku_id)
+        services.discard_product(cmd, UnitOfWork(session_factory))
+    cmd = commands.ArchiveDiscarded(chunk_size=1)
+    services.archive_discarded(cmd, UnitOfWork(session_factory))
+
+    with UnitOfWork(session_factory) as uow:
+
+        def ids(table, column):
+            return set(uow.session.execute(select(table.c[column])).scalars())
+
+        assert sku_id not in ids(orm.products, "_sku_id")
+        assert sku_id not in ids(orm.skus, "uuid")
+        assert not order_item_ids & ids(orm.order_items, "uuid")
+        assert sku_id in ids(orm.products_archive, "_sku_id")
+        assert sku_id in ids(orm.skus_archive, "uuid")
+        assert order_item_ids <= ids(orm.order_items_archive, "uuid")
+
+
+@pytest.fixture
+def statement_cache_stats():
+    stats = StatementCacheStats(engine)
+    yield stats
+    stats.remove()
+
+
+def test_repeated_repository_queries_hit_the_statement_cache(statement_cache_stats):
+    product = make_test_product()
+    sku_id = product.sku_id
+    with UnitOfWork(session_factory) as uow:
+        uow.products.add(product)
+        uow.commit()
+
+    for _ in range(3):
+        with UnitOfWork(session_factory) as uow:
+            assert uow.products.get_version(sku_id) == 0
+
+    stats = statement_cache_stats.stats()
+    assert stats["hits"] >= 2
+    assert stats["hit_rate"] > 0
+    statement_cache_stats.remove()
+    with UnitOfWork(session_factory) as uow:
+        uow.products.get_version(sku_id)
+    assert statement_cache_stats.stats() == stats
+
+
+def test_bulk_add_all_writes_products_in_chunks():
+    products = []
+    for _ in range(3):
+        sku = make_test_sku()
+        batch, order_item = make_test_batch_and_order_item(sku, 20, 5)
+        product = make_test_product(sku, {batch}, {order_item})
+        product.allocate(order_item)
+        products.append(product)
+    sku_ids = [p.sku_id for p in products]
+
+    with UnitOfWork(session_factory) as uow:
+        uow.products.add_all(products, bulk=True, chunk_size=2)
+        messages = list(uow.collect_new_messages())
+        assert not uow.session.new
+
+    assert {m.sku_id for m in messages if isinstance(m, ProductCreated)} == set(sku_ids)
+    with UnitOfWork(session_factory) as uow:
+        for sku_id in sku_ids:
+            product = uow.products.get(sku_id)
+            (batch,) = product.batches
+            (order_item,) = product.order_items
+            assert batch.allocated_order_items == {order_item}
+            assert batch.available_quantity == 15
+
+
+def test_hydrate_product_from_snapshot_until_version_changes():
+    sku = make_test_sku()
+    batch, order_item = make_test_batch_and_order_item(sku, 20, 2)
+    product = make_test_product(sku, batches={batch}, order_items={order_item})
+    sku_id, order_item_id = sku.uuid, order_item.uuid
+    with session_factory() as session:
+        repositories.ProductsRepo(session, snapshots=True).add(product)
+        session.commit()
+
+    statements = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith("SELECT"):
+            statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", count)
+    try:
+        with session_factory() as session:
+            repo = repositories.ProductsRepo(session, snapshots=True)
+            product = repo.get(sku_id)
+            assert len(statements) == 1
+            order_item = next(o for o in product.order_items if o.uuid == order_item_id)
+            product.allocate(order_item)
+            session.commit()
+
+        with session_factory() as session:
+            statements.clear()
+            product = repositories.ProductsRepo(session, snapshots=True).get(sku_id)
+            assert len(statements) == 1
+            assert next(iter(product.batches)).available_quantity == 18
+            session.execute(
+                update(orm.products)
+                .where(orm.products.c._sku_id == sku_id)
+                .values(version_number=orm.products.c.version_number + 1)
+            )
+            session.commit()
+
+        with session_factory() as session:
+            statements.clear()
+            product = repositories.ProductsRepo(session, snapshots=True).get(sku_id)
+            assert len(statements) > 1
+            assert next(iter(product.batches)).available_quantity == 18
+    finally:
+        event.remove(engine, "before_cursor_execute", count)
+
+
+def test_rebuild_event_sourced_product_from_snapshot_and_tail():
+    sku = make_test_sku()
+    batch, order_item = make_test_batch_and_order_item(sku, 20, 2)
+    product = make_test_product(sku, batches={batch}, order_items={order_item})
+    sku_id, batch_id = sku.uuid, batch.uuid
+
+    with EventSourcedUnitOfWork() as uow:
+        uow.products.snapshot_interval = 4
+        uow.products.add(product)
+    for quantity in (3, 4):
+        with EventSourcedUnitOfWork() as uow:
+            uow.products.snapshot_interval = 4
+            product = uow.products.get(sku_id)
+            product.allocate(make_test_order_item(product.sku, quantity))
+
+    with EventSourcedUnitOfWork() as uow:
+        product = uow.products.get(sku_id)
+        (batch,) = product.batches
+        assert batch.available_quantity == 13
+        assert len(batch.allocated_order_items) == 2
+        assert uow.products.get_version(sku_id) == product.version_number == 4
+        history = uow.products.history(sku_id)
+        allocated = [e for e in history if isinstance(e, OrderItemAllocated)]
+        assert [e.batch_id for e in allocated] == [batch_id, batch_id]
+        snapshot = uow.session.execute(
+            select(orm.product_stream_snapshots.c.sequence).where(
+                orm.product_stream_snapshots.c.sku_id == sku_id
+            )
+        ).scalar()
+        # Creating the Product appends 3 events, every allocation 2 more.
+        assert snapshot == 5
+        assert (
+            uow.session.execute(
+                select(orm.products).where(orm.products.c._sku_id == sku_id)
+            ).first()
+            is None
+        )
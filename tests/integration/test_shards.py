@@ -0,0 +1,168 @@
+from uuid import uuid4
+
+import pytest
+import sqlalchemy
+from click.testing import CliRunner
+from sqlalchemy import func, select
+
+from allocation import messagebus, services
+from allocation.core.events import OrderItemAllocated
+from allocation.entrypoints.cli import cli
+from allocation.interfaces.database import db, orm, shards
+from allocation.interfaces.database.shards import HashRing, ShardedDatabase, reshard
+from allocation.interfaces.database.db import SessionFactory
+from allocation.unit_of_work import ShardedUnitOfWork, UnitOfWork
+from conftest import (
+    make_test_batch,
+    make_test_batch_and_order_item,
+    make_test_product,
+    make_test_sku,
+)
+
+
+@pytest.fixture
+def make_database(tmp_path):
+    databases = []
+
+    def make(*names):
+        database = ShardedDatabase(
+            {name: f"sqlite:///{tmp_path / name}.db" for name in names}
+        )
+        database.create_all()
+        databases.append(database)
+        return database
+
+    yield make
+    for database in databases:
+        database.dispose()
+
+
+def add_allocated_products(database: ShardedDatabase, count: int):
+    products = []
+    for _ in range(count):
+        sku = make_test_sku()
+        batch, order_item = make_test_batch_and_order_item(sku, 20, 2)
+        product = make_test_product(sku, {batch}, {order_item})
+        product.allocate(order_item)
+        products.append(product)
+    sku_ids = [p.sku_id for p in products]
+    with ShardedUnitOfWork(database) as uow:
+        uow.products.add_all(products)
+    return sku_ids
+
+
+def count_rows(database: ShardedDatabase, table):
+    counts = {}
+    for name, engine in database.engines.items():
+        with engine.connect() as connection:
+            counts[name] = connection.execute(
+                select(func.count()).select_from(table)
+            ).scalar()
+    return counts
+
+
+def test_adding_shard_only_moves_skus_to_it():
+    sku_ids = [uuid4() for _ in range(1000)]
+    before, after = HashRing(["a", "b"]), HashRing(["a", "b", "c"])
+
+    moved = [s for s in sku_ids if before.shard_for(s) != after.shard_for(s)]
+
+    assert {after.shard_for(s) for s in moved} == {"c"}
+    assert 200 < len(moved) < 500
+
+
+def test_route_products_to_shards_and_gather_listings(make_database):
+    database = make_database("a", "b", "c")
+    sku_ids = add_allocated_products(database, 30)
+
+    counts = count_rows(database, orm.products)
+    assert counts == {
+        name: len([s for s in sku_ids if database.ring.shard_for(s) == name])
+        for name in counts
+    }
+    with ShardedUnitOfWork(database) as uow:
+        product = uow.products.get(sku_ids[0])
+        (batch,) = product.batches
+        assert list(uow.sessions) == [database.ring.shard_for(sku_ids[0])]
+        assert uow.products.get_batch_owner(batch.uuid) == (sku_ids[0], 1)
+        assert [p.sku_id for p in uow.products.iter_products()] == sorted(sku_ids)
+        assert [s.uuid for s in uow.products.iter_skus(limit=5)] == sorted(sku_ids)[:5]
+        assert len(list(uow.products.get_all_batches())) == 30
+
+
+def test_reshard_products_to_new_shard(make_database):
+    source = make_database("a", "b")
+    sku_ids = add_allocated_products(source, 30)
+    target = make_database("a", "b", "c")
+
+    moved = reshard(source, target, chunk_size=4)
+
+    assert set(moved) <= {("a", "c"), ("b", "c")}
+    assert sum(moved.values()) == count_rows(target, orm.products)["c"] > 0
+    assert reshard(source, target) == {}
+    assert count_rows(target, orm.order_items_batches_association)["c"] == sum(
+        moved.values()
+    )
+    with ShardedUnitOfWork(target) as uow:
+        for sku_id in sku_ids:
+            (batch,) = uow.products.get(sku_id).batches
+            assert batch.allocated_quantity == 2
+
+
+def test_api_uses_shards_in_shards_setting(make_database, monkeypatch, client):
+    database = make_database("a", "b")
+    monkeypatch.setattr(shards, "sharded_database", database)
+    handlers = messagebus.EVENT_HANDLERS[OrderItemAllocated]
+    monkeypatch.setitem(
+        messagebus.EVENT_HANDLERS,
+        OrderItemAllocated,
+        [h for h in handlers if h is not services.publish_message_to_external_bus],
+    )
+    products = [
+        make_test_product(sku, {batch}, {order_item})
+        for sku in [make_test_sku() for _ in range(6)]
+        for batch, order_item in [make_test_batch_and_order_item(sku, 20, 2)]
+    ]
+    allocations = {p.sku_id: next(iter(p.order_items)).uuid for p in products}
+    with ShardedUnitOfWork(database) as uow:
+        uow.products.add_all(products)
+
+    for sku_id, order_item_id in allocations.items():
+        data = {"sku_id": str(sku_id), "order_item_id": str(order_item_id)}
+        assert client.post("/allocate", json=data).status_code == 302
+
+    for sku_id, order_item_id in allocations.items():
+        response = client.get(f"/order_item/allocations/{order_item_id}")
+        assert response.json[0]["sku_id"] == str(sku_id)
+        assert client.get(f"/product/{sku_id}").status_code == 200
+    rows = client.get("/stock").json
+    assert [r["sku_id"] for r in rows] == sorted(str(s) for s in allocations)
+    assert {r["allocated_quantity"] for r in rows} == {2}
+    assert sum(count_rows(database, orm.allocations_view).values()) == 6
+
+
+def test_reshard_main_database(make_database, monkeypatch, tmp_path):
+    engine = sqlalchemy.create_engine(f"sqlite:///{tmp_path / 'main'}.db")
+    orm.mapper_registry.metadata.create_all(engine)
+    monkeypatch.setattr(db, "engine", engine)
+    monkeypatch.setattr(shards, "sharded_database", None)
+    skus = [make_test_sku() for _ in range(10)]
+    products = [make_test_product(sku, {make_test_batch(sku)}) for sku in skus]
+    sku_ids = [p.sku_id for p in products]
+    with UnitOfWork(SessionFactory(engine)) as uow:
+        uow.products.add_all(products)
+    target = make_database("a", "b")
+    urls = ",".join(f"{name}={url}" for name, url in target.urls.items())
+
+    result = CliRunner().invoke(cli, ["reshard", "--to", urls])
+
+    assert result.exit_code == 0, result.output
+    assert "Moved" in result.output
+    assert sum(count_rows(target, orm.products).values()) == 10
+    with engine.connect() as connection:
+        assert (
+            connection.execute(select(func.count(orm.products.c._sku_id))).scalar() == 0
+        )
+    with ShardedUnitOfWork(target) as uow:
+        assert [p.sku_id for p in uow.products.iter_products()] == sorted(sku_ids)
+    engine.dispose()
@@ -0,0 +1,177 @@
+from datetime import date, timedelta
+
+from conftest import (
+    make_test_batch,
+    make_test_order_item,
+    make_test_product,
+    make_test_sku,
+    make_test_sku_product_and_batch,
+)
+from click.testing import CliRunner
+from flask.testing import FlaskClient
+from sqlalchemy import delete
+
+from allocation import messagebus, services, views
+from allocation.core import events
+from allocation.entrypoints.cli import cli
+from allocation.interfaces.database import orm
+from allocation.unit_of_work import UnitOfWork
+
+
+def make_test_product_with_stock():
+    today = date.today()
+    sku = make_test_sku()
+    in_stock = make_test_batch(sku, 20)
+    in_stock.eta = None
+    shipment = make_test_batch(sku, 30, eta=today + timedelta(days=5))
+    sold_out = make_test_batch(sku, 5, eta=today + timedelta(days=1))
+    discarded = make_test_batch(sku, 100, eta=today)
+    discarded.discarded = True
+    sold_out.allocate_available_quantity(make_test_order_item(sku, 5))
+    in_stock.allocate_available_quantity(make_test_order_item(sku, 2))
+    return make_test_product(sku, {in_stock, shipment, sold_out, discarded})
+
+
+def test_availability_sums_batches():
+    with UnitOfWork() as uow:
+        product = make_test_product_with_stock()
+        uow.products.add(product)
+        sku_id = product.sku.uuid
+
+    availability = views.availability(sku_id, UnitOfWork())
+    assert availability.batches == 3
+    assert availability.quantity == 55
+    assert availability.allocated_quantity == 7
+    assert availability.available_quantity == 48
+    assert availability.in_stock_quantity == 18
+    assert availability.earliest_eta == date.today() + timedelta(days=5)
+
+
+def test_availability_within_eta_range():
+    today = date.today()
+    with UnitOfWork() as uow:
+        product = make_test_product_with_stock()
+        uow.products.add(product)
+        sku_id = product.sku.uuid
+
+    availability = views.availability(
+        sku_id, UnitOfWork(), eta_from=today + timedelta(days=2)
+    )
+    assert (availability.batches, availability.quantity) == (1, 30)
+    assert availability.in_stock_quantity == 0
+    assert availability.earliest_eta == today + timedelta(days=5)
+
+
+def test_availability_of_product_without_batches():
+    with UnitOfWork() as uow:
+        product = make_test_product()
+        uow.products.add(product)
+        sku_id = product.sku.uuid
+
+    availability = views.availability(sku_id, UnitOfWork())
+    assert (availability.batches, availability.available_quantity) == (0, 0)
+    assert availability.earliest_eta is None
+    assert views.availability(make_test_sku().uuid, UnitOfWork()) is None
+
+
+def test_get_availability_and_stock(client: FlaskClient):
+    with UnitOfWork() as uow:
+        product = make_test_product_with_stock()
+        uow.products.add(product)
+        sku_id = str(product.sku.uuid)
+
+    response = client.get(f"/product/{sku_id}/availability")
+    assert response.json["sku_id"] == sku_id
+    assert response.json["quantity"] == 55
+
+    eta_to = str(date.today() + timedelta(days=1))
+    response = client.get(f"/product/{sku_id}/availability?eta_to={eta_to}")
+    assert response.json["available_quantity"] == 0
+
+    rows = client.get("/stock").json
+    assert [r["sku_id"] for r in rows] == sorted(r["sku_id"] for r in rows)
+    assert next(r for r in rows if r["sku_id"] == sku_id)["quantity"] == 55
+
+    assert (
+        client.get(f"/product/{make_test_sku().uuid}/availability").status_code == 404
+    )
+    assert client.get("/stock?eta_from=tomorrow").status_code == 400
+
+
+def allocate_test_order_item():
+    with UnitOfWork() as uow:
+        sku, product, batch = make_test_sku_product_and_batch()
+        order_item = make_test_order_item(sku, 2)
+        product.allocate(order_item)
+        uow.products.add(product)
+        event = next(
+            e for e in product.events if isinstance(e, events.OrderItemAllocated)
+        )
+        return product.sku.uuid, batch.uuid, order_item.uuid, event
+
+
+def test_allocations_view_follows_allocation_events():
+    sku_id, batch_id, order_item_id, event = allocate_test_order_item()
+    assert views.allocations(order_item_id, UnitOfWork()) == []
+
+    services.add_allocation_to_read_model(event, UnitOfWork())
+    services.add_allocation_to_read_model(event, UnitOfWork())
+    allocations = views.allocations(order_item_id, UnitOfWork())
+    assert [(a.batch_id, a.sku_id) for a in allocations] == [(batch_id, sku_id)]
+
+    services.remove_allocation_from_read_model(
+        events.OrderItemDeallocated(sku_id, order_item_id, 2, batch_id), UnitOfWork()
+    )
+    assert views.allocations(order_item_id, UnitOfWork()) == []
+
+
+def test_rebuild_and_check_allocations_view():
+    _, batch_id, order_item_id, _ = allocate_test_order_item()
+    missing = views.check_allocations(UnitOfWork())["missing"]
+    assert (order_item_id, batch_id) in [(r.order_item_id, r.batch_id) for r in missing]
+    assert CliRunner().invoke(cli, ["check-allocations-view"]).exit_code == 1
+
+    result = CliRunner().invoke(cli, ["rebuild-allocations-view"])
+    assert result.exit_code == 0
+    assert views.check_allocations(UnitOfWork()) == {"missing": [], "stale": []}
+
+    with UnitOfWork() as uow:
+        view = orm.allocations_view
+        uow.session.execute(delete(view).where(view.c.order_item_id == order_item_id))
+    result = CliRunner().invoke(cli, ["check-allocations-view", "--repair"])
+    assert result.exit_code == 0
+    assert "1 missing rows" in result.output
+    assert len(views.allocations(order_item_id, UnitOfWork())) == 1
+
+
+def test_get_allocations(client: FlaskClient):
+    sku_id, batch_id, order_item_id, event = allocate_test_order_item()
+    services.add_allocation_to_read_model(event, UnitOfWork())
+
+    response = client.get(f"/order_item/allocations/{order_item_id}")
+    assert response.json == [
+        {
+            "batch_id": str(batch_id),
+            "order_item_id": str(order_item_id),
+            "sku_id": str(sku_id),
+        }
+    ]
+
+
+def test_discard_product_removes_its_allocations(client: FlaskClient, monkeypatch):
+    sku_id, batch_id, order_item_id, event = allocate_test_order_item()
+    services.add_allocation_to_read_model(event, UnitOfWork())
+    handled = []
+
+    def record(event):
+        handled.append(event)
+
+    for event_type in (events.OrderItemDeallocated, events.OrderItemsDeallocated):
+        handlers = [*messagebus.EVENT_HANDLERS[event_type], record]
+        monkeypatch.setitem(messagebus.EVENT_HANDLERS, event_type, handlers)
+
+    response = client.delete("/product", json={"sku_id": str(sku_id)})
+    assert response.status_code == 200
+    assert views.allocations(order_item_id, UnitOfWork()) == []
+    (deallocated,) = handled
+    assert deallocated.allocations == [(order_item_id, 2, batch_id)]
@@ -0,0 +1,96 @@
+import redis
+from conftest import make_test_batch_and_order_item, make_test_product, make_test_sku
+
+from allocation.core import snapshots
+from allocation.interfaces.cache import ProductCache, ReadModelCache
+
+
+def test_cache_miss_on_unknown_key():
+    cache = ProductCache(2)
+    assert cache.get("a", 0) is None
+    assert cache.misses == 1
+
+
+def test_cache_miss_on_version_mismatch():
+    cache = ProductCache(2)
+    cache.put("a", 1, {})
+    assert cache.get("a", 2) is None
+    assert cache.get("a", 1) == {}
+    assert cache.stats()["hits"] == 1
+
+
+def test_evict_least_recently_used_entry():
+    cache = ProductCache(2)
+    cache.put("a", 0, {})
+    cache.put("b", 0, {})
+    cache.get("a", 0)
+    cache.put("c", 0, {})
+    assert "a" in cache and "c" in cache
+    assert "b" not in cache
+    assert cache.evictions == 1
+
+
+def test_invalidate_entry():
+    cache = ProductCache(2)
+    cache.put("a", 0, {})
+    cache.invalidate("a")
+    cache.invalidate("a")
+    assert len(cache) == 0
+    assert cache.invalidations == 1
+
+
+def test_disabled_cache_does_not_store_entries():
+    cache = ProductCache(0)
+    cache.put("a", 0, {})
+    assert len(cache) == 0
+
+
+def test_product_snapshot_round_trip():
+    sku = make_test_sku()
+    batch, order_item = make_test_batch_and_order_item(sku, 20, 2)
+    product = make_test_product(sku, batches={batch})
+    product.allocate(order_item)
+
+    restored = snapshots.load(snapshots.dump(product))
+    [restored_batch] = restored.batches
+    [restored_order_item] = restored.order_items
+    assert restored.sku == product.sku
+    assert restored.version_number == product.version_number
+    assert restored.events == []
+    assert restored_batch.available_quantity == 18
+    assert restored_batch.allocated_order_items == {restored_order_item}
+
+
+def test_read_model_cache_without_client_calls_loader():
+    cache = ReadModelCache(None)
+    assert cache.get_or_load("key", 0, lambda: {"a": 1}) == {"a": 1}
+    assert cache.stats()["enabled"] is False
+
+
+class FailingWriteClient:
+    """Redis client whose reads miss and whose writes fail."""
+
+    def register_script(self, script):
+        return lambda keys, args: 1
+
+    def get(self, key):
+        return None
+
+    def set(self, key, value, **kwargs):
+        return True
+
+    def pipeline(self):
+        raise redis.ConnectionError("Redis is unavailable.")
+
+
+def test_read_model_cache_loads_once_when_write_fails():
+    cache = ReadModelCache(FailingWriteClient())
+    loads = []
+
+    def loader():
+        loads.append(1)
+        return {"a": 1}
+
+    assert cache.get_or_load("key", 0, loader) == {"a": 1}
+    assert len(loads) == 1
+    assert cache.stats()["errors"] == 1
@@ -1,9 +1,11 @@
 import datetime
 
 import pytest
+from sqlalchemy import select
 
 from allocation.repositories import InvalidSKU
 from conftest import (
+    make_test_batch,
     make_test_order_item,
     make_test_product,
     make_test_sku,
@@ -14,6 +16,7 @@ from conftest import (
 from allocation import services
 from allocation.core import commands, domain, events
 from allocation.core.commands import Allocate, CreateOrderItem, CreateProductCommand
+from allocation.interfaces.database import orm
 from allocation.interfaces.database.db import session_factory
 from allocation.unit_of_work import UnitOfWork
 
@@ -136,6 +139,56 @@ def test_create_batch_command():
         assert created_batch
 
 
+def test_create_batches_per_sku_in_request_order():
+    with UnitOfWork() as uow:
+        products = [make_test_product(), make_test_product()]
+        uow.products.add_all(products)
+        sku_ids = [p.sku.uuid for p in products]
+
+    today = datetime.date.today()
+    cmds = [
+        commands.CreateBatch(sku_ids[0], 10, today),
+        commands.CreateBatch(sku_ids[1], 20, today),
+        commands.CreateBatch(make_test_sku().uuid, 30, today),
+        commands.CreateBatch(sku_ids[0], 40, today),
+    ]
+    batch_ids = services.create_batches(cmds, UnitOfWork(), chunk_size=1)
+
+    assert isinstance(batch_ids[2], InvalidSKU)
+    with UnitOfWork() as uow:
+        for cmd, batch_id in zip(cmds, batch_ids):
+            if not isinstance(batch_id, Exception):
+                product = uow.products.get(cmd.sku_id)
+                batch = next(b for b in product.batches if b.uuid == batch_id)
+                assert batch.quantity == cmd.quantity
+        assert uow.products.get(sku_ids[0]).version_number == 2
+
+
+def test_failed_chunk_is_rolled_back_and_reported(monkeypatch):
+    with UnitOfWork() as uow:
+        products = [make_test_product() for _ in range(3)]
+        uow.products.add_all(products)
+        sku_ids = [p.sku.uuid for p in products]
+
+    register_batch = domain.Product.register_batch
+
+    def failing_register_batch(product, batch):
+        if product.sku.uuid == sku_ids[1]:
+            raise ValueError("Cannot register the batch.")
+        register_batch(product, batch)
+
+    monkeypatch.setattr(domain.Product, "register_batch", failing_register_batch)
+    today = datetime.date.today()
+    cmds = [commands.CreateBatch(sku_id, 10, today) for sku_id in sku_ids]
+    batch_ids = services.create_batches(cmds, UnitOfWork(), chunk_size=2)
+
+    assert all(isinstance(b, ValueError) for b in batch_ids[:2])
+    with UnitOfWork() as uow:
+        assert [len(uow.products.get(s).batches) for s in sku_ids] == [0, 0, 1]
+        [batch] = uow.products.get(sku_ids[2]).batches
+        assert batch.uuid == batch_ids[2]
+
+
 def test_change_batch_command():
     with UnitOfWork() as uow:
         sku, product, batch = make_test_sku_product_and_batch()
@@ -198,3 +251,104 @@ def test_allocate_handler():
     services.allocate(Allocate(sku_id=sku_id, order_item_id=order_item_id), uow)
     [event] = list(uow.collect_new_messages())
     assert isinstance(event, events.OrderItemAllocated)
+
+
+def test_allocate_fast_picks_earliest_batch_with_enough_stock():
+    today = datetime.date.today()
+    with UnitOfWork(session_factory) as uow:
+        sku = make_test_sku()
+        later = make_test_batch(sku, 20, eta=today + datetime.timedelta(days=2))
+        earlier = make_test_batch(sku, 5, eta=today + datetime.timedelta(days=1))
+        order_item = make_test_order_item(sku, 10)
+        product = make_test_product(sku, {later, earlier}, {order_item})
+        uow.products.add(product)
+        sku_id, order_item_id, later_id = sku.uuid, order_item.uuid, later.uuid
+        version = product.version_number
+
+    uow = UnitOfWork(session_factory)
+    batch_id = services.allocate_fast(Allocate(sku_id, order_item_id), uow)
+    [event] = list(uow.collect_new_messages())
+    assert batch_id == later_id
+    assert (event.order_item_id, event.batch_id) == (order_item_id, later_id)
+
+    with UnitOfWork(session_factory) as uow:
+        product = uow.products.get(sku_id)
+        batch = next(b for b in product.batches if b.uuid == batch_id)
+        assert batch.available_quantity == 10
+        assert [oi.uuid for oi in batch.allocated_order_items] == [order_item_id]
+        assert product.version_number == version + 1
+
+
+def test_allocate_fast_falls_back_to_aggregate_on_miss():
+    with UnitOfWork(session_factory) as uow:
+        sku, product, _ = make_test_sku_product_and_batch()
+        order_item = make_test_order_item(sku, 30)
+        product.register_order_item(order_item)
+        uow.products.add(product)
+        sku_id, order_item_id = sku.uuid, order_item.uuid
+
+    uow = UnitOfWork(session_factory)
+    assert services.allocate_fast(Allocate(sku_id, order_item_id), uow) is None
+    messages = list(uow.collect_new_messages())
+    assert any(isinstance(m, events.OutOfStock) for m in messages)
+
+
+def make_product_with_allocations():
+    sku = make_test_sku()
+    batches = make_test_batch(sku, 10), make_test_batch(sku, 10)
+    order_items = [make_test_order_item(sku, 2) for _ in range(4)]
+    for batch, order_item in zip(batches * 2, order_items):
+        batch.allocate_available_quantity(order_item)
+    with UnitOfWork(session_factory) as uow:
+        uow.products.add(make_test_product(sku, set(batches), set(order_items)))
+        allocations = {
+            (order_item.uuid, batch.uuid)
+            for batch in batches
+            for order_item in batch.allocated_order_items
+        }
+        return sku.uuid, [b.uuid for b in batches], allocations
+
+
+def get_batches(sku_id):
+    with UnitOfWork(session_factory) as uow:
+        stmt = (
+            select(domain.Batch)
+            .where(orm.batches.c._product_id == sku_id)
+            .execution_options(include_discarded=True)
+        )
+        return {
+            b.uuid: (b.discarded, b.allocated_quantity, len(b.allocated_order_items))
+            for b in uow.session.execute(stmt).scalars()
+        }
+
+
+def test_discard_batch_deallocates_its_order_items_in_bulk():
+    sku_id, (discarded_id, kept_id), allocations = make_product_with_allocations()
+
+    uow = UnitOfWork(session_factory)
+    services.discard_batch(commands.DiscardBatch(sku_id, discarded_id), uow)
+
+    (deallocated,) = [
+        e
+        for e in uow.collect_new_messages()
+        if isinstance(e, events.OrderItemsDeallocated)
+    ]
+    assert {(o, b) for o, _, b in deallocated.allocations} == {
+        a for a in allocations if a[1] == discarded_id
+    }
+    assert get_batches(sku_id) == {discarded_id: (True, 0, 0), kept_id: (False, 4, 2)}
+
+
+def test_discard_product_discards_its_batches_in_bulk():
+    sku_id, batch_ids, allocations = make_product_with_allocations()
+
+    uow = UnitOfWork(session_factory)
+    services.discard_product(commands.DiscardProduct(sku_id), uow)
+
+    (deallocated,) = list(uow.collect_new_messages())
+    assert isinstance(deallocated, events.OrderItemsDeallocated)
+    assert {(o, b) for o, _, b in deallocated.allocations} == allocations
+    assert get_batches(sku_id) == {batch_id: (True, 0, 0) for batch_id in batch_ids}
+    with pytest.raises(InvalidSKU):
+        with UnitOfWork(session_factory) as uow:
+            uow.products.get(sku_id)
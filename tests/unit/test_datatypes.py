@@ -0,0 +1,42 @@
+import unittest
+from uuid import UUID, uuid4
+
+from sqlalchemy import Column, MetaData, Table, create_engine, select
+
+from allocation.interfaces.database.datatypes import GUID
+
+
+class TestGUID(unittest.TestCase):
+    def round_trip(self, binary: bool):
+        engine = create_engine("sqlite://")
+        table = Table("guids", MetaData(), Column("uuid", GUID(binary=binary)))
+        table.metadata.create_all(engine)
+        values = [uuid4(), uuid4()]
+        with engine.begin() as connection:
+            connection.execute(
+                table.insert(), [{"uuid": values[0]}, {"uuid": str(values[1])}]
+            )
+            stored = connection.exec_driver_sql("SELECT uuid FROM guids").scalars()
+            loaded = connection.execute(select(table.c.uuid)).scalars()
+            return values, list(stored), list(loaded)
+
+    def test_store_uuids_as_bytes(self):
+        values, stored, loaded = self.round_trip(binary=True)
+        self.assertEqual(stored, [v.bytes for v in values])
+        self.assertEqual(loaded, values)
+
+    def test_store_uuids_as_hex(self):
+        values, stored, loaded = self.round_trip(binary=False)
+        self.assertEqual(stored, [v.hex for v in values])
+        self.assertEqual(loaded, values)
+
+    def test_loaded_uuids_behave_like_parsed_uuids(self):
+        value = uuid4()
+        guid = GUID(binary=True)
+        for stored in (value.bytes, value.hex, str(value)):
+            loaded = guid.process_result_value(stored, None)
+            self.assertIsInstance(loaded, UUID)
+            self.assertEqual(loaded, value)
+            self.assertEqual(hash(loaded), hash(value))
+            self.assertEqual(str(loaded), str(value))
+            self.assertEqual(loaded.version, 4)
@@ -23,7 +23,11 @@ from allocation.core.domain import (
     OrderItem,
     Product,
 )
-from allocation.core.events import OutOfStock
+from allocation.core.events import (
+    OrderItemAllocated,
+    OrderItemsDeallocated,
+    OutOfStock,
+)
 
 
 class TestSKU:
@@ -161,3 +165,43 @@ class TestProduct:
         product.register_order_item(order_item)
         product.deregister_order_item(order_item)
         assert order_item.discarded is True
+
+    def test_allocation_events_reference_the_batch(self):
+        sku, product, batch = make_test_sku_product_and_batch()
+        order_item = make_test_order_item(sku, 2)
+        product.allocate(order_item)
+        allocated = product.events.pop()
+        assert isinstance(allocated, OrderItemAllocated)
+        assert allocated.batch_id == batch.uuid
+
+        product.deregister_batch(batch)
+        deallocated = product.events.pop()
+        assert isinstance(deallocated, OrderItemsDeallocated)
+        assert deallocated.allocations == [(order_item.uuid, 2, batch.uuid)]
+
+    def test_discard_product_discards_its_batches(self):
+        sku, product, batch = make_test_sku_product_and_batch()
+        order_item = make_test_order_item(sku, 2)
+        product.allocate(order_item)
+        product.discard()
+        assert product.discarded and batch.discarded
+        assert batch.allocated_quantity == 0 and not batch.allocated_order_items
+        assert isinstance(product.events.pop(), OrderItemsDeallocated)
+
+    def test_discard_product_records_one_event_for_all_allocations(self):
+        sku = make_test_sku()
+        batches = [make_test_batch(sku, 20) for _ in range(3)]
+        order_items = [make_test_order_item(sku, 15) for _ in range(3)]
+        product = make_test_product(sku, set(batches), set(order_items))
+        allocations = {
+            (order_item.uuid, 15, product.allocate(order_item).uuid)
+            for order_item in order_items
+        }
+        product.events.clear()
+
+        product.discard()
+
+        (deallocated,) = product.events
+        assert isinstance(deallocated, OrderItemsDeallocated)
+        assert set(deallocated.allocations) == allocations
+        assert len(deallocated.allocations) == 3
@@ -3,12 +3,18 @@ import json
 import unittest
 from uuid import UUID, uuid4
 
+import orjson
+from marshmallow import ValidationError
+
+from allocation.core import commands
 from allocation.entrypoints import serializers
+from allocation.entrypoints.app import ORJSON_OPTIONS
 from allocation.entrypoints.serializers import (
     Batch,
     CustomerSchema,
     OrderItem,
     OrderSchema,
+    Product,
     SKU,
 )
 from conftest import (
@@ -17,6 +23,7 @@ from conftest import (
     make_test_customer,
     make_test_order,
     make_test_order_item,
+    make_test_product,
     make_test_sku,
 )
 
@@ -104,3 +111,83 @@ class TestSerializers(unittest.TestCase):
         assert isinstance(create_batch["sku_id"], UUID)
         assert isinstance(create_batch["quantity"], int)
         assert isinstance(create_batch["eta"], datetime.date)
+
+
+class TestCompiledSerializers(unittest.TestCase):
+    def setUp(self):
+        self.sku = make_test_sku()
+        self.batch, self.order_item = make_test_batch_and_order_item(self.sku, 20, 2)
+        undated_batch = make_test_batch(self.sku)
+        undated_batch.eta = None
+        self.product = make_test_product(self.sku, {self.batch, undated_batch})
+        self.product.allocate(self.order_item)
+
+    def test_compiled_sku_matches_schema(self):
+        self.assertEqual(serializers.dump_sku(self.sku), SKU().dump(self.sku))
+
+    def test_compiled_order_item_matches_schema(self):
+        self.assertEqual(
+            serializers.dump_order_item(self.order_item),
+            OrderItem().dump(self.order_item),
+        )
+
+    def test_compiled_batch_matches_schema(self):
+        self.batch.eta = datetime.datetime.now()
+        self.assertEqual(serializers.dump_batch(self.batch), Batch().dump(self.batch))
+
+    def test_compiled_product_matches_schema(self):
+        data = serializers.dump_products([self.product])
+        self.assertEqual(data, Product(many=True).dump([self.product]))
+        self.assertEqual(len(data[0]["batches"]), 2)
+
+    def test_compiled_dump_falls_back_on_missing_attributes(self):
+        sku = {"uuid": self.sku.uuid, "name": self.sku.name}
+        self.assertEqual(serializers.dump_sku(sku), SKU().dump(sku))
+
+    def test_orjson_output_matches_json_output(self):
+        data = serializers.dump_product(self.product)
+        expected = json.dumps(data, sort_keys=True, separators=(",", ":")) + "\n"
+        self.assertEqual(orjson.dumps(data, option=ORJSON_OPTIONS), expected.encode())
+
+
+class TestDecode(unittest.TestCase):
+    def test_decode_command(self):
+        sku_id, order_item_id = uuid4(), uuid4()
+        data = {"sku_id": str(sku_id), "order_item_id": str(order_item_id)}
+        cmd = serializers.decode(serializers.Allocate, data, commands.Allocate)
+        self.assertEqual((cmd.sku_id, cmd.order_item_id), (sku_id, order_item_id))
+
+    def test_decode_matches_schema_load(self):
+        for data in (
+            {"sku_id": str(uuid4()), "quantity": 20, "eta": "2022-02-01"},
+            {"sku_id": str(uuid4()), "quantity": "20", "eta": "2022-2-1"},
+        ):
+            self.assertEqual(
+                serializers.decode(serializers.CreateBatch, data),
+                serializers.CreateBatch().load(data),
+            )
+
+    def test_decode_raises_schema_validation_errors(self):
+        data = {"sku_id": "abc", "quantity": "many", "unknown": 1}
+        with self.assertRaises(ValidationError) as expected:
+            serializers.CreateBatch().load(data)
+        with self.assertRaises(ValidationError) as decoded:
+            serializers.decode(serializers.CreateBatch, data, commands.CreateBatch)
+        self.assertEqual(decoded.exception.messages, expected.exception.messages)
+
+    def test_decode_batched_commands(self):
+        data = [{"sku_id": str(uuid4()), "quantity": q} for q in (1, 2)]
+        cmds = serializers.decode(
+            serializers.CreateOrderItem, data, commands.CreateOrderItem, many=True
+        )
+        self.assertEqual([cmd.quantity for cmd in cmds], [1, 2])
+
+    def test_decode_batched_errors_by_index(self):
+        data = [{"sku_id": str(uuid4()), "quantity": 1}, {"sku_id": "abc"}]
+        with self.assertRaises(ValidationError) as decoded:
+            serializers.decode(serializers.CreateOrderItem, data, many=True)
+        self.assertEqual(list(decoded.exception.messages), [1])
+
+    def test_decode_rejects_list_for_single_object(self):
+        with self.assertRaises(ValidationError):
+            serializers.decode(serializers.CreateOrderItem, [], many=False)
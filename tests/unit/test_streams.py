@@ -0,0 +1,63 @@
+from conftest import (
+    make_test_batch,
+    make_test_order_item,
+    make_test_product,
+    make_test_sku,
+)
+
+from allocation.core import snapshots, streams
+from allocation.core.events import (
+    BatchDiscarded,
+    BatchQuantityChanged,
+    Event,
+    OrderItemDeallocated,
+    ProductRenamed,
+)
+
+
+def make_allocated_product():
+    sku = make_test_sku()
+    batches = {make_test_batch(sku, 10), make_test_batch(sku, 10, eta=None)}
+    order_items = {make_test_order_item(sku, 4) for _ in range(4)}
+    product = make_test_product(sku, batches, order_items)
+    for order_item in list(order_items):
+        product.allocate(order_item)
+    return product
+
+
+def test_replay_changes_of_new_product():
+    product = make_allocated_product()
+    snapshot = snapshots.dump(product)
+
+    events = streams.changes(None, snapshot)
+
+    assert streams.same(streams.replay(None, events, product.version_number), snapshot)
+
+
+def test_replay_changes_between_snapshots():
+    product = make_allocated_product()
+    before = snapshots.dump(product)
+    batch = next(b for b in product.batches if b.allocated_order_items)
+    product.change_batch_quantity(batch.uuid, 0)
+    product.deregister_order_item(next(iter(product.order_items)))
+    product.rename("Renamed")
+    product.register_batch(make_test_batch(product.sku, 5))
+    after = snapshots.dump(product)
+
+    events = streams.changes(before, after)
+
+    assert streams.same(streams.replay(before, events, product.version_number), after)
+    assert {ProductRenamed, BatchQuantityChanged, OrderItemDeallocated} <= {
+        type(e) for e in events
+    }
+
+    product.discard()
+    events = streams.changes(after, snapshots.dump(product))
+    assert len([e for e in events if isinstance(e, BatchDiscarded)]) == 3
+    assert streams.replay(after, events)["discarded"] is True
+
+
+def test_events_round_trip_through_dicts():
+    events = streams.changes(None, snapshots.dump(make_allocated_product()))
+
+    assert [Event.from_dict(e.to_dict()) for e in events] == events